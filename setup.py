@@ -46,6 +46,7 @@ setup(
         ],
         'calmjs.runtime': [
             'npm = calmjs.npm:npm.runtime',
+            'registry = calmjs.registry:runtime',
         ],
         'distutils.commands': [
             'npm = calmjs.npm:npm',
@@ -57,6 +58,7 @@ setup(
         'egg_info.writers': [
             'package.json = calmjs.npm:write_package_json',
             'extras_calmjs.json = calmjs.dist:write_extras_calmjs',
+            'calmjs_module_files.json = calmjs.dist:write_module_files',
         ],
         'calmjs.extras_keys': [
             'node_modules = enabled',
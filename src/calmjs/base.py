@@ -10,18 +10,48 @@ from __future__ import absolute_import
 import os
 
 import errno
-import json
+import sys
 from os import getcwd
+from os.path import abspath
 from os.path import dirname
 from os.path import isdir
 from os.path import join
+from os.path import normcase
 from os.path import pathsep
 from os.path import realpath
+from os.path import sep
 
 from collections import OrderedDict
+from collections import namedtuple
+try:
+    from collections.abc import ItemsView
+    from collections.abc import MutableMapping
+except ImportError:  # pragma: no cover
+    from collections import ItemsView
+    from collections import MutableMapping
 from logging import getLogger
+from threading import Event
+from threading import Lock
+from threading import RLock
+from threading import Thread
+try:
+    from sys import intern
+except ImportError:  # pragma: no cover
+    pass  # a builtin for Python 2
+from weakref import WeakKeyDictionary
+from weakref import WeakSet
+from pkg_resources import WorkingSet
 from pkg_resources import working_set
 
+from calmjs import jsonio
+from calmjs.cache import DigestIndex
+from calmjs.cache import check_stamps
+from calmjs.cache import get_records_map_dirs
+from calmjs.cache import get_registry_index_cache
+from calmjs.cache import stamp_dirs
+from calmjs.indexer import record_walked_dirs
+from calmjs.trie import NameTrie
+from calmjs.utils import concurrent_map
 from calmjs.utils import which
 from calmjs.utils import finalize_env
 from calmjs.utils import fork_exec
@@ -32,6 +62,222 @@ NODE = 'node'
 
 logger = getLogger(__name__)
 _marker = object()
+# shared by the views of records that do not exist; it must never be
+# modified.
+_empty = {}
+
+if sys.version_info < (3,):  # pragma: no cover
+    _str_types = (basestring,)  # noqa: F821
+else:  # pragma: no cover
+    _str_types = (str,)
+
+# Describes the changes to the records of a module within a registry;
+# added, removed and modified are sorted lists of the affected keys.
+RecordsChange = namedtuple('RecordsChange', [
+    'module_name', 'added', 'removed', 'modified'])
+
+# Describes the owner of a source file within a registry; the name of
+# the record key, the name of the module (the key to the records) and
+# the name of the project that provided it.
+SourceOwner = namedtuple('SourceOwner', [
+    'module_name', 'python_module_name', 'project_name'])
+
+
+class PathTable(object):
+    """
+    A table of the unique directories for the paths stored within the
+    CompactRecords that share this table.
+    """
+
+    __slots__ = ('_ids', 'dirs')
+
+    def __init__(self):
+        self._ids = {}
+        self.dirs = []
+
+    def __len__(self):
+        return len(self.dirs)
+
+    def add(self, path):
+        """
+        Add the directory of the path to the table, and return a 2-tuple
+        of the id for that directory and the remaining part of the path.
+        The remaining part is interned, such that the same file names
+        are only stored once.
+        """
+
+        idx = max(path.rfind(sep), path.rfind('/')) + 1
+        base = path[:idx]
+        base_id = self._ids.get(base)
+        if base_id is None:
+            base_id = self._ids[base] = len(self.dirs)
+            self.dirs.append(base)
+        rest = path[idx:]
+        return base_id, intern(rest) if isinstance(rest, str) else rest
+
+    def find(self, path):
+        """
+        Return the 2-tuple as produced by add for the path, or None if
+        the directory of the path is not in the table.
+        """
+
+        idx = max(path.rfind(sep), path.rfind('/')) + 1
+        base_id = self._ids.get(path[:idx])
+        if base_id is None:
+            return None
+        return base_id, path[idx:]
+
+
+class CompactItemsView(ItemsView):
+    """
+    The items of CompactRecords, produced without the lookup of every
+    key.
+    """
+
+    def __iter__(self):
+        records = self._mapping
+        for pos in range(0, len(records._items), 3):
+            yield records._items[pos], records._get(pos)
+
+
+class CompactRecords(MutableMapping):
+    """
+    A mapping for the records of a module, with the directory of each
+    of the path values stored only once in a PathTable shared by the
+    records of all modules in a registry.  The full paths are only
+    produced when accessed.  Values that are not paths are stored as
+    they are.
+
+    As modules typically only provide a handful of records, they are
+    stored as a flat tuple rather than in a dict, such that the records
+    for each module cost as little as possible; keys are looked up by a
+    linear scan and modifications rebuild the tuple.
+    """
+
+    __slots__ = ('_table', '_items')
+
+    def __init__(self, table, records=()):
+        self._table = table
+        items = []
+        for key, value in dict(records).items():
+            items.append(key)
+            items.extend(self._pack(value))
+        # the key, the dir id and the remainder of the path for each of
+        # the records, with a dir id of None for values that are not
+        # paths.
+        self._items = tuple(items)
+
+    def _pack(self, value):
+        if isinstance(value, _str_types):
+            return self._table.add(value)
+        return None, value
+
+    def _find(self, key):
+        """
+        Return the position of the key within the items, or -1.
+        """
+
+        items = self._items
+        pos = 0
+        while True:
+            try:
+                pos = items.index(key, pos)
+            except ValueError:
+                return -1
+            # skip over any values that may be equal to the key.
+            if pos % 3 == 0:
+                return pos
+            pos += 1
+
+    def _position(self, key):
+        pos = self._find(key)
+        if pos < 0:
+            raise KeyError(key)
+        return pos
+
+    def _get(self, pos):
+        dir_id, value = self._items[pos + 1:pos + 3]
+        if dir_id is None:
+            return value
+        return self._table.dirs[dir_id] + value
+
+    def __getitem__(self, key):
+        return self._get(self._position(key))
+
+    def __setitem__(self, key, value):
+        item = (key,) + tuple(self._pack(value))
+        pos = self._find(key)
+        if pos < 0:
+            self._items += item
+        else:
+            self._items = self._items[:pos] + item + self._items[pos + 3:]
+
+    def __delitem__(self, key):
+        pos = self._position(key)
+        self._items = self._items[:pos] + self._items[pos + 3:]
+
+    def __contains__(self, key):
+        return self._find(key) >= 0
+
+    def __iter__(self):
+        return iter(self._items[::3])
+
+    def __len__(self):
+        return len(self._items) // 3
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def items(self):
+        return CompactItemsView(self)
+
+    def clear(self):
+        self._items = ()
+
+
+class RecordView(MutableMapping):
+    """
+    A view of the records of a module held by a registry.  The records
+    are only copied when the view is modified, such that the records
+    held by the registry will never be modified through the view.
+    """
+
+    __slots__ = ('_records', '_copied')
+
+    def __init__(self, records):
+        self._records = records
+        self._copied = False
+
+    def _writable(self):
+        if not self._copied:
+            self._records = dict(self._records)
+            self._copied = True
+        return self._records
+
+    def __getitem__(self, key):
+        return self._records[key]
+
+    def __setitem__(self, key, value):
+        self._writable()[key] = value
+
+    def __delitem__(self, key):
+        del self._writable()[key]
+
+    def __contains__(self, key):
+        return key in self._records
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def __len__(self):
+        return len(self._records)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def clear(self):
+        self._records = {}
+        self._copied = True
 
 
 def _check_isdir_assign_key(d, key, value, error_msg=None):
@@ -64,6 +310,87 @@ def _get_exec_binary(binary, kw):
     return binary
 
 
+def _norm_source_path(path):
+    return normcase(abspath(path))
+
+
+class EntryPointIndex(object):
+    """
+    An index of all entry points provided by the distributions within a
+    working set, grouped by the name of the entry point group.
+
+    The index is built in a single pass on first access, such that the
+    entry point metadata of every distribution is only parsed once no
+    matter how many registries are constructed.  The index is discarded
+    whenever a distribution is added to the working set, to be rebuilt
+    again on next access, and the registries subscribed to the index
+    will be notified of the new distribution.
+    """
+
+    def __init__(self, working_set):
+        # the working set is not referenced by the index, as the index
+        # is kept alive by the working set through the subscription.
+        self._groups = None
+        self._lock = Lock()
+        self.registries = WeakSet()
+        working_set.subscribe(self._add_dist, existing=False)
+
+    def _add_dist(self, dist):
+        self._groups = None
+        for registry in list(self.registries):
+            try:
+                registry._add_dist(dist)
+            except Exception:
+                logger.exception(
+                    "registry '%s' failed to register entry points from the "
+                    "newly added distribution '%s'",
+                    registry.registry_name, dist,
+                )
+
+    def _build(self, working_set):
+        groups = OrderedDict()
+        for dist in working_set:
+            for group, entry_map in dist.get_entry_map().items():
+                groups.setdefault(group, []).extend(entry_map.values())
+        return groups
+
+    def iter_entry_points(self, working_set, group):
+        groups = self._groups
+        if groups is None:
+            with self._lock:
+                groups = self._groups
+                if groups is None:
+                    groups = self._groups = self._build(working_set)
+        return iter(groups.get(group, ()))
+
+
+_entry_point_indexes = WeakKeyDictionary()
+_entry_point_indexes_lock = Lock()
+
+
+def _get_entry_point_index(working_set):
+    with _entry_point_indexes_lock:
+        index = _entry_point_indexes.get(working_set)
+        if index is None:
+            index = _entry_point_indexes[working_set] = EntryPointIndex(
+                working_set)
+    return index
+
+
+def iter_entry_points(group, working_set=working_set):
+    """
+    Iterate through the entry points of the group from the working set,
+    in the same order as ``working_set.iter_entry_points``.  For actual
+    instances of ``pkg_resources.WorkingSet``, the shared index for that
+    working set will be used.
+    """
+
+    if not isinstance(working_set, WorkingSet):
+        return working_set.iter_entry_points(group)
+    return _get_entry_point_index(working_set).iter_entry_points(
+        working_set, group)
+
+
 class BaseRegistry(object):
     """
     A base registry implementation that make use of ``pkg_resources``
@@ -83,14 +410,64 @@ class BaseRegistry(object):
         self.registry_name = registry_name
         _working_set = kw.pop('_working_set', working_set)
         self.raw_entry_points = [] if _working_set is None else list(
-            _working_set.iter_entry_points(self.registry_name))
+            iter_entry_points(self.registry_name, _working_set))
         self._init(*a, **kw)
+        if isinstance(_working_set, WorkingSet):
+            # be notified of distributions added to the working set.
+            _get_entry_point_index(_working_set).registries.add(self)
 
     def _init(self, *a, **kw):
         """
         Subclasses can override this for setting up its single instance.
         """
 
+    def _add_dist(self, dist):
+        """
+        Private method that will be called with the distribution that
+        was added to the working set for this registry.  Entry points
+        from the distribution that was replaced by it will be removed,
+        before the entry points from it are added.
+        """
+
+        removed = [
+            entry_point for entry_point in self.raw_entry_points
+            if entry_point.dist is not None and
+            entry_point.dist is not dist and entry_point.dist.key == dist.key
+        ]
+        if removed:
+            logger.debug(
+                "removing entry points for '%s' from registry '%s'",
+                removed[0].dist, self.registry_name,
+            )
+            self._remove_entry_points(removed)
+
+        added = list(dist.get_entry_map(self.registry_name).values())
+        if added:
+            logger.debug(
+                "adding entry points for '%s' to registry '%s'",
+                dist, self.registry_name,
+            )
+            self.raw_entry_points.extend(added)
+            self._add_entry_points(added)
+
+    def _add_entry_points(self, entry_points):
+        """
+        Subclasses can override this to make use of the entry points
+        that got added to raw_entry_points.
+        """
+
+    def _remove_entry_points(self, entry_points):
+        """
+        Remove the entry points from raw_entry_points; subclasses can
+        extend this to remove what was derived from them.
+        """
+
+        removed = set(id(entry_point) for entry_point in entry_points)
+        self.raw_entry_points = [
+            entry_point for entry_point in self.raw_entry_points
+            if id(entry_point) not in removed
+        ]
+
     def get_record(self, name):
         raise NotImplementedError
 
@@ -108,15 +485,288 @@ class BaseModuleRegistry(BaseRegistry):
     """
 
     def __init__(self, registry_name, *a, **kw):
+        """
+        Optional Keyword Arguments:
+
+        lazy
+            If True, the modules of the entry points will not be mapped
+            during construction; this will instead be done on demand
+            when the records for a module or a package are requested.
+            This assumes that the records produced for an entry point
+            are keyed by its module name.  Defaults to False.
+        workers
+            The number of threads to use for importing and mapping the
+            modules of the entry points.  Defaults to None, which will
+            do everything in the current thread.
+        compact
+            If True, the records for each module will be stored as
+            CompactRecords, sharing a single PathTable for the
+            directories of all the paths within this registry.  Defaults
+            to False.
+        index_cache
+            The persistent index cache to consult for records before
+            the modules of the entry points are mapped.  Defaults to
+            the one provided by ``calmjs.cache.get_registry_index_cache``
+            which is only available if persistent caching is enabled.
+            Specify None to disable.
+        artifact
+            The artifact produced by dump_artifact from a prior instance
+            of this registry, to be used in place of mapping the modules
+            of the entry points.  It will be ignored if the entry points
+            or the directories they index no longer match.
+
+        Other arguments pass up to parent; please refer to its
+        definitions.
+        """
+
+        index_cache = kw.pop('index_cache', NotImplemented)
+        artifact = kw.pop('artifact', None)
+        self.lazy = kw.pop('lazy', False)
+        self.workers = kw.pop('workers', None)
+        self.compact = kw.pop('compact', False)
+        self.path_table = PathTable() if self.compact else None
         super(BaseModuleRegistry, self).__init__(registry_name, *a, **kw)
         self.package_module_map = {}
-        self.register_entry_points(self.raw_entry_points)
+        self.index_cache = (
+            get_registry_index_cache(registry_name)
+            if index_cache is NotImplemented else index_cache
+        )
+        # the pending entry points for lazy mode, by module and package
+        self._lazy_modules = OrderedDict()
+        self._lazy_packages = {}
+        # for the tracking of the registered entry points, each item is
+        # a list of the entry point, its module names, the directories
+        # that were indexed and the stamps of those directories.
+        self._watched = []
+        self._listeners = []
+        # guards the modifications to the records and the indexes, as
+        # they may be done by the thread started by watch.
+        self._lock = RLock()
+        # the tries for the module names and the record keys, the
+        # reverse index of source paths to their SourceOwner, and the
+        # records that they were built from; only built on demand.
+        self._module_trie = NameTrie()
+        self._record_trie = NameTrie()
+        self._source_owners = {}
+        self._indexed_records = None
+        self.digest_index = DigestIndex()
+        if artifact is None or not self._register_artifact(artifact):
+            if self.lazy:
+                self._defer_entry_points(self.raw_entry_points)
+            else:
+                self.register_entry_points(self.raw_entry_points)
+
+    def _new_records(self, records):
+        """
+        Private method that returns a new copy of the records, in the
+        form as specified by the compact attribute.
+        """
+
+        if self.compact:
+            return CompactRecords(self.path_table, records)
+        return dict(records)
+
+    def _register_artifact(self, artifact):
+        """
+        Private method that registers the entry points from the records
+        provided by the artifact.  Returns False if the artifact cannot
+        be used, with nothing registered.
+        """
+
+        try:
+            entries = artifact['entry_points']
+            if [entry[0] for entry in entries] != [
+                    str(entry_point) for entry_point in self.raw_entry_points]:
+                raise ValueError('entry points differ')
+            if not all(check_stamps(entry[2]) for entry in entries):
+                raise ValueError('indexed directories modified')
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            logger.debug(
+                "artifact for registry '%s' not used: %s",
+                self.registry_name, e,
+            )
+            return False
+
+        for entry_point, entry in zip(self.raw_entry_points, entries):
+            if entry[1] is None:
+                # the module was not available when the artifact was
+                # produced; try again.
+                self.register_entry_points([entry_point])
+            else:
+                self._register_mapped_entry_point(
+                    entry_point, None, entry[1], sorted(entry[2]))
+        return True
+
+    def dump_artifact(self):
+        """
+        Return an artifact of the records generated for the entry points
+        in this registry, suitable for serialization as JSON.  This can
+        be provided to the artifact argument of the constructor to skip
+        the mapping of the modules of the entry points.
+
+        Modules provided by multiple entry points will have the records
+        from all of them listed under each of those entry points.
+        """
+
+        for entry_point in self.raw_entry_points:
+            self._load_module(entry_point.module_name)
+        registered = {id(watched[0]): watched for watched in self._watched}
+        entries = []
+        for entry_point in self.raw_entry_points:
+            watched = registered.get(id(entry_point))
+            if watched is None:
+                entries.append([str(entry_point), None, {}])
+            else:
+                entries.append([
+                    str(entry_point), {
+                        name: dict(self.records[name])
+                        for name in watched[1] if name in self.records
+                    },
+                    watched[3] or stamp_dirs(watched[2]),
+                ])
+        return {'entry_points': entries}
+
+    def _defer_entry_points(self, entry_points):
+        """
+        Private method that records the entry_points for registration
+        on demand.
+        """
+
+        for entry_point in entry_points:
+            self._lazy_modules.setdefault(
+                entry_point.module_name, []).append(entry_point)
+            if entry_point.dist is not None:
+                self._lazy_packages.setdefault(
+                    entry_point.dist.project_name, []).append(entry_point)
+
+    def _register_deferred(self, entry_points):
+        """
+        Private method that registers the deferred entry_points.
+        """
+
+        with self._lock:
+            # skip the ones registered by another thread in the meantime.
+            entry_points = [
+                entry_point for entry_point in entry_points
+                if entry_point in self._lazy_modules.get(
+                    entry_point.module_name, ())
+            ]
+            for entry_point in entry_points:
+                self._undefer_entry_point(entry_point)
+            self.register_entry_points(entry_points)
+
+    def _undefer_entry_point(self, entry_point):
+        """
+        Private method that removes the entry_point from the pending
+        entry points for lazy mode.
+        """
+
+        self._lazy_modules[entry_point.module_name].remove(entry_point)
+        if not self._lazy_modules[entry_point.module_name]:
+            self._lazy_modules.pop(entry_point.module_name)
+        if entry_point.dist is not None:
+            package = self._lazy_packages[entry_point.dist.project_name]
+            package.remove(entry_point)
+            if not package:
+                self._lazy_packages.pop(entry_point.dist.project_name)
+
+    def _add_entry_points(self, entry_points):
+        """
+        Register the entry points that got added to raw_entry_points,
+        or defer them for lazy mode.  The listeners will be notified of
+        the changes to the records.
+        """
+
+        with self._lock:
+            if self.lazy:
+                self._defer_entry_points(entry_points)
+                return
+
+            # the records are never modified in place, so a shallow
+            # copy is sufficient for the comparison.
+            previous = dict(self.records)
+            start = len(self._watched)
+            self.register_entry_points(entry_points)
+            names = OrderedDict()
+            for watched in self._watched[start:]:
+                names.update(OrderedDict.fromkeys(watched[1]))
+
+            changes = []
+            for name in names:
+                change = self._records_change(
+                    name, previous.get(name, {}), self.records.get(name, {}))
+                if change is not None:
+                    changes.append(change)
+        self._notify(changes)
+
+    def _remove_entry_points(self, entry_points):
+        """
+        Remove the entry points, along with the records and the pending
+        registration derived from them.  The records of the affected
+        modules will be produced again from the remaining entry points,
+        and the listeners will be notified of the changes.
+        """
+
+        with self._lock:
+            super(BaseModuleRegistry, self)._remove_entry_points(entry_points)
+            removed = set(id(entry_point) for entry_point in entry_points)
+            for entry_point in entry_points:
+                if entry_point in self._lazy_modules.get(
+                        entry_point.module_name, ()):
+                    self._undefer_entry_point(entry_point)
+
+            names = OrderedDict()
+            remaining = []
+            for watched in self._watched:
+                if id(watched[0]) not in removed:
+                    remaining.append(watched)
+                    continue
+                names.update(OrderedDict.fromkeys(watched[1]))
+                dist = watched[0].dist
+                if dist is None:
+                    continue
+                package_names = self.package_module_map.get(
+                    dist.project_name, [])
+                for name in watched[1]:
+                    package_names.remove(name)
+                if not package_names:
+                    self.package_module_map.pop(dist.project_name, None)
+            self._watched = remaining
+
+            changes = []
+            for name in names:
+                change = self._apply_records(
+                    name, self._collect_records(name, None, {}))
+                if change is not None:
+                    changes.append(change)
+        self._notify(changes)
+
+    def _load_module(self, name):
+        if name in self._lazy_modules:
+            logger.debug(
+                "registering deferred entry points for module '%s' in "
+                "registry '%s'", name, self.registry_name,
+            )
+            self._register_deferred(list(self._lazy_modules[name]))
+
+    def _load_package(self, package_name):
+        if package_name in self._lazy_packages:
+            logger.debug(
+                "registering deferred entry points for package '%s' in "
+                "registry '%s'", package_name, self.registry_name,
+            )
+            self._register_deferred(list(self._lazy_packages[package_name]))
 
     def register_entry_points(self, entry_points):
         """
         Register all entry_points provided by the list, if and only if
         the associated module can be imported.
 
+        If the workers attribute of this instance is set to a value
+        greater than one, the modules will be imported and mapped by a
+        pool of that many threads, however the results will always be
+        registered in the order of the entry_points provided.
+
         Arguments:
 
         entry_points
@@ -124,14 +774,34 @@ class BaseModuleRegistry(BaseRegistry):
             this registry instance.
         """
 
-        for entry_point in entry_points:
-            try:
-                self.register_entry_point(entry_point)
-            except ImportError:
+        entry_points = list(entry_points)
+        # the index cache is only consulted from the current thread, as
+        # it is not safe for concurrent use; only the entry points that
+        # missed are passed to the workers.
+        cached = [
+            self._lookup_entry_point(entry_point)
+            for entry_point in entry_points
+        ]
+        results = iter(concurrent_map(self._try_scan_entry_point, [
+            entry_point
+            for entry_point, mapped in zip(entry_points, cached)
+            if mapped is None
+        ], self.workers))
+        for entry_point, mapped in zip(entry_points, cached):
+            error = None
+            if mapped is None:
+                mapped, error = next(results)
+            if isinstance(error, ImportError):
                 logger.warning(
                     'ImportError: %s not found; skipping registration',
                     entry_point.module_name)
                 continue
+            elif error is not None:
+                raise error
+            self._register_mapped_entry_point(entry_point, *mapped)
+
+        if self.index_cache is not None:
+            self.index_cache.save()
 
     def register_entry_point(self, entry_point):
         """
@@ -141,10 +811,93 @@ class BaseModuleRegistry(BaseRegistry):
         import.
         """
 
-        module = __import__(
+        self._register_mapped_entry_point(
+            entry_point, *self._map_entry_point(entry_point))
+
+    def _try_scan_entry_point(self, entry_point):
+        """
+        Private method that returns a 2-tuple of the results from
+        _scan_entry_point and the exception raised while doing so, if
+        any; for use with the concurrent execution.
+        """
+
+        try:
+            return self._scan_entry_point(entry_point), None
+        except Exception as e:
+            return None, e
+
+    def _map_entry_point(self, entry_point):
+        """
+        Private method that imports and maps the module for the
+        entry_point.  Returns a 3-tuple of the module, the resulting
+        records_map and the directories that were indexed to produce
+        it; the module will be None if the records_map was provided by
+        the index cache.
+
+        Will raise ImportError if the entry_point leads to an invalid
+        import.
+        """
+
+        result = self._lookup_entry_point(entry_point)
+        if result is None:
+            result = self._scan_entry_point(entry_point)
+        return result
+
+    def _lookup_entry_point(self, entry_point):
+        """
+        Private method that returns the results of _map_entry_point
+        from the index cache, or None if unavailable.
+        """
+
+        if self.index_cache is None:
+            return None
+        result = self.index_cache.lookup_entry(entry_point)
+        if result is None:
+            return None
+        logger.debug(
+            "using cached records for entry_point '%s' in registry '%s'",
+            entry_point, self.registry_name,
+        )
+        return (None,) + result
+
+    def _scan_entry_point(self, entry_point):
+        """
+        Private method that imports and maps the module for the
+        entry_point, without consulting the index cache.
+        """
+
+        module = self._load_entry_point_module(entry_point)
+        with record_walked_dirs() as walked:
+            records_map = self._map_entry_point_module(entry_point, module)
+        walked.update(get_records_map_dirs(module, records_map))
+        return module, records_map, sorted(walked)
+
+    def _load_entry_point_module(self, entry_point):
+        """
+        Private method that returns the module for the entry_point that
+        will be passed to _map_entry_point_module.  Default
+        implementation imports the module.
+
+        Will raise ImportError if the entry_point leads to an invalid
+        import.
+        """
+
+        return __import__(
             entry_point.module_name, fromlist=['__name__'], level=0)
 
-        self._register_entry_point_module(entry_point, module)
+    def _register_mapped_entry_point(
+            self, entry_point, module, records_map, dirs=None):
+        """
+        Private method that registers the results from _map_entry_point.
+        """
+
+        if dirs is None:
+            dirs = get_records_map_dirs(module, records_map)
+        if module is not None and self.index_cache is not None:
+            self.index_cache.store(entry_point, module, records_map, dirs)
+        self._watched.append(
+            [entry_point, list(records_map.keys()), dirs, None])
+        self._register_entry_point_records_map(entry_point, records_map)
 
     def _register_entry_point_module(self, entry_point, module):
         """
@@ -152,7 +905,16 @@ class BaseModuleRegistry(BaseRegistry):
         module.
         """
 
-        records_map = self._map_entry_point_module(entry_point, module)
+        self._register_mapped_entry_point(
+            entry_point, module,
+            self._map_entry_point_module(entry_point, module),
+        )
+
+    def _register_entry_point_records_map(self, entry_point, records_map):
+        """
+        Private method that registers the records_map produced for the
+        entry_point.
+        """
 
         if entry_point.dist is None:
             # it's probably manually added not through the standard
@@ -175,6 +937,7 @@ class BaseModuleRegistry(BaseRegistry):
             self.package_module_map[entry_point.dist.project_name].extend(
                 list(records_map.keys()))
 
+        project_name = getattr(entry_point.dist, 'project_name', None)
         for module_name, records in records_map.items():
             if module_name in self.records:
                 logger.info(
@@ -182,13 +945,316 @@ class BaseModuleRegistry(BaseRegistry):
                     "applying new records on top.",
                     module_name, self.registry_name,
                 )
-                self.records[module_name].update(records)
+                merged = dict(self.records[module_name])
+                merged.update(records)
+                self.records[module_name] = (
+                    self._new_records(merged) if self.compact else merged)
             else:
                 logger.debug(
                     "adding records for module '%s' to registry '%s'",
                     module_name, self.registry_name,
                 )
-                self.records[module_name] = records
+                self.records[module_name] = (
+                    self._new_records(records) if self.compact else records)
+            self._index_records(module_name, records, project_name)
+
+    def add_listener(self, listener):
+        """
+        Add a listener, which will be called with a RecordsChange for
+        every module with records updated by poll.
+        """
+
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self._listeners.remove(listener)
+
+    def poll(self):
+        """
+        Check the directories that were indexed for the registered entry
+        points, and for the entry points with changes, map their modules
+        again and replace the records of the affected modules.
+
+        Directories are compared against the state at the first poll,
+        so the initial call will only establish that.  Returns the list
+        of RecordsChange, which are also sent to the listeners.
+        """
+        with self._lock:
+            changes = []
+            for watched in self._watched:
+                entry_point, old_names, dirs, stamps = watched[:4]
+                if stamps is None:
+                    watched[3] = stamp_dirs(dirs)
+                    continue
+                if check_stamps(stamps):
+                    continue
+
+                logger.debug(
+                    "changes detected for entry_point '%s' in registry '%s'",
+                    entry_point, self.registry_name,
+                )
+                try:
+                    module, records_map, new_dirs = self._map_entry_point(
+                        entry_point)
+                except ImportError:
+                    logger.warning(
+                        "ImportError: %s can no longer be found",
+                        entry_point.module_name)
+                    module, records_map, new_dirs = None, {}, None
+                if module is not None and self.index_cache is not None:
+                    self.index_cache.store(
+                        entry_point, module, records_map, new_dirs)
+
+                new_names = list(records_map.keys())
+                dirs = new_dirs or dirs
+                watched[1:] = [new_names, dirs, stamp_dirs(dirs)]
+                if entry_point.dist is not None:
+                    package_names = self.package_module_map.setdefault(
+                        entry_point.dist.project_name, [])
+                    for name in old_names:
+                        package_names.remove(name)
+                    package_names.extend(new_names)
+
+                for name in OrderedDict.fromkeys(old_names + new_names):
+                    change = self._apply_records(name, self._collect_records(
+                        name, watched, records_map))
+                    if change is not None:
+                        changes.append(change)
+
+            if self.index_cache is not None:
+                self.index_cache.save()
+        self._notify(changes)
+        return changes
+
+    def _notify(self, changes):
+        for change in changes:
+            for listener in self._listeners:
+                listener(change)
+
+    def _collect_records(self, name, changed, records_map):
+        """
+        Private method that produces the records for the module name
+        from all the tracked entry points that contribute to it, using
+        the given records_map for the changed one.
+        """
+
+        results = {}
+        for watched in self._watched:
+            if name not in watched[1]:
+                continue
+            if watched is changed:
+                results.update(records_map[name])
+                continue
+            # the rare case where multiple entry points provide the
+            # same module; as only the combined records are kept, the
+            # module for the other entry point is mapped again.
+            try:
+                other = self._map_entry_point(watched[0])[1]
+            except ImportError:
+                continue
+            results.update(other.get(name, {}))
+        return results
+
+    def _apply_records(self, name, records):
+        """
+        Private method that replaces the records for the module name
+        with a new records object, such that the ones that were handed
+        out remain intact.  Returns a RecordsChange if there are any
+        changes.
+        """
+
+        current = self.records.get(name, {})
+        change = self._records_change(name, current, records)
+        if change is None:
+            return None
+        added, removed, modified = change[1:]
+
+        self._unindex_records(
+            name, {key: current[key] for key in removed + modified})
+        if not records:
+            self.records.pop(name, None)
+            self._unindex_records(name)
+        else:
+            self.records[name] = (
+                self._new_records(records) if self.compact else records)
+        if records:
+            self._index_records(
+                name, {key: records[key] for key in added + modified},
+                self._find_project_name(name),
+            )
+        return change
+
+    def _records_change(self, name, current, records):
+        """
+        Private method that returns the RecordsChange going from the
+        current records to the records provided, or None if identical.
+        """
+
+        added = sorted(k for k in records if k not in current)
+        removed = sorted(k for k in current if k not in records)
+        modified = sorted(
+            k for k in records if k in current and current[k] != records[k])
+        if not (added or removed or modified):
+            return None
+        return RecordsChange(name, added, removed, modified)
+
+    def _find_project_name(self, module_name):
+        """
+        Private method that returns the name of the project that
+        provided the module, or None if unknown.
+        """
+
+        for project_name, names in self.package_module_map.items():
+            if module_name in names:
+                return project_name
+        return None
+
+    def _index_records(self, module_name, records, project_name=None):
+        """
+        Private method that adds the module_name and the records to the
+        tries and the reverse index of source paths.
+        """
+
+        if self._indexed_records is not self.records:
+            # will be built on the next query.
+            return
+        self._module_trie.add(module_name, module_name)
+        for key, path in records.items():
+            self._record_trie.add(key, module_name)
+            if isinstance(path, _str_types):
+                self._source_owners[self._source_key(path, add=True)] = (
+                    SourceOwner(key, module_name, project_name))
+
+    def _unindex_records(self, module_name, records=None):
+        """
+        Private method that removes the records from the tries and the
+        reverse index of source paths; if records is None, the
+        module_name will be removed instead.
+        """
+
+        if self._indexed_records is not self.records:
+            return
+        if records is None:
+            self._module_trie.remove(module_name)
+            return
+        for key, path in records.items():
+            # the key may have been provided by another module since.
+            if self._record_trie.get(key) == module_name:
+                self._record_trie.remove(key)
+            if not isinstance(path, _str_types):
+                continue
+            source_key = self._source_key(path)
+            owner = self._source_owners.get(source_key)
+            if owner is not None and owner[:2] == (key, module_name):
+                self._source_owners.pop(source_key)
+
+    def _source_key(self, path, add=False):
+        """
+        Private method that returns the key for the path within the
+        reverse index of source paths.
+
+        For compact registries, the key is the 2-tuple of the id of the
+        directory in the path_table and the file name, such that the
+        full paths are not kept.  Unless add is True, None will be
+        returned for the directories not already in there.
+        """
+
+        path = _norm_source_path(path)
+        if not self.compact:
+            return path
+        if add:
+            return self.path_table.add(path)
+        return self.path_table.find(path)
+
+    def _ensure_indexed(self):
+        """
+        Private method that ensures all records are registered and
+        indexed.
+        """
+
+        if self._lazy_modules:
+            for item in self.iter_records():
+                pass
+        if self._indexed_records is not self.records:
+            # not yet built, or the records were replaced wholesale.
+            self._module_trie = NameTrie()
+            self._record_trie = NameTrie()
+            self._source_owners = {}
+            self._indexed_records = self.records
+            project_names = {}
+            for project_name, names in self.package_module_map.items():
+                for name in names:
+                    project_names.setdefault(name, project_name)
+            for module_name, records in self.records.items():
+                self._index_records(
+                    module_name, records, project_names.get(module_name))
+
+    def find_records_by_prefix(self, prefix):
+        """
+        Return all the records with keys under the prefix; both the
+        ``/`` and ``.`` characters are treated as the separators, and
+        only complete fragments are matched.
+        """
+
+        with self._lock:
+            self._ensure_indexed()
+            return {
+                key: self.records[module_name][key]
+                for key, module_name in self._record_trie.iter_prefix(prefix)
+            }
+
+    def find_owner_module(self, name):
+        """
+        Return the name of the registered module that is the longest
+        match of the leading fragments of the name, or None.
+        """
+
+        with self._lock:
+            self._ensure_indexed()
+            result = self._module_trie.longest_match(name)
+        return None if result is None else result[1]
+
+    def find_source_owner(self, path):
+        """
+        Return the SourceOwner for the source file at path, which is a
+        namedtuple of the module name for the record, the name of the
+        module that provided it and the name of the project of that
+        module; None is returned if the path was not registered.
+        """
+
+        with self._lock:
+            self._ensure_indexed()
+            return self._source_owners.get(self._source_key(path))
+
+    def watch(self, interval=1.0):
+        """
+        Start a daemon thread that polls for changes at the interval
+        specified in seconds.  Returns a function that will stop the
+        thread when called.
+        """
+
+        stop = Event()
+
+        def run():
+            while not stop.wait(interval):
+                try:
+                    self.poll()
+                except Exception:
+                    logger.exception(
+                        "unexpected error polling registry '%s'",
+                        self.registry_name)
+
+        # establish the initial state.
+        self.poll()
+        thread = Thread(target=run, name='watch:' + self.registry_name)
+        thread.daemon = True
+        thread.start()
+
+        def cleanup():
+            stop.set()
+            thread.join()
+
+        return cleanup
 
     def _map_entry_point_module(self, entry_point, module):
         """
@@ -202,11 +1268,28 @@ class BaseModuleRegistry(BaseRegistry):
 
     def get_record(self, name):
         """
-        Get a record by name
+        Get a record by name.  The record is returned as a view of the
+        records held by this registry, which is only copied if it is
+        modified.
+        """
+
+        self._load_module(name)
+        return RecordView(self.records.get(name, _empty))
+
+    def get_record_digests(self, name):
+        """
+        Get the digests of the source files for the records of name,
+        keyed by the record keys.  Each digest is a dict with the size,
+        mtime and the content hash of the file, which are computed on
+        demand and memoized for as long as the file remains unchanged.
+        Records that do not lead to readable files will be omitted.
         """
 
         result = {}
-        result.update(self.records.get(name, {}))
+        for key, path in self.get_record(name).items():
+            digest = self.digest_index.digest(path)
+            if digest is not None:
+                result[key] = digest
         return result
 
     def get_records_for_package(self, package_name):
@@ -214,19 +1297,47 @@ class BaseModuleRegistry(BaseRegistry):
         Get all records identified by package.
         """
 
-        names = self.package_module_map.get(package_name, [])
+        return self.get_records_for_packages([package_name])
+
+    def get_records_for_packages(self, package_names):
+        """
+        Get all records identified by the packages, as a single dict
+        with the records of the later packages taking precedence.
+        """
+
         result = {}
-        for name in names:
-            result.update(self.get_record(name))
+        for package_name in package_names:
+            self._load_package(package_name)
+            for name in self.package_module_map.get(package_name, []):
+                result.update(self.records.get(name, _empty))
         return result
 
     def iter_records(self):
         """
-        Iterates through the records.
+        Iterates through the records.  Any deferred entry points will
+        be registered as the iteration reaches them.
         """
 
-        for item in self.records.items():
-            yield item
+        if not self._lazy_modules:
+            # iterate through a snapshot, as the records may be replaced
+            # by the thread started by watch.
+            for item in list(self.records.items()):
+                yield item
+            return
+
+        seen = set()
+        for entry_point in self.raw_entry_points:
+            name = entry_point.module_name
+            if name in seen:
+                continue
+            seen.add(name)
+            self._load_module(name)
+            if name in self.records:
+                yield name, self.records[name]
+
+        for name, records in list(self.records.items()):
+            if name not in seen:
+                yield name, records
 
 
 class BaseDriver(object):
@@ -242,7 +1353,7 @@ class BaseDriver(object):
 
     Helper methods such as _exec will ensure the binary is executed
     with the right arguments (via _gen_call_kws).  The dump/dumps method
-    invokes the underlying functions of the same name from the json
+    invokes the underlying functions of the same name from the jsonio
     module with the attributes defined to ensure human readability by
     default.  Finally, join_cwd joins a target path with the working
     directory defined for instances of this, so that target path can be
@@ -408,22 +1519,22 @@ class BaseDriver(object):
 
     def dump(self, blob, stream):
         """
-        Call json.dump with the attributes of this instance as
+        Call jsonio.dump with the attributes of this instance as
         arguments.
         """
 
-        json.dump(
+        jsonio.dump(
             blob, stream, indent=self.indent, sort_keys=True,
             separators=self.separators,
         )
 
     def dumps(self, blob):
         """
-        Call json.dumps with the attributes of this instance as
+        Call jsonio.dumps with the attributes of this instance as
         arguments.
         """
 
-        return json.dumps(
+        return jsonio.dumps(
             blob, indent=self.indent, sort_keys=True,
             separators=self.separators,
         )
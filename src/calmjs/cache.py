@@ -0,0 +1,639 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent caches for calmjs.
+
+Various parts of the calmjs framework derive information that will not
+change between invocations unless the underlying Python environment has
+changed, such as the listing of JavaScript sources shipped with some
+Python module.  The helpers here persist those results on disk so that
+subsequent processes can skip the work.
+
+Persistent caching is opt-in; it is only enabled when the environment
+variable ``CALMJS_CACHE_DIR`` is set to a directory where the cache
+files will be written to.
+"""
+
+from __future__ import absolute_import
+
+import errno
+import hashlib
+import os
+import sys
+import zipfile
+from logging import getLogger
+from os.path import dirname
+from os.path import exists
+from os.path import join
+from tempfile import mkstemp
+from threading import Lock
+
+from pkg_resources import working_set as default_working_set
+
+from calmjs import jsonio
+from calmjs.utils import split_zip_path
+
+logger = getLogger(__name__)
+
+CALMJS_CACHE_DIR = 'CALMJS_CACHE_DIR'
+INDEX_CACHE_DIR = 'index'
+INDEX_CACHE_VERSION = 2
+REGISTRY_ARTIFACT_DIR = 'registry'
+REGISTRY_ARTIFACT_VERSION = 1
+RESOLVE_CACHE_FILE = 'resolve.json'
+RESOLVE_CACHE_VERSION = 1
+VERSION_CACHE_FILE = 'versions.json'
+VERSION_CACHE_VERSION = 1
+DIGEST_ALGORITHM = 'sha256'
+DIGEST_CHUNK_SIZE = 65536
+# the metadata files that are stamped by the fingerprint of distributions
+DIST_METADATA_FILES = (
+    'PKG-INFO', 'METADATA', 'requires.txt', 'entry_points.txt')
+
+if sys.version_info < (3,):  # pragma: no cover
+    _str_types = (bytes, unicode)  # noqa: F821
+else:  # pragma: no cover
+    _str_types = (str,)
+
+
+def get_cache_dir():
+    """
+    Return the directory for persistent caches, or None if persistent
+    caching is not enabled.
+    """
+
+    return os.environ.get(CALMJS_CACHE_DIR) or None
+
+
+def read_cache_file(path):
+    """
+    Read a JSON cache file.  Returns None if the file does not exist or
+    is not usable.
+    """
+
+    if not exists(path):
+        return None
+
+    try:
+        with open(path) as fd:
+            return jsonio.load(fd)
+    except (IOError, OSError):
+        logger.warning("failed to read cache file '%s'", path)
+    except ValueError:
+        logger.warning("ignoring malformed cache file '%s'", path)
+    return None
+
+
+def write_cache_file(path, obj):
+    """
+    Write the obj as JSON to the path.  The write is done through a
+    temporary file that is then renamed to the target path, such that
+    concurrent readers will never see a partially written file.
+
+    Returns True if the write was successful.
+    """
+
+    target_dir = dirname(path)
+    try:
+        if not exists(target_dir):
+            os.makedirs(target_dir)
+    except OSError as e:  # pragma: no cover
+        # a concurrent process may have created the directory.
+        if e.errno != errno.EEXIST:
+            logger.warning(
+                "failed to create cache directory '%s'", target_dir)
+            return False
+
+    try:
+        fd, tmp_path = mkstemp(dir=target_dir, suffix='.tmp')
+        with os.fdopen(fd, 'w') as stream:
+            jsonio.dump(obj, stream, separators=(',', ':'))
+        if sys.platform == 'win32' and exists(path):  # pragma: no cover
+            os.remove(path)
+        os.rename(tmp_path, path)
+    except (IOError, OSError):
+        logger.warning("failed to write cache file '%s'", path)
+        return False
+    return True
+
+
+class BaseCache(object):
+    """
+    The base class for the in-memory caches, which keeps count of the
+    hits and misses.  The entries must only be accessed with the lock
+    held.
+    """
+
+    entries_factory = dict
+
+    def __init__(self):
+        self._lock = Lock()
+        self._reset()
+
+    def _reset(self):
+        # must be called with the lock held, or on construction.
+        self.hits = 0
+        self.misses = 0
+        self._entries = self.entries_factory()
+
+    def clear(self):
+        """
+        Remove all entries, and reset the counters.
+        """
+
+        with self._lock:
+            self._reset()
+
+
+class JsonFileCache(BaseCache):
+    """
+    The base class for the caches with entries that are persisted into
+    a single JSON file.  The file is tagged with the version of the
+    cache and the key, such that the entries are only loaded from a
+    file with both of them matching.
+    """
+
+    version = None
+
+    def _reset(self):
+        super(JsonFileCache, self)._reset()
+        self.path = None
+        self.key = None
+
+    def _load(self, path, key=None):
+        """
+        Load the entries for the key from the file at path, unless they
+        are already loaded; a path of None will start with no entries.
+        Must be called with the lock held.
+        """
+
+        if self.path == path and self.key == key:
+            return
+        self.path = path
+        self.key = key
+        self._entries = self.entries_factory()
+        if path is None:
+            return
+        cached = read_cache_file(path)
+        if (isinstance(cached, dict) and
+                cached.get('version') == self.version and
+                cached.get('key') == key and
+                isinstance(cached.get('entries'), dict)):
+            self._entries = cached['entries']
+
+    def _save(self):
+        # must be called with the lock held.
+        if self.path is None:
+            return
+        write_cache_file(self.path, {
+            'version': self.version,
+            'key': self.key,
+            'entries': self._entries,
+        })
+
+
+def stamp_dirs(paths):
+    """
+    Return a dict mapping each of the directory paths to its mtime.
+    Directories that cannot be accessed will be omitted.
+    """
+
+    results = {}
+    for path in paths:
+        try:
+            results[path] = os.stat(path).st_mtime
+        except OSError:
+            logger.debug("cannot stat '%s' for stamping", path)
+    return results
+
+
+def check_stamps(stamps):
+    """
+    Verify that the directory stamps produced by stamp_dirs still hold.
+    """
+
+    for path, mtime in stamps.items():
+        try:
+            if os.stat(path).st_mtime != mtime:
+                return False
+        except OSError:
+            return False
+    return True
+
+
+def _iter_module_dirs(module):
+    paths = getattr(module, '__path__', None)
+    if paths:
+        for path in paths:
+            yield path
+    elif getattr(module, '__file__', None):
+        yield dirname(module.__file__)
+
+
+def _iter_records_map_dirs(records_map):
+    for records in records_map.values():
+        if not isinstance(records, dict):
+            continue
+        for value in records.values():
+            if isinstance(value, _str_types):
+                yield dirname(value)
+
+
+def get_records_map_dirs(module, records_map):
+    """
+    Return the sorted list of directories that were indexed to produce
+    the records_map for the module; module may be None if unavailable.
+    """
+
+    dirs = set(_iter_module_dirs(module)) if module is not None else set()
+    dirs.update(_iter_records_map_dirs(records_map))
+    return sorted(dirs)
+
+
+def _dist_version(dist):
+    try:
+        return dist.version
+    except ValueError:
+        # the distribution has no version information available.
+        return None
+
+
+class RegistryIndexCache(object):
+    """
+    A persistent cache of the records that a module registry generated
+    for each of its entry points.
+
+    Entries are grouped by the distribution that provided the entry
+    point, and the group is discarded entirely if the version or the
+    location of the distribution no longer match.  Each entry is also
+    stamped with the mtimes of the directories that were indexed, such
+    that adding or removing a file will invalidate the entry.
+    """
+
+    def __init__(self, registry_name, cache_dir):
+        self.registry_name = registry_name
+        self.path = join(cache_dir, INDEX_CACHE_DIR, registry_name + '.json')
+        self._dists = None
+        self.dirty = False
+
+    @property
+    def dists(self):
+        if self._dists is None:
+            cached = read_cache_file(self.path)
+            if (isinstance(cached, dict) and
+                    cached.get('version') == INDEX_CACHE_VERSION and
+                    isinstance(cached.get('dists'), dict)):
+                self._dists = cached['dists']
+            else:
+                self._dists = {}
+        return self._dists
+
+    def _get_dist_entry(self, dist):
+        entry = self.dists.get(dist.project_name)
+        if entry is None:
+            return None
+        if (entry.get('version') != _dist_version(dist) or
+                entry.get('location') != dist.location):
+            logger.debug(
+                "invalidating index cache for '%s' in registry '%s'",
+                dist.project_name, self.registry_name,
+            )
+            self.dists.pop(dist.project_name, None)
+            self.dirty = True
+            return None
+        return entry
+
+    def lookup(self, entry_point):
+        """
+        Return the cached records_map for the entry_point, or None if
+        there are no valid entries.
+        """
+
+        result = self.lookup_entry(entry_point)
+        return None if result is None else result[0]
+
+    def lookup_entry(self, entry_point):
+        """
+        Return a 2-tuple of the cached records_map for the entry_point
+        and the sorted list of directories that were indexed to produce
+        it, or None if there are no valid entries.
+        """
+
+        if entry_point.dist is None:
+            return None
+
+        entry = self._get_dist_entry(entry_point.dist)
+        if entry is None:
+            return None
+
+        key = str(entry_point)
+        cached = entry['entry_points'].get(key)
+        if cached is None:
+            return None
+
+        if not check_stamps(cached['stamps']):
+            logger.debug(
+                "index cache for entry_point '%s' in registry '%s' is stale",
+                entry_point, self.registry_name,
+            )
+            entry['entry_points'].pop(key, None)
+            self.dirty = True
+            return None
+
+        # shallow copies such that the registry may freely modify them.
+        return {
+            key: dict(value) if isinstance(value, dict) else value
+            for key, value in cached['records_map'].items()
+        }, sorted(cached['stamps'])
+
+    def store(self, entry_point, module, records_map, dirs=None):
+        """
+        Store the records_map generated for the entry_point from the
+        module.  The dirs are the directories that were indexed, which
+        will be derived from the module and the records_map if not
+        provided.
+        """
+
+        dist = entry_point.dist
+        if dist is None:
+            return
+
+        try:
+            # copy and also ensure the results can be serialized.
+            records_map = jsonio.loads(
+                jsonio.dumps(records_map, separators=(',', ':')))
+        except (TypeError, ValueError):
+            logger.debug(
+                "records for entry_point '%s' in registry '%s' cannot be "
+                "serialized; not caching", entry_point, self.registry_name,
+            )
+            return
+
+        if dirs is None:
+            dirs = get_records_map_dirs(module, records_map)
+
+        entry = self._get_dist_entry(dist)
+        if entry is None:
+            entry = self.dists[dist.project_name] = {
+                'version': _dist_version(dist),
+                'location': dist.location,
+                'entry_points': {},
+            }
+        entry['entry_points'][str(entry_point)] = {
+            'stamps': stamp_dirs(dirs),
+            'records_map': records_map,
+        }
+        self.dirty = True
+
+    def save(self):
+        """
+        Persist the cache if there were any changes.
+        """
+
+        if not self.dirty:
+            return
+        if write_cache_file(self.path, {
+                'version': INDEX_CACHE_VERSION,
+                'dists': self.dists,
+                }):
+            self.dirty = False
+
+
+def get_registry_index_cache(registry_name):
+    """
+    Return a RegistryIndexCache for the registry_name, or None if
+    persistent caching is not enabled.
+    """
+
+    cache_dir = get_cache_dir()
+    if cache_dir is None:
+        return None
+    return RegistryIndexCache(registry_name, cache_dir)
+
+
+def _stat_mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except (OSError, TypeError):
+        return None
+
+
+def _stat_file(path):
+    try:
+        st = os.stat(path)
+    except (OSError, TypeError):
+        return None
+    return st.st_mtime, st.st_size
+
+
+def _fingerprint_dist(dist):
+    egg_info = getattr(dist, 'egg_info', None)
+    h = hashlib.sha256()
+    h.update(('%s\n%s\n%s\n%r\n' % (
+        dist.project_name, _dist_version(dist), dist.location,
+        _stat_mtime(egg_info),
+    )).encode('utf-8'))
+    if egg_info:
+        # as rewriting the files in place (e.g. re-running egg_info on
+        # a development install) will not change the mtime of the
+        # directory.
+        for name in DIST_METADATA_FILES:
+            h.update(('%r\n' % (
+                _stat_file(join(egg_info, name)),)).encode('utf-8'))
+    return h.hexdigest()
+
+
+class WorkingSetFingerprint(object):
+    """
+    The fingerprint of a working set.
+
+    The digest is derived from the digests of every distribution in the
+    working set in the order they are in, while the digest for each of
+    the distributions is derived from its name, version, location, the
+    mtime of its metadata directory (e.g. the egg-info directory) and
+    the mtimes and sizes of the metadata files within, such that
+    reinstalling or re-running egg_info on a development install will
+    produce a different digest.  The digests of the distributions are
+    available through the dists attribute, keyed by the key of the
+    distribution.
+    """
+
+    def __init__(self, dists):
+        """
+        Arguments
+
+        dists
+            A list of 2-tuples of the key and the digest for every
+            distribution, in the order of the working set.
+        """
+
+        h = hashlib.sha256()
+        for key, digest in dists:
+            h.update(('%s\n%s\n' % (key, digest)).encode('utf-8'))
+        self.digest = h.hexdigest()
+        self.dists = dict(dists)
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, WorkingSetFingerprint) and
+            self.digest == other.digest
+        )
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.digest)
+
+    def changed(self, other):
+        """
+        Return the sorted list of keys of the distributions that were
+        added, removed or changed between the other fingerprint and this
+        one.  The other may also be the dists attribute of a fingerprint
+        that was persisted.
+        """
+
+        others = getattr(other, 'dists', other)
+        return sorted(
+            key for key in set(self.dists) | set(others)
+            if self.dists.get(key) != others.get(key)
+        )
+
+
+def fingerprint_working_set(working_set=None):
+    """
+    Return the WorkingSetFingerprint of the working set, which defaults
+    to the global working set from pkg_resources, or None if the working
+    set cannot be iterated.
+    """
+
+    if working_set is None:
+        working_set = default_working_set
+    try:
+        dists = list(working_set)
+    except TypeError:
+        return None
+    return WorkingSetFingerprint(
+        [(dist.key, _fingerprint_dist(dist)) for dist in dists])
+
+
+def get_registry_artifact_path(registry_name):
+    """
+    Return the path to the prebuilt artifact for the registry_name, or
+    None if persistent caching is not enabled.
+    """
+
+    cache_dir = get_cache_dir()
+    if cache_dir is None:
+        return None
+    return join(cache_dir, REGISTRY_ARTIFACT_DIR, registry_name + '.json')
+
+
+def get_resolve_cache_path():
+    """
+    Return the path to the persisted results of requirement resolutions,
+    or None if persistent caching is not enabled.
+    """
+
+    cache_dir = get_cache_dir()
+    if cache_dir is None:
+        return None
+    return join(cache_dir, RESOLVE_CACHE_FILE)
+
+
+def get_version_cache_path():
+    """
+    Return the path to the persisted versions reported by binaries, or
+    None if persistent caching is not enabled.
+    """
+
+    cache_dir = get_cache_dir()
+    if cache_dir is None:
+        return None
+    return join(cache_dir, VERSION_CACHE_FILE)
+
+
+def _stat_source(path):
+    """
+    Return a 4-tuple of the key, size, mtime and a callable that will
+    produce the chunks of the contents of the file at path, with the
+    key being a tuple of the inode, mtime and size.  Virtual paths that
+    point into a zip archive are supported, where the inode and mtime
+    are taken from the archive.
+    """
+
+    try:
+        st = os.stat(path)
+    except OSError:
+        split = split_zip_path(path)
+        if split is None:
+            raise
+        archive, member = split
+        st = os.stat(archive)
+        with zipfile.ZipFile(archive) as zf:
+            try:
+                info = zf.getinfo(member)
+            except KeyError:
+                raise OSError(errno.ENOENT, os.strerror(errno.ENOENT))
+
+        def read_zip():
+            with zipfile.ZipFile(archive) as zf:
+                yield zf.read(member)
+
+        key = (st.st_ino, st.st_mtime, info.file_size, member)
+        return key, info.file_size, st.st_mtime, read_zip
+
+    def read_file():
+        with open(path, 'rb') as fd:
+            for chunk in iter(lambda: fd.read(DIGEST_CHUNK_SIZE), b''):
+                yield chunk
+
+    key = (st.st_ino, st.st_mtime, st.st_size)
+    return key, st.st_size, st.st_mtime, read_file
+
+
+class DigestIndex(object):
+    """
+    Memoized digests of the contents of source files.
+
+    The digest of a file is only computed when first requested, and is
+    then reused for as long as the inode, mtime and size of the file
+    remain unchanged.
+    """
+
+    def __init__(self, algorithm=DIGEST_ALGORITHM):
+        self.algorithm = algorithm
+        self._digests = {}
+
+    def digest(self, path):
+        """
+        Return a dict with the size, mtime and the hexdigest (keyed by
+        the name of the algorithm) of the file at path, or None if the
+        file cannot be read.
+        """
+
+        if not isinstance(path, _str_types):
+            return None
+
+        try:
+            key, size, mtime, read = _stat_source(path)
+            cached = self._digests.get(path)
+            if cached is not None and cached[0] == key:
+                return dict(cached[1])
+            h = hashlib.new(self.algorithm)
+            for chunk in read():
+                h.update(chunk)
+        except (IOError, OSError):
+            logger.debug("cannot compute digest for '%s'", path)
+            self._digests.pop(path, None)
+            return None
+
+        result = {
+            'size': size,
+            'mtime': mtime,
+            self.algorithm: h.hexdigest(),
+        }
+        self._digests[path] = (key, result)
+        return dict(result)
+
+    def clear(self):
+        self._digests.clear()
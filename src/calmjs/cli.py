@@ -11,23 +11,34 @@ from __future__ import unicode_literals
 
 import difflib
 import logging
-import json
 import re
 import sys
+from functools import partial
 from locale import getpreferredencoding
 from os import fstat
+from os import stat
 from os.path import exists
+from os.path import realpath
 from stat import S_ISCHR
 
 from subprocess import check_output
 from subprocess import call
 
+from calmjs import jsonio
+from calmjs.cache import VERSION_CACHE_VERSION
+from calmjs.cache import JsonFileCache
+from calmjs.cache import get_version_cache_path
 from calmjs.dist import convert_package_names
 from calmjs.dist import find_packages_requirements_dists
+from calmjs.dist import map_packages_requirements_dists
 from calmjs.dist import flatten_dist_egginfo_json
 from calmjs.dist import pkg_names_to_dists
+from calmjs.dist import read_dist_egginfo_json
+from calmjs.dist import EgginfoJsonLayers
 from calmjs.dist import DEFAULT_JSON
 from calmjs.dist import DEP_KEYS
+from calmjs.dist import EGGINFO_JSON_WORKERS
+from calmjs.utils import concurrent_map
 
 from calmjs.base import NODE
 from calmjs.base import BaseDriver
@@ -50,13 +61,73 @@ if sys.version_info < (3,):  # pragma: no cover
 lower = str.lower
 
 
+class BinVersionCache(JsonFileCache):
+    """
+    A persistent cache of the versions reported by binaries, such that
+    the binaries will not need to be executed again in subsequent
+    processes.
+
+    Entries are keyed by the real path of the binary along with the
+    version flag, and are stamped with the mtime and size of the file
+    at that path, such that an upgrade of the binary will invalidate
+    the entry.  Nothing is cached unless persistent caching is enabled.
+    """
+
+    version = VERSION_CACHE_VERSION
+
+    def get_version(self, prog, version_flag, probe):
+        """
+        Return the version for the binary at prog as reported through
+        the version_flag, which will be produced by calling probe if
+        there are no valid entries.
+        """
+
+        path = get_version_cache_path()
+        if path is None:
+            return probe()
+
+        try:
+            target = realpath(prog)
+            st = stat(target)
+        except OSError:
+            return probe()
+
+        key = '%s %s' % (target, version_flag)
+        stamp = [st.st_mtime, st.st_size]
+        with self._lock:
+            self._load(path)
+            entry = self._entries.get(key)
+            if isinstance(entry, dict) and entry.get('stamp') == stamp:
+                self.hits += 1
+                return tuple(entry['version'])
+            self.misses += 1
+
+        version = probe()
+        with self._lock:
+            if self.path == path:
+                self._entries[key] = {
+                    'stamp': stamp,
+                    'version': list(version),
+                }
+                self._save()
+        return version
+
+
+bin_version_cache = BinVersionCache()
+
+
+def _probe_bin_version(prog, version_flag, kw):
+    version_str = version_expr.search(
+        check_output([prog, version_flag], **kw).decode(locale)
+    ).groups()[0]
+    return tuple(int(i) for i in version_str.split('.'))
+
+
 def _get_bin_version(bin_path, version_flag='-v', kw={}):
     try:
         prog = _get_exec_binary(bin_path, kw)
-        version_str = version_expr.search(
-            check_output([prog, version_flag], **kw).decode(locale)
-        ).groups()[0]
-        version = tuple(int(i) for i in version_str.split('.'))
+        version = bin_version_cache.get_version(prog, version_flag, partial(
+            _probe_bin_version, prog, version_flag, kw))
     except OSError:
         logger.warning("failed to execute '%s'", bin_path)
         return None
@@ -66,7 +137,8 @@ def _get_bin_version(bin_path, version_flag='-v', kw={}):
             "'%s':", bin_path
         )
         return None
-    logger.info("found '%s' version '%s'", bin_path, version_str)
+    logger.info("found '%s' version '%s'", bin_path, '.'.join(
+        str(i) for i in version))
     return version
 
 
@@ -317,7 +389,8 @@ class PackageManagerDriver(NodeDriver):
         # overwritten by subclasses
         names = [
             'pkg_manager_bin', 'get_pkg_manager_version', 'pkg_manager_init',
-            'pkg_manager_install', 'pkg_manager_view', 'install_cmd',
+            'pkg_manager_install', 'pkg_manager_view',
+            'pkg_manager_view_batch', 'install_cmd',
         ]
 
         g = {}
@@ -330,6 +403,8 @@ class PackageManagerDriver(NodeDriver):
                 g['get_pkg_manager_version'],
             '%(pkg_manager_bin)s_view' % g:
                 g['pkg_manager_view'],
+            '%(pkg_manager_bin)s_view_batch' % g:
+                g['pkg_manager_view_batch'],
             '%(pkg_manager_bin)s_init' % g:
                 g['pkg_manager_init'],
             '%(pkg_manager_bin)s_%(install_cmd)s' % g:
@@ -385,8 +460,18 @@ class PackageManagerDriver(NodeDriver):
         kw = self._gen_call_kws()
         return _get_bin_version(self.pkg_manager_bin, kw=kw)
 
+    def _convert_package_names(self, package_names):
+        # assuming string, and assume whitespaces are invalid.
+        pkg_names, malformed = convert_package_names(package_names)
+        if malformed:
+            msg = 'malformed package name(s) specified: %s' % ', '.join(
+                malformed)
+            raise ValueError(msg)
+        return pkg_names
+
     def pkg_manager_view(
-            self, package_names, stream=None, explicit=False, **kw):
+            self, package_names, stream=None, explicit=False, batch=False,
+            **kw):
         """
         Returns the manifest JSON for the Python package name.  Default
         npm implementation calls for package.json.
@@ -406,22 +491,24 @@ class PackageManagerDriver(NodeDriver):
         explicit
             If True, the package names specified are the explicit list
             to search for - no dependency resolution will then be done.
+        batch
+            If True, generate a manifest for each of the packages; see
+            pkg_manager_view_batch.
 
         Returns the manifest json as a dict.
         """
 
+        if batch:
+            return self.pkg_manager_view_batch(
+                package_names, stream=stream, explicit=explicit)
+
         # For looking up the pkg_name to dist converter for explicit
         to_dists = {
             False: find_packages_requirements_dists,
             True: pkg_names_to_dists,
         }
 
-        # assuming string, and assume whitespaces are invalid.
-        pkg_names, malformed = convert_package_names(package_names)
-        if malformed:
-            msg = 'malformed package name(s) specified: %s' % ', '.join(
-                malformed)
-            raise ValueError(msg)
+        pkg_names = self._convert_package_names(package_names)
 
         if len(pkg_names) == 1:
             logger.info(
@@ -453,6 +540,72 @@ class PackageManagerDriver(NodeDriver):
 
         return pkgdef_json
 
+    def pkg_manager_view_batch(
+            self, package_names, stream=None, explicit=False, **kw):
+        """
+        Returns a list of manifest JSON, one for each of the Python
+        package names, identical to the ones produced by calling
+        pkg_manager_view with each of them individually.  However, the
+        metadata of every distribution required by any of the packages
+        will only be read once.
+
+        Arguments:
+
+        package_names
+            The names of the python packages with their requirements to
+            source the package.json from.
+        stream
+            If specified, each of the generated package.json will be
+            written to there as a single line of JSON.
+        explicit
+            If True, the package names specified are the explicit list
+            to search for - no dependency resolution will then be done.
+
+        Returns the list of manifest json as dicts.
+        """
+
+        pkg_names = self._convert_package_names(package_names)
+        logger.info(
+            "generating a flattened '%s' for each of the packages {%s}",
+            self.pkgdef_filename, ', '.join(pkg_names),
+        )
+
+        if explicit:
+            dists_list = [pkg_names_to_dists([name]) for name in pkg_names]
+        else:
+            # the requirements for all the packages are resolved once.
+            dists_list = map_packages_requirements_dists(pkg_names)
+        # the union of the distributions, such that the metadata for
+        # every distribution is only read once.
+        dists = []
+        seen = set()
+        for dist in (dist for items in dists_list for dist in items):
+            if id(dist) not in seen:
+                seen.add(id(dist))
+                dists.append(dist)
+        objs = dict(zip((id(dist) for dist in dists), concurrent_map(
+            lambda dist: read_dist_egginfo_json(dist, self.pkgdef_filename),
+            dists, EGGINFO_JSON_WORKERS,
+        )))
+
+        results = []
+        for pkg_name, items in zip(pkg_names, dists_list):
+            layers = EgginfoJsonLayers(
+                filename=self.pkgdef_filename, dep_keys=self.dep_keys)
+            for dist in items:
+                layers.append(dist, objs[id(dist)])
+            pkgdef_json = layers.flatten()
+            if pkgdef_json.get(
+                    self.pkg_name_field, NotImplemented) is NotImplemented:
+                pkgdef_json[self.pkg_name_field] = pkg_name
+            results.append(pkgdef_json)
+
+            if stream:
+                stream.write(jsonio.dumps(pkgdef_json, sort_keys=True))
+                stream.write('\n')
+
+        return results
+
     def pkg_manager_init(
             self, package_names,
             interactive=None,
@@ -511,7 +664,7 @@ class PackageManagerDriver(NodeDriver):
         if existed:
             try:
                 with open(pkgdef_path, 'r') as fd:
-                    original_json = json.load(fd)
+                    original_json = jsonio.load(fd)
             except ValueError:
                 logger.warning(
                     "ignoring existing malformed '%s'", pkgdef_path)
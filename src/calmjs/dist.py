@@ -7,18 +7,36 @@ dependencies for JavaScript sources that lives in Python packages.
 """
 
 from __future__ import absolute_import
-import json
+import os
 
+from collections import OrderedDict
+from collections import namedtuple
 from functools import partial
 from logging import getLogger
+from os.path import join
+from threading import Lock
+from weakref import WeakKeyDictionary
 
 from distutils.errors import DistutilsSetupError
 
+from pkg_resources import EntryPoint
 from pkg_resources import Requirement
+from pkg_resources import WorkingSet
 from pkg_resources import working_set as default_working_set
 
+from calmjs import jsonio
 from calmjs.registry import get
 from calmjs.base import BaseModuleRegistry
+from calmjs.cache import RESOLVE_CACHE_VERSION
+from calmjs.cache import BaseCache
+from calmjs.cache import JsonFileCache
+from calmjs.cache import check_stamps
+from calmjs.cache import fingerprint_working_set
+from calmjs.cache import get_resolve_cache_path
+from calmjs.cache import stamp_dirs
+from calmjs.indexer import JS_EXT
+from calmjs.indexer import globber_root
+from calmjs.utils import concurrent_map
 
 logger = getLogger(__name__)
 
@@ -26,7 +44,15 @@ logger = getLogger(__name__)
 DEFAULT_JSON = 'default.json'
 EXTRAS_CALMJS_FIELD = 'extras_calmjs'
 EXTRAS_CALMJS_JSON = 'extras_calmjs.json'
+MODULE_FILES_JSON = 'calmjs_module_files.json'
 DEP_KEYS = ('dependencies', 'devDependencies')
+EGGINFO_JSON_CACHE_SIZE = 256
+# number of threads used to read the egg-info json for a batch of
+# packages.
+EGGINFO_JSON_WORKERS = 8
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+_marker = object()
 
 
 def is_json_compat(value):
@@ -38,13 +64,13 @@ def is_json_compat(value):
     """
 
     try:
-        value = json.loads(value)
+        value = jsonio.loads(value)
     except ValueError as e:
         raise ValueError('JSON decoding error: ' + str(e))
     except TypeError:
         # Check that the value can be serialized back into json.
         try:
-            json.dumps(value)
+            jsonio.dumps(value, separators=(',', ':'))
         except TypeError as e:
             raise ValueError(
                 'must be a JSON serializable object: ' + str(e))
@@ -80,7 +106,7 @@ def write_json_file(argname, cmd, basename, filename):
     value = getattr(cmd.distribution, argname, None)
 
     if isinstance(value, dict):
-        value = json.dumps(
+        value = jsonio.dumps(
             value, indent=4, sort_keys=True, separators=(',', ': '))
 
     cmd.write_or_delete_file(argname, filename, value, force=True)
@@ -137,12 +163,330 @@ def find_packages_requirements_dists(pkg_names, working_set=None):
         r for r in (Requirement.parse(req) for req in pkg_names)
         if working_set.find(r)
     ]
-    return list(reversed(working_set.resolve(requirements)))
+    return list(reversed(resolution_cache.resolve(working_set, requirements)))
+
+
+def _markers_pass(req, extras):
+    # mirrors the evaluation done by pkg_resources.WorkingSet.resolve,
+    # with extras being the ones from the requirement that required it.
+    marker = getattr(req, 'marker', None)
+    if not marker:
+        return True
+    return any(
+        marker.evaluate({'extra': extra}) for extra in extras + (None,))
+
+
+def _replay_resolve(requirement, working_set, resolved, requires):
+    """
+    Replay the resolution of the requirement as done by the resolve
+    method of pkg_resources.WorkingSet, with the distributions looked
+    up from the working_set, or from the mapping of the distributions
+    already resolved in resolved for the ones not activated there.  The
+    requirements of the distributions are memoized in requires.  Return
+    the list of distributions in the order they would be activated, or
+    None if the requirement cannot be resolved this way.
+    """
+
+    requirements = [requirement]
+    processed = set()
+    req_extras = {}
+    best = {}
+    result = []
+    while requirements:
+        req = requirements.pop(0)
+        if req in processed:
+            continue
+        if not _markers_pass(req, req_extras.get(req, ())):
+            continue
+        dist = best.get(req.key)
+        if dist is None:
+            dist = working_set.by_key.get(req.key)
+            if dist is None:
+                dist = best[req.key] = resolved.get(req.key)
+                if dist is None:
+                    return None
+            result.append(dist)
+        if dist not in req:
+            # let the actual resolution report the conflict.
+            return None
+        key = (dist.key, tuple(req.extras))
+        new_requirements = requires.get(key)
+        if new_requirements is None:
+            new_requirements = requires[key] = dist.requires(
+                req.extras)[::-1]
+        requirements.extend(new_requirements)
+        for new_requirement in new_requirements:
+            req_extras[new_requirement] = tuple(req.extras)
+        processed.add(req)
+    return result
+
+
+def map_packages_requirements_dists(pkg_names, working_set=None):
+    """
+    Return a list with the result of find_packages_requirements_dists
+    for each of the package names on their own.  The requirements of
+    all the packages are resolved together only once, with the list for
+    each package derived from the distributions resolved.
+    """
+
+    working_set = working_set or default_working_set
+    if getattr(working_set, 'by_key', None) is None:
+        return [
+            find_packages_requirements_dists([name], working_set=working_set)
+            for name in pkg_names
+        ]
+    requirements = [Requirement.parse(req) for req in pkg_names]
+    found = [bool(working_set.find(r)) for r in requirements]
+    resolved = {
+        dist.key: dist for dist in resolution_cache.resolve(working_set, [
+            r for r, is_found in zip(requirements, found) if is_found])
+    }
+    requires = {}
+    results = []
+    for pkg_name, requirement, is_found in zip(
+            pkg_names, requirements, found):
+        if not is_found:
+            results.append([])
+            continue
+        dists = _replay_resolve(requirement, working_set, resolved, requires)
+        if dists is None:
+            dists = find_packages_requirements_dists(
+                [pkg_name], working_set=working_set)
+        else:
+            dists.reverse()
+        results.append(dists)
+    return results
+
+
+def _is_fingerprinted(working_set):
+    # distributions added without an entry or a location are not
+    # distinguished by the fingerprint of the working set.
+    by_key = getattr(working_set, 'by_key', None)
+    if by_key is None:
+        return False
+    dists = set(by_key.values())
+    return (
+        all(dist.location is not None for dist in dists) and
+        dists == set(working_set)
+    )
+
+
+def _digest_working_set(working_set):
+    """
+    Return the digest of the fingerprint of the working set, or None if
+    the working set cannot be fingerprinted.
+    """
+
+    fingerprint = fingerprint_working_set(working_set)
+    if fingerprint is None or not _is_fingerprinted(working_set):
+        return None
+    return fingerprint.digest
+
+
+class _WorkingSetDigest(object):
+    """
+    The digest of the fingerprint of a working set, memoized until a
+    distribution is added to the working set.
+    """
+
+    def __init__(self, working_set):
+        # the working set is not referenced, as this is kept alive by
+        # the working set through the subscription.
+        self._value = None
+        working_set.subscribe(self._reset, existing=False)
+
+    def _reset(self, dist):
+        self._value = None
+
+    def get(self, working_set):
+        # the sizes guard against the distributions being added to the
+        # working set without going through its add method.
+        sizes = (len(working_set.by_key), len(working_set.entries))
+        value = self._value
+        if value is None or value[0] != sizes:
+            value = self._value = (sizes, _digest_working_set(working_set))
+        return value[1]
+
+
+_working_set_digests = WeakKeyDictionary()
+_working_set_digests_lock = Lock()
+
+
+def _get_working_set_digest(working_set):
+    """
+    Return the digest of the fingerprint of the working set, or None if
+    it cannot be fingerprinted.  For actual instances of
+    ``pkg_resources.WorkingSet``, the digest is memoized.
+    """
+
+    if not isinstance(working_set, WorkingSet):
+        return _digest_working_set(working_set)
+    with _working_set_digests_lock:
+        digest = _working_set_digests.get(working_set)
+        if digest is None:
+            digest = _working_set_digests[working_set] = _WorkingSetDigest(
+                working_set)
+    return digest.get(working_set)
+
+
+def _iter_dists_metadata_paths(dists):
+    # the metadata for the requirements of the distributions, such that
+    # changes made to them in place (e.g. re-running egg_info on a
+    # development install) can be detected.
+    for dist in dists:
+        egg_info = getattr(dist, 'egg_info', None)
+        if not egg_info:
+            continue
+        yield egg_info
+        for name in ('requires.txt', 'METADATA'):
+            path = join(egg_info, name)
+            if os.path.exists(path):
+                yield path
+
+
+class ResolutionCache(JsonFileCache):
+    """
+    A cache of the distributions resolved from a list of requirements
+    against a working set, keyed by the requirements and the fingerprint
+    of the working set.
+
+    Each entry is also stamped with the mtimes of the metadata of the
+    resolved distributions, such that changes to their requirements
+    that were made in place will invalidate the entry.  The fingerprint
+    of a ``pkg_resources.WorkingSet`` is memoized until a distribution
+    is added to it.  If persistent
+    caching is enabled, the resolved results are also written to the
+    cache directory such that subsequent processes running against an
+    identical working set may reuse them.
+    """
+
+    version = RESOLVE_CACHE_VERSION
+
+    def _lookup(self, working_set, key):
+        entry = self._entries.get(key)
+        if not isinstance(entry, dict):
+            return None
+        dists = []
+        for dist_key, location in entry['dists']:
+            dist = working_set.by_key.get(dist_key)
+            if dist is None or dist.location != location:
+                return None
+            dists.append(dist)
+        if not check_stamps(entry['stamps']):
+            return None
+        return dists
+
+    def resolve(self, working_set, requirements):
+        """
+        Return the list of distributions as resolved by the working_set
+        for the requirements.
+        """
+
+        digest = _get_working_set_digest(working_set)
+        if digest is None:
+            return working_set.resolve(requirements)
+
+        key = '\n'.join(str(req) for req in requirements)
+        with self._lock:
+            self._load(get_resolve_cache_path(), digest)
+            dists = self._lookup(working_set, key)
+            if dists is not None:
+                self.hits += 1
+                return dists
+            self.misses += 1
+
+        dists = working_set.resolve(requirements)
+        with self._lock:
+            if self.key == digest:
+                self._entries[key] = {
+                    'dists': [[dist.key, dist.location] for dist in dists],
+                    'stamps': stamp_dirs(_iter_dists_metadata_paths(dists)),
+                }
+                self._save()
+        return dists
+
+
+resolution_cache = ResolutionCache()
+
+
+class EggInfoJsonCache(BaseCache):
+    """
+    A bounded cache of the parsed json files from the egg-info of the
+    distributions, with the least recently used entries evicted first.
+    """
+
+    entries_factory = OrderedDict
+
+    def __init__(self, maxsize=EGGINFO_JSON_CACHE_SIZE):
+        self.maxsize = maxsize
+        super(EggInfoJsonCache, self).__init__()
+
+    def get(self, key):
+        """
+        Return the cached value for the key, or _marker if not found.
+        """
+
+        with self._lock:
+            value = self._entries.pop(key, _marker)
+            if value is _marker:
+                self.misses += 1
+                return _marker
+            self._entries[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def info(self):
+        return CacheInfo(
+            self.hits, self.misses, self.maxsize, len(self._entries))
+
+
+egginfo_json_cache = EggInfoJsonCache()
+
+
+def _copy_json(obj):
+    """
+    Copy the structure produced by json.loads.
+    """
+
+    if isinstance(obj, dict):
+        return {key: _copy_json(value) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [_copy_json(value) for value in obj]
+    return obj
+
+
+def _egginfo_json_cache_key(dist, filename):
+    """
+    Return the key for the egginfo_json_cache for the file, or None if
+    the file does not exist on the filesystem.
+    """
+
+    egg_info = getattr(dist, 'egg_info', None)
+    if not egg_info:
+        return None
+    try:
+        st = os.stat(join(egg_info, filename))
+    except (OSError, TypeError):
+        return None
+    # the path to the egg-info is also used as multiple distributions
+    # may share the same location.
+    return (dist.location, egg_info, filename, st.st_mtime, st.st_size)
 
 
 def read_dist_egginfo_json(dist, filename=DEFAULT_JSON):
     """
     Safely get a json within an egginfo from a distribution.
+
+    Results read from files are memoized in egginfo_json_cache for as
+    long as the mtime and size of the file remain unchanged; a copy is
+    always returned such that the cached results remain unmodified.
     """
 
     # use the given package's distribution to acquire the json file.
@@ -150,6 +494,13 @@ def read_dist_egginfo_json(dist, filename=DEFAULT_JSON):
         logger.debug("no '%s' for '%s'", filename, dist)
         return
 
+    key = _egginfo_json_cache_key(dist, filename)
+    if key is not None:
+        obj = egginfo_json_cache.get(key)
+        if obj is not _marker:
+            logger.debug("found '%s' for '%s' (cached).", filename, dist)
+            return _copy_json(obj)
+
     try:
         result = dist.get_metadata(filename)
     except IOError:
@@ -157,13 +508,16 @@ def read_dist_egginfo_json(dist, filename=DEFAULT_JSON):
         return
 
     try:
-        obj = json.loads(result)
+        obj = jsonio.loads(result)
     except (TypeError, ValueError):
         logger.error(
             "the '%s' found in '%s' is not a valid json.", filename, dist)
         return
 
     logger.debug("found '%s' for '%s'.", filename, dist)
+    if key is not None:
+        egginfo_json_cache.put(key, obj)
+        return _copy_json(obj)
     return obj
 
 
@@ -178,9 +532,160 @@ def read_egginfo_json(pkg_name, filename=DEFAULT_JSON, working_set=None):
     return read_dist_egginfo_json(dist, filename)
 
 
+class EgginfoJsonLayers(object):
+    """
+    The egg-info json of a list of distributions, stacked as layers in
+    the order they were appended, such that the values under each of
+    the dep_keys provided by a later layer will shadow the ones from
+    the earlier layers.
+
+    The layer that provided the effective value of every key is tracked,
+    such that the value and its source distribution can be looked up
+    directly, and that only the keys that are shadowed by a layer need
+    to be recomputed when the egg-info json of that layer is updated.
+    """
+
+    def __init__(self, filename=DEFAULT_JSON, dep_keys=DEP_KEYS):
+        self.filename = filename
+        self.dep_keys = dep_keys
+        self.dists = []
+        self.objs = []
+        self._positions = {}
+        # for each of the dep_keys, the mapping of the names to the
+        # position of the top-most layer that provided it.
+        self._sources = {dep: {} for dep in dep_keys}
+
+    def _layer_deps(self, position, dep):
+        obj = self.objs[position]
+        if not obj:
+            return {}
+        return obj.get(dep, {})
+
+    def _resolve(self, dep, name):
+        sources = self._sources[dep]
+        for position in reversed(range(len(self.objs))):
+            if name in self._layer_deps(position, dep):
+                sources[name] = position
+                return
+        sources.pop(name, None)
+
+    def append(self, dist, obj):
+        """
+        Append the egg-info json obj read from the dist as the top layer.
+        """
+
+        position = len(self.objs)
+        self.dists.append(dist)
+        self.objs.append(obj)
+        self._positions[dist.key] = position
+        if not obj:
+            return
+
+        logger.debug("merging '%s' for required '%s'", self.filename, dist)
+        for dep in self.dep_keys:
+            sources = self._sources[dep]
+            for name in self._layer_deps(position, dep):
+                sources[name] = position
+
+    def update(self, dist, obj):
+        """
+        Replace the egg-info json of the layer for the dist with obj.
+        Only the keys provided by the previous and the new egg-info json
+        will be resolved again.  Return the set of the 2-tuples of dep
+        key and name that had their effective value or source changed.
+        """
+
+        position = self._positions[dist.key]
+        previous = {
+            dep: self._layer_deps(position, dep) for dep in self.dep_keys}
+        before = {
+            (dep, name): self.lookup(dep, name)
+            for dep in self.dep_keys for name in previous[dep]
+        }
+        self.dists[position] = dist
+        self.objs[position] = obj
+
+        changed = set()
+        for dep in self.dep_keys:
+            names = set(previous[dep])
+            names.update(self._layer_deps(position, dep))
+            for name in names:
+                self._resolve(dep, name)
+                if self.lookup(dep, name) != before.get((dep, name)):
+                    changed.add((dep, name))
+        return changed
+
+    def refresh(self, dist):
+        """
+        Read the egg-info json of the dist again and update its layer.
+        Return value is the same as update.
+        """
+
+        return self.update(dist, read_dist_egginfo_json(dist, self.filename))
+
+    def lookup(self, dep, name):
+        """
+        Return the 2-tuple of the effective value and the source dist of
+        the name under the dep key, or None if no layers provided it.
+        """
+
+        position = self._sources[dep].get(name)
+        if position is None:
+            return None
+        return self.objs[position][dep][name], self.dists[position]
+
+    def flatten(self):
+        """
+        Produce the flattened egg-info json, as documented for the
+        flatten_dist_egginfo_json function.
+        """
+
+        depends = {
+            dep: {
+                name: self.objs[position][dep][name]
+                for name, position in self._sources[dep].items()
+            } for dep in self.dep_keys
+        }
+
+        obj = self.objs[-1] if self.objs else {}
+        if obj is None:
+            # top level object does not have egg-info defined
+            return depends
+
+        obj = _copy_json(obj)
+        for dep in self.dep_keys:
+            # filtering out all the nulls.
+            obj[dep] = {k: v for k, v in depends[dep].items() if v is not None}
+        return obj
+
+
+def layer_dist_egginfo_json(
+        source_dists, filename=DEFAULT_JSON, dep_keys=DEP_KEYS,
+        workers=None):
+    """
+    Return the EgginfoJsonLayers for the egg-info json of source_dists.
+
+    If workers is greater than one, the metadata of all the
+    distributions are read concurrently using a pool of at most that
+    many threads, however they are always layered in the order of the
+    source_dists provided.
+    """
+
+    source_dists = list(source_dists)
+    objs = concurrent_map(
+        lambda dist: read_dist_egginfo_json(dist, filename),
+        source_dists, workers)
+    layers = EgginfoJsonLayers(filename=filename, dep_keys=dep_keys)
+    # Go from the earliest package down to the latest one, as we will
+    # flatten children's d(evD)ependencies on top of parent's.
+    for dist, obj in zip(source_dists, objs):
+        layers.append(dist, obj)
+    return layers
+
+
 def flatten_dist_egginfo_json(
         source_dists, filename=DEFAULT_JSON, dep_keys=DEP_KEYS,
-        working_set=None):
+        working_set=None, workers=None):
     """
     Flatten a distribution's egginfo json, with the depended keys to be
     flattened.
@@ -203,38 +708,18 @@ def flatten_dist_egginfo_json(
     dependency management.
 
     Flat is better than nested.
+
+    If workers is greater than one, the metadata of all the
+    distributions are read concurrently using a pool of at most that
+    many threads, however they are always merged in the order of the
+    source_dists provided.  To find out which of the
+    distributions provided a given key, use layer_dist_egginfo_json.
     """
 
     working_set = working_set or default_working_set
-    obj = {}
-
-    # TODO figure out the best way to explicitly report back to caller
-    # how the keys came to be (from which dist).  Perhaps create a
-    # detailed function based on this, retain this one to return the
-    # distilled results.
-
-    depends = {dep: {} for dep in dep_keys}
-
-    # Go from the earliest package down to the latest one, as we will
-    # flatten children's d(evD)ependencies on top of parent's.
-    for dist in source_dists:
-        obj = read_dist_egginfo_json(dist, filename)
-        if not obj:
-            continue
-
-        logger.debug("merging '%s' for required '%s'", filename, dist)
-        for dep in dep_keys:
-            depends[dep].update(obj.get(dep, {}))
-
-    if obj is None:
-        # top level object does not have egg-info defined
-        return depends
-
-    for dep in dep_keys:
-        # filtering out all the nulls.
-        obj[dep] = {k: v for k, v in depends[dep].items() if v is not None}
-
-    return obj
+    return layer_dist_egginfo_json(
+        source_dists, filename=filename, dep_keys=dep_keys, workers=workers,
+    ).flatten()
 
 
 def flatten_egginfo_json(
@@ -307,10 +792,7 @@ def get_module_registry_dependencies(
     registry = get(registry_key)
     if not isinstance(registry, BaseModuleRegistry):
         return {}
-    result = {}
-    for pkg_name in pkg_names:
-        result.update(registry.get_records_for_package(pkg_name))
-    return result
+    return registry.get_records_for_packages(pkg_names)
 
 
 def flatten_module_registry_dependencies(
@@ -321,14 +803,110 @@ def flatten_module_registry_dependencies(
     """
 
     working_set = working_set or default_working_set
-    result = {}
     registry = get(registry_key)
     if not isinstance(registry, BaseModuleRegistry):
-        return result
+        return {}
 
     dists = find_packages_requirements_dists(
         pkg_names, working_set=working_set)
-    for dist in dists:
-        result.update(registry.get_records_for_package(dist.project_name))
+    return registry.get_records_for_packages(
+        dist.project_name for dist in dists)
 
-    return result
+
+def _iter_module_registry_entry_points(cmd):
+    """
+    Yield the entry points declared by the distribution of the cmd for
+    the registries that are module registries.
+    """
+
+    entry_point_map = EntryPoint.parse_map(
+        cmd.distribution.entry_points or {})
+    registries = {
+        entry_point.name: entry_point
+        for entry_point in get('calmjs.registry').raw_entry_points
+    }
+    registries.update(entry_point_map.get('calmjs.registry', {}))
+
+    for group, entry_points in sorted(entry_point_map.items()):
+        registry_entry_point = registries.get(group)
+        if registry_entry_point is None:
+            continue
+        try:
+            cls = registry_entry_point.resolve()
+        except (ImportError, AttributeError):
+            logger.debug(
+                "cannot resolve the registry for '%s'; skipping", group)
+            continue
+        if not (isinstance(cls, type) and
+                issubclass(cls, BaseModuleRegistry)):
+            continue
+        for name in sorted(entry_points):
+            yield entry_points[name]
+
+
+def write_module_files(cmd, basename, filename):
+    """
+    Write the listing of the JavaScript files for every module declared
+    for the module registries by the distribution into its egg-info
+    directory, such that the module registries may use the listing
+    instead of scanning the directories of the modules.
+    """
+
+    build_py = cmd.get_finalized_command('build_py')
+    listings = {}
+    for entry_point in _iter_module_registry_entry_points(cmd):
+        module_name = entry_point.module_name
+        if module_name in listings:
+            continue
+        root = build_py.get_package_dir(module_name)
+        if not os.path.isdir(root):
+            continue
+        listings[module_name] = sorted(
+            os.path.relpath(path, root).replace(os.sep, '/')
+            for path in globber_root(root, '*' + JS_EXT)
+        )
+
+    value = None
+    if listings:
+        value = jsonio.dumps(
+            listings, indent=4, sort_keys=True, separators=(',', ': '))
+    cmd.write_or_delete_file('module files', filename, value, force=True)
+
+
+def _is_develop_dist(dist):
+    """
+    Return True if the dist is a development install, where the files
+    of the modules may no longer reflect what is recorded in the
+    metadata.
+    """
+
+    if (dist.location or '').lower().endswith('.egg'):
+        # an installed egg.
+        return False
+    if dist.has_metadata('RECORD'):
+        # an installed wheel, which may be an editable install.
+        try:
+            direct_url = jsonio.loads(dist.get_metadata('direct_url.json'))
+            return bool(direct_url['dir_info']['editable'])
+        except (IOError, OSError, KeyError, TypeError, ValueError):
+            return False
+    return not dist.has_metadata('installed-files.txt')
+
+
+def read_dist_module_files(dist, module_name):
+    """
+    Return the list of paths of the JavaScript files, relative to the
+    module identified by module_name, as recorded in the egg-info of
+    the dist.  Returns None if a listing is not available, or if the
+    dist is a development install.
+    """
+
+    if dist is None or _is_develop_dist(dist):
+        return None
+    listings = read_dist_egginfo_json(dist, MODULE_FILES_JSON)
+    if not isinstance(listings, dict):
+        return None
+    listing = listings.get(module_name)
+    if not isinstance(listing, list):
+        return None
+    return listing
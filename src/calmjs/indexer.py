@@ -7,18 +7,52 @@ from __future__ import absolute_import
 
 import fnmatch
 import pkg_resources
+import sys
+import zipfile
 
+from contextlib import contextmanager
 from logging import getLogger
 from glob import iglob
+from types import ModuleType
+from os.path import dirname
+from os.path import isdir
 from os.path import join
 from os.path import relpath
 from os.path import sep
 from os import walk
+from threading import local
+from zipimport import zipimporter
+
+from calmjs.utils import split_zip_path
+
+try:
+    from os import scandir
+except ImportError:  # pragma: no cover
+    scandir = None
+
+try:
+    from importlib.util import find_spec
+except ImportError:  # pragma: no cover
+    find_spec = None
 
 logger = getLogger(__name__)
 
+if sys.version_info < (3,):  # pragma: no cover
+    str = basestring  # noqa: F821
+
 JS_EXT = '.js'
 
+# Directory names that will not be descended into by globber_scandir
+PRUNE_DIRS = (
+    'node_modules', '__pycache__', '.git', '.hg', '.svn', '.bzr', 'CVS',
+)
+# Name of the file at the root of the globbed directory that specify
+# additional patterns of files and directories to ignore.
+IGNORE_FILE = '.calmjsignore'
+
+# the directories listed by the globbers, for record_walked_dirs.
+_walked = local()
+
 _utils = {
     'modpath': {},
     'globber': {},
@@ -27,9 +61,88 @@ _utils = {
 }
 
 
+@contextmanager
+def record_walked_dirs():
+    """
+    Context manager that provides a set, which will be populated with
+    the directories that the globbers have listed within the current
+    thread while the context is active; for recursive globbers this
+    will include the directories that contain no matching files, such
+    that the addition of a new file anywhere within may be detected by
+    the change in the mtime of the directories.
+    """
+
+    parent = getattr(_walked, 'dirs', None)
+    dirs = _walked.dirs = set()
+    try:
+        yield dirs
+    finally:
+        _walked.dirs = parent
+        if parent is not None:
+            parent.update(dirs)
+
+
+def _record_walked_dir(path):
+    dirs = getattr(_walked, 'dirs', None)
+    if dirs is not None:
+        dirs.add(path)
+
+
+def _modgen_ext(module,
+                modpath='last', globber='root', fext=JS_EXT,
+                registry=_utils, globber_kw=None):
+    """
+    The implementation for _modgen, with the matched filename extension
+    included as the fourth element of the yielded tuples.
+
+    If fext is a collection of filename extensions, the globber will be
+    invoked only once for every module base path, with the results then
+    bucketed by the matching filename extension; the longest extension
+    is matched first.
+    """
+
+    globber_f = registry['globber'][globber]
+    modpath_f = registry['modpath'][modpath]
+    globber_kw = globber_kw or {}
+
+    if isinstance(fext, str):
+        fexts = [fext]
+    else:
+        fexts = sorted(set(fext), key=len, reverse=True)
+    # only a single traversal is done for all the extensions.
+    patt = '*' + fexts[0] if len(fexts) == 1 else '*'
+
+    logger.debug(
+        'modgen generating file listing for module %s',
+        module.__name__,
+    )
+
+    module_frags = module.__name__.split('.')
+    module_base_paths = modpath_f(module)
+
+    for module_base_path in module_base_paths:
+        logger.debug(
+            'searching for *%s files in %s',
+            ', *'.join(fexts), module_base_path,
+        )
+        for path in globber_f(module_base_path, patt, **globber_kw):
+            for ext in fexts:
+                if path.endswith(ext):
+                    break
+            else:
+                continue
+            mod_path = (relpath(path, module_base_path))
+            yield (
+                module_frags + mod_path[:-len(ext)].split(sep),
+                module_base_path,
+                mod_path,
+                ext,
+            )
+
+
 def _modgen(module,
             modpath='last', globber='root', fext=JS_EXT,
-            registry=_utils):
+            registry=_utils, globber_kw=None):
     """
     JavaScript styled module location listing generator.
 
@@ -50,11 +163,17 @@ def _modgen(module,
         one that will only glob the local path.
 
     fext
-        The filename extension to match.  Defaults to `.js`.
+        The filename extension to match.  Defaults to `.js`.  A
+        collection of extensions may be provided, in which case the
+        files for all of them will be found in a single traversal.
 
     registry
         The "registry" to extract the functions from
 
+    globber_kw
+        The additional keyword arguments for the globber, e.g. the
+        prune and ignore_file arguments for the scandir globber.
+
     Yields 3-tuples of
 
     - raw list of module name fragments
@@ -64,26 +183,51 @@ def _modgen(module,
     For each of the module basepath and source files the globber finds.
     """
 
-    globber_f = registry['globber'][globber]
-    modpath_f = registry['modpath'][modpath]
+    for modname_fragments, base, subpath, ext in _modgen_ext(
+            module, modpath, globber, fext, registry, globber_kw):
+        yield modname_fragments, base, subpath
 
-    logger.debug(
-        'modgen generating file listing for module %s',
-        module.__name__,
-    )
 
-    module_frags = module.__name__.split('.')
-    module_base_paths = modpath_f(module)
+def resolve_module(module_name):
+    """
+    Return the module identified by module_name, without executing the
+    module if possible.
 
-    for module_base_path in module_base_paths:
-        logger.debug('searching for *%s files in %s', fext, module_base_path)
-        for path in globber_f(module_base_path, '*' + fext):
-            mod_path = (relpath(path, module_base_path))
-            yield (
-                module_frags + mod_path[:-len(fext)].split(sep),
-                module_base_path,
-                mod_path,
-            )
+    If the module is not already imported, the import system is queried
+    for its spec, and if it provides search locations (i.e. it is a
+    package) a stand-in module with the attributes from the spec will be
+    returned, such that the modpath functions can locate the paths of
+    the package.  Note that parent packages will still be imported.
+    Otherwise, the module will be imported as normal.
+
+    Raises ImportError if the module cannot be found.
+    """
+
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return module
+
+    if find_spec is not None:
+        try:
+            spec = find_spec(module_name)
+        except ValueError:  # pragma: no cover
+            # e.g. for modules without a valid __spec__
+            spec = None
+        else:
+            if spec is None:
+                raise ImportError('no module named %r' % module_name)
+        if spec is not None and spec.submodule_search_locations:
+            logger.debug(
+                "resolved module '%s' without import", module_name)
+            module = ModuleType(module_name)
+            module.__spec__ = spec
+            module.__loader__ = spec.loader
+            module.__path__ = list(spec.submodule_search_locations)
+            if spec.has_location:
+                module.__file__ = spec.origin
+            return module
+
+    return __import__(module_name, fromlist=['__name__'], level=0)
 
 
 def register(util_type, registry=_utils):
@@ -144,10 +288,18 @@ def modpath_pkg_resources(module):
     """
     Goes through pkg_resources for compliance with various PEPs.
 
-    This one accepts a module as argument.
+    This one accepts a module as argument.  If the module is a stand-in
+    produced by resolve_module, the paths are derived from its spec
+    rather than having pkg_resources import the actual module.
     """
 
     try:
+        if (getattr(module, '__spec__', None) is not None and
+                sys.modules.get(module.__name__) is not module):
+            module_file = getattr(module, '__file__', None)
+            if module_file:
+                return [dirname(module_file)]
+            return list(module.__path__)[-1:]
         return [pkg_resources.resource_filename(module.__name__, '')]
     except ImportError:
         logger.warning("%r could not be located as a module", module)
@@ -157,18 +309,183 @@ def modpath_pkg_resources(module):
     return []
 
 
+@register('modpath')
+def modpath_zip(module):
+    """
+    Zip aware variant of modpath_pkg_resources.  For modules imported
+    from a zip archive, the virtual path into the archive will be
+    provided, rather than having pkg_resources extract the contents of
+    the archive into the egg cache.  Use with globber_zip.
+    """
+
+    if isinstance(getattr(module, '__loader__', None), zipimporter):
+        module_file = getattr(module, '__file__', None)
+        if module_file:
+            return [dirname(module_file)]
+    return modpath_pkg_resources(module)
+
+
 @register('globber')
 def globber_root(root, patt):
+    _record_walked_dir(root)
     return iglob(join(root, patt))
 
 
+@register('globber')
+def globber_zip(root, patt):
+    """
+    Zip aware variant of globber_root.  If root is a virtual path that
+    leads into a zip archive, the members are listed directly from the
+    central directory of the archive and the resulting virtual paths
+    are generated.  Otherwise, this is equivalent to globber_root.
+    """
+
+    if isdir(root):
+        return globber_root(root, patt)
+
+    split = split_zip_path(root)
+    if split is None:
+        return iter([])
+
+    archive, prefix = split
+    # the archive must be rewritten for its members to change.
+    _record_walked_dir(archive)
+    prefix = prefix + '/'
+    with zipfile.ZipFile(archive) as zf:
+        names = zf.namelist()
+    return (
+        join(archive, *name.split('/'))
+        for name in names
+        if name.startswith(prefix) and
+        '/' not in name[len(prefix):] and
+        fnmatch.fnmatch(name[len(prefix):], patt)
+    )
+
+
 @register('globber')
 def globber_recursive(root, patt):
     for root, dirnames, filenames in walk(root):
+        _record_walked_dir(root)
         for filename in fnmatch.filter(filenames, patt):
             yield join(root, filename)
 
 
+def read_ignore_file(root, ignore_file=IGNORE_FILE):
+    """
+    Read the ignore file located at root and return the list of patterns
+    within.  Blank lines and lines starting with ``#`` are skipped.
+    """
+
+    try:
+        with open(join(root, ignore_file)) as fd:
+            lines = fd.read().splitlines()
+    except (IOError, OSError):
+        return []
+
+    results = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        results.append(line.rstrip('/'))
+    logger.debug("using ignore patterns %r from '%s'", results, root)
+    return results
+
+
+def _make_ignore_check(patterns):
+    name_patts = [p for p in patterns if '/' not in p]
+    path_patts = [p for p in patterns if '/' in p]
+
+    def is_ignored(name, path):
+        # path is the relative path with '/' separators.
+        return (
+            any(fnmatch.fnmatch(name, p) for p in name_patts) or
+            any(fnmatch.fnmatch(path, p) for p in path_patts)
+        )
+
+    return is_ignored
+
+
+def _scandir_tree(root, is_ignored):
+    stack = [('', root)]
+    while stack:
+        prefix, current = stack.pop()
+        _record_walked_dir(current)
+        try:
+            entries = sorted(scandir(current), key=lambda e: e.name)
+        except OSError:
+            logger.debug("cannot list directory '%s'", current)
+            continue
+        subdirs = []
+        for entry in entries:
+            path = prefix + entry.name
+            if is_ignored(entry.name, path):
+                continue
+            try:
+                is_dir = entry.is_dir()
+            except OSError:  # pragma: no cover
+                continue
+            if is_dir:
+                # like os.walk, do not follow symlinks to directories.
+                if not entry.is_symlink():
+                    subdirs.append((path + '/', entry.path))
+            else:
+                yield entry
+        stack.extend(reversed(subdirs))
+
+
+def _walk_tree(root, is_ignored):  # pragma: no cover
+    # fallback for platforms without os.scandir
+    for dirpath, dirnames, filenames in walk(root):
+        _record_walked_dir(dirpath)
+        prefix = relpath(dirpath, root).replace(sep, '/')
+        prefix = '' if prefix == '.' else prefix + '/'
+        dirnames[:] = sorted(
+            d for d in dirnames if not is_ignored(d, prefix + d))
+        for filename in sorted(filenames):
+            if not is_ignored(filename, prefix + filename):
+                yield join(dirpath, filename), filename
+
+
+@register('globber')
+def globber_scandir(root, patt, prune=PRUNE_DIRS, ignore_file=IGNORE_FILE):
+    """
+    A recursive globber that will not descend into directories with
+    names matching the patterns in prune, and also honors the patterns
+    specified in the ignore_file found at root.  Patterns that contain
+    a ``/`` are matched against the path relative to root, otherwise
+    only the name of the file or directory is matched.
+
+    Where available, ``os.scandir`` will be used so that the results of
+    the underlying directory listing are reused.
+
+    The default PRUNE_DIRS do not include the directories for tests or
+    their fixtures, as their names vary and they may legitimately ship
+    JavaScript; to prune them, provide the arguments through the
+    globber_kw of the mapper, e.g. as the mapper of a module registry::
+
+        self.mapper = partial(mapper, globber='scandir', globber_kw={
+            'prune': PRUNE_DIRS + ('tests', 'fixtures')})
+    """
+
+    patterns = list(prune)
+    if ignore_file:
+        # modifications to the file will not change the directory.
+        _record_walked_dir(join(root, ignore_file))
+        patterns.extend(read_ignore_file(root, ignore_file))
+    is_ignored = _make_ignore_check(patterns)
+
+    if scandir is None:  # pragma: no cover
+        for path, name in _walk_tree(root, is_ignored):
+            if fnmatch.fnmatch(name, patt):
+                yield path
+        return
+
+    for entry in _scandir_tree(root, is_ignored):
+        if fnmatch.fnmatch(entry.name, patt):
+            yield entry.path
+
+
 @register('modname')
 def modname_es6(fragments):
     """
@@ -188,11 +505,12 @@ def modname_python(fragments):
 
 
 def mapper(module, modpath='last', globber='root', modname='es6',
-           registry=_utils):
+           registry=_utils, fext=JS_EXT, globber_kw=None):
     """
     General mapper
 
-    Loads components from the micro registry.
+    Loads components from the micro registry.  The globber_kw are the
+    additional keyword arguments for the globber.
     """
 
     modname_f = _utils['modname'][modname]
@@ -200,7 +518,55 @@ def mapper(module, modpath='last', globber='root', modname='es6',
     return {
         modname_f(modname_fragments): join(base, subpath)
         for modname_fragments, base, subpath in _modgen(
-            module, modpath, globber)
+            module, modpath, globber, fext, globber_kw=globber_kw)
+    }
+
+
+def mapper_exts(module, fexts, modpath='last', globber='root',
+                modname='es6', registry=_utils, globber_kw=None):
+    """
+    Multiple filename extension mapper
+
+    Like mapper, but all files matching any of the filename extensions
+    in fexts are found in a single traversal, and the results are
+    returned as a dict keyed by the filename extension, with each value
+    being the mapping of module names to the files for that extension.
+    """
+
+    modname_f = _utils['modname'][modname]
+    results = {fext: {} for fext in fexts}
+
+    for modname_fragments, base, subpath, ext in _modgen_ext(
+            module, modpath, globber, fexts, globber_kw=globber_kw):
+        results[ext][modname_f(modname_fragments)] = join(base, subpath)
+
+    return results
+
+
+def mapper_listing(module, listing, modpath='last', modname='es6',
+                   registry=_utils, fext=JS_EXT):
+    """
+    Listing mapper
+
+    Like mapper, but rather than globbing for the files, the paths to
+    the files relative to the module are provided through listing, with
+    ``/`` as the separator.  Returns None if the module does not have
+    exactly one base path.
+    """
+
+    modpath_f = registry['modpath'][modpath]
+    modname_f = registry['modname'][modname]
+
+    module_base_paths = modpath_f(module)
+    if len(module_base_paths) != 1:
+        return None
+
+    base = module_base_paths[0]
+    module_frags = module.__name__.split('.')
+    return {
+        modname_f(module_frags + subpath[:-len(fext)].split('/')):
+            join(base, *subpath.split('/'))
+        for subpath in listing if subpath.endswith(fext)
     }
 
 
@@ -213,7 +579,7 @@ def mapper_es6(module):
     a list of importable JS modules using the es6 module import format.
     """
 
-    return mapper(module, 'pkg_resources', 'root', 'es6')
+    return mapper(module, 'zip', 'zip', 'es6')
 
 
 @register('mapper')
@@ -225,4 +591,4 @@ def mapper_python(module):
     a list of importable JS modules using the es6 module import format.
     """
 
-    return mapper(module, 'pkg_resources', 'root', 'python')
+    return mapper(module, 'zip', 'zip', 'python')
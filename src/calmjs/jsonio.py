@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+JSON serialization for calmjs.
+
+The functions here mirror the ones provided by the json module from the
+standard library, but they will make use of an accelerated backend if
+one is available (currently ``orjson``).  The results are identical to
+the ones produced by the json module; any input that the backend cannot
+handle in an identical manner (e.g. floats, whose textual forms differ,
+integers beyond 64 bits, or dict keys that are not strings) will be
+passed to the json module.
+
+The backend may be selected through the ``CALMJS_JSON_BACKEND``
+environment variable; set it to ``json`` to always use the json module.
+"""
+
+from __future__ import absolute_import
+
+import json
+import os
+import re
+import sys
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+CALMJS_JSON_BACKEND = 'CALMJS_JSON_BACKEND'
+
+if sys.version_info < (3,):  # pragma: no cover
+    _str_types = (unicode,)  # noqa: F821
+    _bytes_types = (str, bytearray)
+else:
+    _str_types = (str,)
+    _bytes_types = (bytes, bytearray)
+
+_scalar_types = frozenset(_str_types + (int, bool, type(None)))
+_non_ascii = re.compile(u'[^\x00-\x7e]')
+# a run of digits long enough to possibly be an integer beyond 64 bits.
+_long_digits = re.compile(u'[0-9]{19,}')
+_long_digits_bytes = re.compile(b'[0-9]{19,}')
+
+
+def _escape_non_ascii(match):
+    # as per json.encoder.py_encode_basestring_ascii
+    n = ord(match.group(0))
+    if n < 0x10000:
+        return '\\u{0:04x}'.format(n)
+    n -= 0x10000
+    return '\\u{0:04x}\\u{1:04x}'.format(
+        0xd800 | ((n >> 10) & 0x3ff), 0xdc00 | (n & 0x3ff))
+
+
+def _reindent(text, indent):
+    """
+    Convert the text indented by 2 spaces per level to indent spaces.
+    """
+
+    # no line may start within a string as the newlines within will be
+    # escaped, so all spaces following a newline are the indentation;
+    # the deepest level is replaced first with a placeholder (the raw
+    # control characters will also be escaped) such that the shallower
+    # levels will not match them.
+    depth = 0
+    while '\n' + '  ' * (depth + 1) in text:
+        depth += 1
+    for level in range(depth, 0, -1):
+        text = text.replace('\n' + '  ' * level, '\n' + '\x00' * level)
+    return text.replace('\x00', ' ' * indent)
+
+
+def _is_plain(obj):
+    """
+    Check that obj is only composed of dicts with string keys, lists,
+    strings, ints, booleans and None.
+    """
+
+    stack = [obj]
+    while stack:
+        value = stack.pop()
+        value_type = type(value)
+        if value_type is dict:
+            for key in value:
+                if type(key) not in _str_types:
+                    return False
+            stack.extend(value.values())
+        elif value_type is list:
+            stack.extend(value)
+        elif value_type not in _scalar_types:
+            return False
+    return True
+
+
+class OrjsonBackend(object):
+    """
+    The backend for orjson.
+    """
+
+    def loads(self, s):
+        # orjson converts integers beyond 64 bits into floats.
+        pattern = _long_digits if isinstance(s, _str_types) else (
+            _long_digits_bytes)
+        if pattern.search(s):
+            raise ValueError('document may contain integers beyond 64 bits')
+        return orjson.loads(s)
+
+    def dumps(self, obj, indent=None, sort_keys=False):
+        option = orjson.OPT_SORT_KEYS if sort_keys else 0
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        result = orjson.dumps(obj, option=option).decode('utf-8')
+        if '\x7f' in result or not result.isascii():
+            result = _non_ascii.sub(_escape_non_ascii, result)
+        if indent and indent != 2:
+            result = _reindent(result, indent)
+        return result
+
+
+_backends = {}
+_default_backend = []
+
+
+def register_backend(name, backend):
+    """
+    Register a backend under the name, which will become the default.
+    The backend must provide the loads and dumps methods as defined in
+    OrjsonBackend, and raise ValueError or TypeError for anything that
+    it cannot handle.
+    """
+
+    _backends[name] = backend
+    _default_backend[:] = [backend]
+
+
+if orjson is not None:
+    register_backend('orjson', OrjsonBackend())
+
+
+def get_backend():
+    """
+    Return the backend in use, or None if the json module is to be used
+    directly.
+    """
+
+    name = os.environ.get(CALMJS_JSON_BACKEND)
+    if name:
+        return _backends.get(name)
+    return _default_backend[0] if _default_backend else None
+
+
+def _is_compatible(indent, separators):
+    if indent is None:
+        return separators == (',', ':')
+    if type(indent) is not int or indent < 1:
+        return False
+    return separators == (',', ': ') or (
+        separators is None and sys.version_info >= (3,))
+
+
+def loads(s):
+    """
+    Deserialize s, a str or bytes containing a JSON document, to a
+    Python object.
+    """
+
+    backend = get_backend()
+    if backend is not None and isinstance(s, _str_types + _bytes_types):
+        try:
+            return backend.loads(s)
+        except ValueError:
+            # let json produce the result or the error.
+            pass
+    return json.loads(s)
+
+
+def load(fp):
+    """
+    Deserialize the contents of fp to a Python object.
+    """
+
+    return loads(fp.read())
+
+
+def dumps(obj, indent=None, sort_keys=False, separators=None):
+    """
+    Serialize obj to a JSON formatted str.
+    """
+
+    backend = get_backend()
+    if (backend is not None and _is_compatible(indent, separators) and
+            _is_plain(obj)):
+        try:
+            return backend.dumps(obj, indent=indent, sort_keys=sort_keys)
+        except (TypeError, ValueError):
+            pass
+    return json.dumps(
+        obj, indent=indent, sort_keys=sort_keys, separators=separators)
+
+
+def dump(obj, fp, indent=None, sort_keys=False, separators=None):
+    """
+    Serialize obj as a JSON formatted stream to fp.
+    """
+
+    fp.write(dumps(
+        obj, indent=indent, sort_keys=sort_keys, separators=separators))
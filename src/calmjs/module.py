@@ -11,8 +11,18 @@ from __future__ import absolute_import
 
 from calmjs.base import BaseRegistry
 from calmjs.base import BaseModuleRegistry
+from calmjs.dist import read_dist_module_files
 from calmjs.indexer import mapper_es6
+from calmjs.indexer import mapper_listing
 from calmjs.indexer import mapper_python
+from calmjs.indexer import resolve_module
+
+# the default mappers, and the modname that each of them produce, where
+# the file listings recorded in the egg-info may be used instead.
+_listing_modnames = {
+    mapper_es6: 'es6',
+    mapper_python: 'python',
+}
 
 
 class ExtrasJsonKeysRegistry(BaseRegistry):
@@ -40,7 +50,10 @@ class ModuleRegistry(BaseModuleRegistry):
     Subclass can either override ``_init`` completely to specify its own
     mapper, or override `_map_entry_point_module`` and use the same
     mapper but modify its results before returning for usage by parent
-    class.
+    class.  With the default mapper, the listing of the files recorded
+    in the egg-info of the distribution at build time will be used in
+    place of scanning the directory of the module, unless it is a
+    development install.
 
     This is to be registered in calmjs.registry entry point as
     ``calmjs.module``.
@@ -49,7 +62,20 @@ class ModuleRegistry(BaseModuleRegistry):
     def _init(self):
         self.mapper = mapper_es6
 
+    def _load_entry_point_module(self, entry_point):
+        # The mappers only need the location of the module, so avoid
+        # executing the module if possible.
+        return resolve_module(entry_point.module_name)
+
     def _map_entry_point_module(self, entry_point, module):
+        modname = _listing_modnames.get(self.mapper)
+        if modname is not None:
+            listing = read_dist_module_files(
+                entry_point.dist, module.__name__)
+            if listing is not None:
+                records = mapper_listing(module, listing, 'zip', modname)
+                if records is not None:
+                    return {module.__name__: records}
         return {module.__name__: self.mapper(module)}
 
 
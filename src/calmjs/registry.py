@@ -18,16 +18,44 @@ Typically, usage is done through this::
 The iter_records is typically used by the other parts of the calmjs
 framework to produce configuration files and/or transpile the source
 into the usable final form.
+
+Registries that support the production of artifacts (such as all the
+module registries) may have their artifacts prebuilt through the
+``calmjs registry --dump`` command.  When persistent caching is enabled
+through the ``CALMJS_CACHE_DIR`` environment variable, the artifacts
+will be written there, and they will be used to construct the registry
+for as long as the working set remains the same as the one that they
+were produced from.
 """
 
 from __future__ import absolute_import
 
+import os
 from logging import getLogger
+from os.path import exists
+from pkg_resources import working_set
+
+from calmjs import jsonio
 from calmjs.base import BaseRegistry
+from calmjs.cache import REGISTRY_ARTIFACT_VERSION
+from calmjs.cache import fingerprint_working_set
+from calmjs.cache import get_registry_artifact_path
+from calmjs.cache import read_cache_file
+from calmjs.cache import write_cache_file
+from calmjs.runtime import RegistryRuntime
 
 logger = getLogger(__name__)
 
 
+def _class_path(cls):
+    return '%s:%s' % (cls.__module__, cls.__name__)
+
+
+def _working_set_digest(working_set):
+    fingerprint = fingerprint_working_set(working_set)
+    return None if fingerprint is None else fingerprint.digest
+
+
 class Registry(BaseRegistry):
 
     def _init(self):
@@ -42,6 +70,32 @@ class Registry(BaseRegistry):
         # No pre-caching for below, let the get_record load things into
         # records on-demand.
 
+    def _add_entry_points(self, entry_points):
+        self._update_entry_points()
+
+    def _remove_entry_points(self, entry_points):
+        super(Registry, self)._remove_entry_points(entry_points)
+        self._update_entry_points()
+
+    def _update_entry_points(self):
+        """
+        Update the entry points after changes to raw_entry_points, and
+        discard the registries constructed from the entry points that
+        are no longer in effect such that they will be constructed again
+        on demand.
+        """
+
+        previous = self._entry_points
+        self._init()
+        for name, record in list(self.records.items()):
+            if record is self:
+                continue
+            if previous.get(name) is not self._entry_points.get(name):
+                logger.debug(
+                    "discarding registry '%s' as its entry point changed",
+                    name)
+                self.records.pop(name)
+
     def get_record(self, name):
         if name in self.records:
             # maybe do some other sanity check if pedantic.
@@ -58,8 +112,10 @@ class Registry(BaseRegistry):
             return
 
         logger.debug('registering %s from %s', entry_point, entry_point.dist)
+        artifact = self._read_artifact(name, cls)
+        kw = {} if artifact is None else {'artifact': artifact}
         try:
-            self.records[name] = cls(name)
+            self.records[name] = cls(name, **kw)
         except Exception:
             logger.exception(
                 '%s does not lead to a valid registry constructor',
@@ -68,8 +124,83 @@ class Registry(BaseRegistry):
             return
         return self.records[name]
 
+    def _read_artifact(self, name, cls):
+        """
+        Return the prebuilt artifact for the registry if it is usable.
+        """
+
+        path = get_registry_artifact_path(name)
+        if path is None:
+            return None
+        artifact = read_cache_file(path)
+        if not isinstance(artifact, dict):
+            return None
+        if (artifact.get('version') != REGISTRY_ARTIFACT_VERSION or
+                artifact.get('registry_class') != _class_path(cls) or
+                artifact.get('working_set') !=
+                _working_set_digest(working_set)):
+            logger.debug(
+                "artifact '%s' for registry '%s' is stale", path, name)
+            return None
+        logger.debug("using artifact '%s' for registry '%s'", path, name)
+        return artifact.get('registry')
+
+    def write_artifact(self, name):
+        """
+        Write the artifact for the registry to the artifact directory,
+        to be used for the construction of that registry in subsequent
+        processes with the same working set.  Returns the path of the
+        artifact written.
+
+        Raises ValueError if the artifact cannot be produced.
+        """
+
+        path = get_registry_artifact_path(name)
+        if path is None:
+            raise ValueError(
+                'persistent caching must be enabled to write artifacts')
+        registry = self.get_record(name)
+        if registry is None:
+            raise ValueError("registry '%s' not found" % name)
+        dump = getattr(registry, 'dump_artifact', None)
+        if dump is None:
+            raise ValueError(
+                "registry '%s' does not support artifacts" % name)
+        artifact = {
+            'version': REGISTRY_ARTIFACT_VERSION,
+            'registry_class': _class_path(type(registry)),
+            'working_set': _working_set_digest(working_set),
+            'registry': dump(),
+        }
+        try:
+            jsonio.dumps(artifact, separators=(',', ':'))
+        except (TypeError, ValueError):
+            raise ValueError(
+                "registry '%s' produced records that cannot be serialized "
+                "to an artifact" % name)
+        if not write_cache_file(path, artifact):
+            raise ValueError("failed to write artifact to '%s'" % path)
+        return path
+
+    def remove_artifact(self, name):
+        """
+        Remove the artifact for the registry.  Returns the path of the
+        artifact removed, or None if there was none.
+        """
+
+        path = get_registry_artifact_path(name)
+        if path is None or not exists(path):
+            return None
+        os.remove(path)
+        return path
+
 
 # Initialize the root registry instance
 _inst = Registry(__name__)  # __name__ == calmjs.registry
 _inst.records[__name__] = _inst  # tie the knot, self-hosting.
 get = _inst.get
+
+runtime = RegistryRuntime(
+    _inst, package_name='calmjs',
+    description='prebuilt artifacts for calmjs registries',
+)
@@ -559,6 +559,16 @@ class PackageManagerRuntime(DriverRuntime):
                     continue  # pragma: no cover
             argparser.add_argument(*args, help=desc, action='store_true')
 
+        # only applicable to view, so not provided as one of the options
+        # shared with the setuptools command.
+        argparser.add_argument(
+            '-B', '--batch', action='store_true',
+            help="with view, generate a '%s' for each of the specified "
+                 "Python package(s) and write them as JSON lines; the "
+                 "metadata shared between the packages are only read "
+                 "once." % self.cli_driver.pkgdef_filename,
+        )
+
         argparser.add_argument(
             'package_names', help='names of the python package to use',
             metavar='package_names', nargs='+',
@@ -574,9 +584,51 @@ class PackageManagerRuntime(DriverRuntime):
         else:
             action = self.default_action
             kwargs['stream'] = sys.stdout
+        if kwargs.pop('batch', False):
+            if action != self.cli_driver.pkg_manager_view:
+                raise ValueError('--batch may only be used with --view')
+            kwargs['batch'] = True
         return action(**kwargs)
 
 
+class RegistryRuntime(DriverRuntime):
+    """
+    A calmjs registry artifact runtime
+    """
+
+    def init_argparser(self, argparser):
+        super(RegistryRuntime, self).init_argparser(argparser)
+        actions = argparser.add_argument_group('action arguments')
+        actions.add_argument(
+            '--dump', action='store_const', const='write_artifact',
+            dest=self.action_key,
+            help="build the specified registries and write their artifacts "
+                 "to the cache directory for use by subsequent processes "
+                 "[default]")
+        actions.add_argument(
+            '--remove', action='store_const', const='remove_artifact',
+            dest=self.action_key,
+            help="remove the artifacts for the specified registries")
+        argparser.add_argument(
+            'registry_names', help='names of the registries to use',
+            metavar='registry_names', nargs='+',
+        )
+
+    def run(self, **kwargs):
+        action = kwargs.pop(self.action_key) or 'write_artifact'
+        f = getattr(self.cli_driver, action)
+        for registry_name in kwargs['registry_names']:
+            path = f(registry_name)
+            if path:
+                logger.info(
+                    "%s artifact '%s' for registry '%s'", {
+                        'write_artifact': 'wrote',
+                        'remove_artifact': 'removed',
+                    }[action], path, registry_name,
+                )
+        return True
+
+
 def main(args=None):
     import warnings
     bootstrap = BootstrapRuntime()
@@ -426,6 +426,38 @@ def make_multipath_module3(testcase_inst):
     return module, index_js
 
 
+def make_zipped_module(testcase_inst, modname='calmjs_testing_zipped'):
+    """
+    Test case helper function that creates a zip archive with a Python
+    package named modname that also ships some JavaScript sources, and
+    then import that package from the archive.  The import is undone
+    when the test is done.
+
+    Returns a tuple of the imported module and the path to the archive.
+    """
+
+    import zipfile
+
+    tmpdir = mkdtemp(testcase_inst)
+    archive = join(tmpdir, 'zipped.egg')
+    with zipfile.ZipFile(archive, 'w') as zf:
+        zf.writestr(modname + '/__init__.py', '')
+        zf.writestr(modname + '/index.js', 'exports.zipped = true;\n')
+        zf.writestr(modname + '/util.js', 'exports.util = true;\n')
+        zf.writestr(modname + '/readme.txt', 'not a module\n')
+        zf.writestr(modname + '/nested/lib.js', 'exports.nested = true;\n')
+
+    def cleanup():
+        sys.path.remove(archive)
+        sys.path_importer_cache.pop(archive, None)
+        sys.modules.pop(modname, None)
+
+    sys.path.insert(0, archive)
+    testcase_inst.addCleanup(cleanup)
+    module = __import__(modname)
+    return module, archive
+
+
 def make_dummy_dist(testcase_inst, metadata_map=(),
                     pkgname='dummydist', version='0.0', working_dir=None):
     """
@@ -1,10 +1,14 @@
 # -*- coding: utf-8 -*-
 import unittest
 import os
+import timeit
+from os.path import abspath
+from os.path import join
 from os.path import normcase
 
 from pkg_resources import EntryPoint
 from pkg_resources import Distribution
+from pkg_resources import WorkingSet
 
 from calmjs import base
 from calmjs.utils import pretty_logging
@@ -19,6 +23,39 @@ class DummyModuleRegistry(base.BaseModuleRegistry):
         return {module.__name__: {module.__name__: module}}
 
 
+paths_root = join(normcase(abspath(os.sep)), 'srv', 'site-packages')
+
+
+class PathsModuleRegistry(base.BaseModuleRegistry):
+    """
+    A registry with the records of every module being the paths to the
+    number of files as specified, without importing anything.
+    """
+
+    def __init__(self, registry_name, files=1, *a, **kw):
+        self.files = files
+        super(PathsModuleRegistry, self).__init__(registry_name, *a, **kw)
+
+    def _load_entry_point_module(self, entry_point):
+        return None
+
+    def _map_entry_point_module(self, entry_point, module):
+        path = join(paths_root, entry_point.name, 'static', 'js')
+        return {entry_point.name: {
+            entry_point.name + '/file%d' % i: join(path, 'file%d.js' % i)
+            for i in range(self.files)
+        }}
+
+
+def make_paths_registry(modules, files, **kw):
+    working_set = mocks.WorkingSet({__name__: [
+        'mod%d = mod%d' % (i, i) for i in range(modules)
+    ]}, dist=Distribution(project_name='calmjs.testing'))
+    return PathsModuleRegistry(
+        __name__, files=files, _working_set=working_set, index_cache=None,
+        **kw)
+
+
 class BaseRegistryTestCase(unittest.TestCase):
     """
     Test the base registry.
@@ -49,6 +86,276 @@ class BaseRegistryTestCase(unittest.TestCase):
             registry.iter_records()
 
 
+class CompactRecordsTestCase(unittest.TestCase):
+    """
+    Test the compact records.
+    """
+
+    def test_path_table(self):
+        table = base.PathTable()
+        self.assertEqual(table.add('/srv/pkg/index.js'), (0, 'index.js'))
+        self.assertEqual(table.add('/srv/pkg/lib.js'), (0, 'lib.js'))
+        self.assertEqual(table.add('/srv/other/'), (1, ''))
+        self.assertEqual(table.add('relative.js'), (2, 'relative.js'))
+        self.assertEqual(table.dirs, ['/srv/pkg/', '/srv/other/', ''])
+        self.assertEqual(len(table), 3)
+        self.assertEqual(table.find('/srv/pkg/lib.js'), (0, 'lib.js'))
+        self.assertIsNone(table.find('/srv/missing/lib.js'))
+        self.assertEqual(len(table), 3)
+
+    def test_compact_records(self):
+        table = base.PathTable()
+        marker = object()
+        source = {
+            'pkg/index': '/srv/pkg/index.js',
+            'pkg/lib': '/srv/pkg/lib.js',
+            'pkg/marker': marker,
+        }
+        records = base.CompactRecords(table, source)
+        self.assertEqual(records, source)
+        self.assertEqual(list(records), list(source))
+        self.assertEqual(len(table), 1)
+        self.assertIs(records['pkg/marker'], marker)
+        self.assertIn('pkg/lib', records)
+        self.assertEqual(repr(records), repr(dict(records)))
+
+        other = base.CompactRecords(table, {'other': '/srv/pkg/other.js'})
+        self.assertEqual(other['other'], '/srv/pkg/other.js')
+        self.assertEqual(len(table), 1)
+
+        records['pkg/marker'] = '/srv/pkg//odd/../marker.js'
+        self.assertEqual(records['pkg/marker'], '/srv/pkg//odd/../marker.js')
+        records['pkg/index'] = marker
+        self.assertIs(records['pkg/index'], marker)
+
+    def test_compact_records_delete(self):
+        table = base.PathTable()
+        records = base.CompactRecords(table, [
+            ('k%d' % i, '/srv/pkg/%d.js' % i) for i in range(5)])
+        del records['k1']
+        del records['k3']
+        del records['k0']
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records, {
+            'k2': '/srv/pkg/2.js', 'k4': '/srv/pkg/4.js'})
+        records['k0'] = '/srv/pkg/0.js'
+        self.assertEqual(list(records), ['k2', 'k4', 'k0'])
+        self.assertEqual(list(records.items()), [
+            ('k2', '/srv/pkg/2.js'),
+            ('k4', '/srv/pkg/4.js'),
+            ('k0', '/srv/pkg/0.js'),
+        ])
+        with self.assertRaises(KeyError):
+            del records['k1']
+        records.clear()
+        self.assertEqual(records, {})
+        self.assertEqual(len(records), 0)
+
+    def test_compact_records_value_as_key(self):
+        # keys are not confused with the values that are equal to them.
+        table = base.PathTable()
+        records = base.CompactRecords(table, [('a', 'b'), ('b', 'a')])
+        self.assertEqual(records['a'], 'b')
+        self.assertEqual(records['b'], 'a')
+        self.assertNotIn('c', records)
+        records['c'] = 'c'
+        records['a'] = 'a'
+        self.assertEqual(records, {'a': 'a', 'b': 'a', 'c': 'c'})
+        with self.assertRaises(KeyError):
+            records['/srv']
+
+    def test_compact_registry_memory(self):
+        try:
+            import tracemalloc
+        except ImportError:  # pragma: no cover
+            self.skipTest('tracemalloc is unavailable')
+
+        def measure(modules, files, compact):
+            tracemalloc.start()
+            try:
+                registry = make_paths_registry(
+                    modules, files, compact=compact)
+                registered = tracemalloc.get_traced_memory()[0]
+                # the indexes are only built on demand.
+                self.assertIsNone(registry._indexed_records)
+                owner = registry.find_source_owner(
+                    join(paths_root, 'mod3', 'static', 'js', 'file0.js'))
+                indexed = tracemalloc.get_traced_memory()[0]
+            finally:
+                tracemalloc.stop()
+            self.assertEqual(
+                owner, ('mod3/file0', 'mod3', 'calmjs.testing'))
+            self.assertIsNone(registry.find_source_owner(
+                join(paths_root, 'mod3', 'file0.js')))
+            return registered, indexed - registered
+
+        # from modules with many files down to the typical modules with
+        # only a handful of them.
+        for modules, files in ((20, 50), (500, 3), (500, 1)):
+            plain = measure(modules, files, False)
+            compact = measure(modules, files, True)
+            self.assertLess(compact[0], plain[0])
+            self.assertLess(compact[1], plain[1])
+
+
+class EntryPointIndexTestCase(unittest.TestCase):
+    """
+    Test the shared entry point index.
+    """
+
+    def make_dist(self, name, entry_points):
+        return Distribution(
+            project_name=name, version='1.0', metadata=mocks.MockProvider({
+                'entry_points.txt': entry_points,
+            }))
+
+    def test_iter_entry_points_shared(self):
+        working_set = WorkingSet([])
+        working_set.add(self.make_dist('dist1', (
+            '[calmjs.dummy]\n'
+            'module1 = calmjs.testing.module1\n'
+            '[calmjs.other]\n'
+            'module2 = calmjs.testing.module2\n'
+        )), entry='dist1')
+        working_set.add(self.make_dist('dist2', (
+            '[calmjs.dummy]\n'
+            'module3 = calmjs.testing.module3\n'
+        )), entry='dist2')
+
+        builds = []
+        original_build = base.EntryPointIndex._build
+
+        def build(self, working_set):
+            builds.append(working_set)
+            return original_build(self, working_set)
+
+        base.EntryPointIndex._build = build
+        self.addCleanup(
+            setattr, base.EntryPointIndex, '_build', original_build)
+
+        self.assertEqual([ep.name for ep in base.iter_entry_points(
+            'calmjs.dummy', working_set)], ['module1', 'module3'])
+        registry = base.BaseRegistry(
+            'calmjs.other', _working_set=working_set)
+        self.assertEqual(
+            [ep.name for ep in registry.raw_entry_points], ['module2'])
+        self.assertEqual(list(base.iter_entry_points(
+            'calmjs.missing', working_set)), [])
+        self.assertEqual(
+            [ep.name for ep in base.iter_entry_points(
+                'calmjs.dummy', working_set)],
+            [ep.name for ep in working_set.iter_entry_points(
+                'calmjs.dummy')],
+        )
+        self.assertEqual(len(builds), 1)
+
+        # adding a distribution will invalidate the index.
+        working_set.add(self.make_dist('dist3', (
+            '[calmjs.dummy]\n'
+            'module4 = calmjs.testing.module4\n'
+        )), entry='dist3')
+        self.assertEqual([ep.name for ep in base.iter_entry_points(
+            'calmjs.dummy', working_set)], ['module1', 'module3', 'module4'])
+        self.assertEqual(len(builds), 2)
+
+    def test_iter_entry_points_other_working_set(self):
+        working_set = mocks.WorkingSet({'calmjs.dummy': [
+            'module1 = calmjs.testing.module1',
+        ]})
+        self.assertEqual([ep.name for ep in base.iter_entry_points(
+            'calmjs.dummy', working_set)], ['module1'])
+        self.assertNotIn(working_set, base._entry_point_indexes)
+
+
+class WorkingSetSubscriptionTestCase(unittest.TestCase):
+    """
+    Test that registries are updated as distributions get added to the
+    working set.
+    """
+
+    def make_dist(self, name, version, entry_points):
+        return Distribution(
+            project_name=name, version=version,
+            metadata=mocks.MockProvider({
+                'entry_points.txt': '[%s]\n%s\n' % (
+                    __name__, '\n'.join(entry_points)),
+            }),
+        )
+
+    def setUp(self):
+        self.working_set = WorkingSet([])
+        self.working_set.add(self.make_dist('dist1', '1.0', [
+            'calmjs.testing.module1 = calmjs.testing.module1',
+        ]), entry='dist1')
+
+    def test_add_dist(self):
+        from calmjs.testing import module2
+        registry = DummyModuleRegistry(
+            __name__, _working_set=self.working_set)
+        events = []
+        registry.add_listener(events.append)
+        self.working_set.add(self.make_dist('dist2', '1.0', [
+            'calmjs.testing.module2 = calmjs.testing.module2',
+        ]), entry='dist2')
+        self.assertEqual(registry.get_record('calmjs.testing.module2'), {
+            'calmjs.testing.module2': module2})
+        self.assertEqual(registry.package_module_map['dist2'], [
+            'calmjs.testing.module2'])
+        self.assertEqual(len(registry.raw_entry_points), 2)
+        self.assertEqual(events, [(
+            'calmjs.testing.module2', ['calmjs.testing.module2'], [], [])])
+
+        # a distribution with nothing for the registry.
+        self.working_set.add(self.make_dist('dist3', '1.0', []), 'dist3')
+        self.assertEqual(len(events), 1)
+
+    def test_replace_dist(self):
+        from calmjs.testing import module3
+        registry = DummyModuleRegistry(
+            __name__, _working_set=self.working_set)
+        events = []
+        registry.add_listener(events.append)
+        with pretty_logging(stream=mocks.StringIO()) as s:
+            self.working_set.add(self.make_dist('dist1', '2.0', [
+                'calmjs.testing.module3 = calmjs.testing.module3',
+            ]), entry='dist1', replace=True)
+        self.assertIn("removing entry points for 'dist1 1.0'", s.getvalue())
+        self.assertNotIn('calmjs.testing.module1', registry.records)
+        self.assertEqual(registry.get_records_for_package('dist1'), {
+            'calmjs.testing.module3': module3})
+        self.assertEqual(registry.package_module_map, {
+            'dist1': ['calmjs.testing.module3']})
+        self.assertEqual(registry.find_owner_module(
+            'calmjs.testing.module1.x'), None)
+        self.assertEqual(sorted(change.module_name for change in events), [
+            'calmjs.testing.module1', 'calmjs.testing.module3'])
+
+    def test_replace_dist_lazy(self):
+        registry = DummyModuleRegistry(
+            __name__, _working_set=self.working_set, lazy=True)
+        self.working_set.add(self.make_dist('dist1', '2.0', [
+            'calmjs.testing.module3 = calmjs.testing.module3',
+        ]), entry='dist1', replace=True)
+        self.assertEqual(list(registry._lazy_modules), [
+            'calmjs.testing.module3'])
+        self.assertEqual(list(registry._lazy_packages), ['dist1'])
+        self.assertEqual(registry.records, {})
+        self.assertEqual(
+            sorted(registry.get_records_for_package('dist1')),
+            ['calmjs.testing.module3'],
+        )
+
+    def test_add_dist_failure(self):
+        registry = DummyModuleRegistry(
+            __name__, _working_set=self.working_set)
+        with pretty_logging(stream=mocks.StringIO()) as s:
+            self.working_set.add(self.make_dist('dist2', '1.0', [
+                'bad entry point',
+            ]), entry='dist2')
+        self.assertIn('failed to register entry points', s.getvalue())
+        self.assertEqual(len(registry.raw_entry_points), 1)
+
+
 class BaseModuleRegistryTestCase(unittest.TestCase):
     """
     Test the base registry.
@@ -155,15 +462,340 @@ class BaseModuleRegistryTestCase(unittest.TestCase):
         # just merged together.
         self.assertEqual(result, {'calmjs.testing.module1': module1})
 
-    def test_got_record_cloned(self):
-        # returned records should clones.
+    def test_workers_ordered(self):
+        import threading
+        from calmjs.testing import module2
+        threads = []
+
+        class ThreadedModuleRegistry(base.BaseModuleRegistry):
+            def _map_entry_point_module(self, entry_point, module):
+                threads.append(threading.current_thread())
+                return {'shared': {'key': module.__name__}}
+
+        working_set = mocks.WorkingSet({__name__: [
+            'calmjs.testing.module1 = calmjs.testing.module1',
+            'calmjs.testing.not_a_module = calmjs.testing.not_a_module',
+            'calmjs.testing.module2 = calmjs.testing.module2',
+        ]}, dist=Distribution(project_name='calmjs.testing'))
+        with pretty_logging(stream=mocks.StringIO()) as s:
+            registry = ThreadedModuleRegistry(
+                __name__, _working_set=working_set, workers=3)
+        self.assertIn(
+            'ImportError: calmjs.testing.not_a_module not found; '
+            'skipping registration', s.getvalue(),
+        )
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(threading.current_thread(), threads)
+        # later entry points still override the earlier ones.
+        self.assertEqual(registry.get_record('shared'), {
+            'key': module2.__name__})
+        self.assertEqual(registry.package_module_map, {
+            'calmjs.testing': ['shared', 'shared']})
+
+    def test_workers_index_cache(self):
+        import threading
+        from calmjs.cache import RegistryIndexCache
+        threads = []
+
+        class TrackedIndexCache(RegistryIndexCache):
+            def lookup_entry(self, entry_point):
+                threads.append(threading.current_thread())
+                return super(TrackedIndexCache, self).lookup_entry(
+                    entry_point)
+
+        class RecordsModuleRegistry(base.BaseModuleRegistry):
+            def _map_entry_point_module(self, entry_point, module):
+                return {module.__name__: {module.__name__: 'value'}}
+
+        def make_working_set(version):
+            return mocks.WorkingSet({__name__: [
+                'calmjs.testing.module1 = calmjs.testing.module1',
+                'calmjs.testing.module2 = calmjs.testing.module2',
+                'calmjs.testing.module3 = calmjs.testing.module3',
+            ]}, dist=Distribution(
+                project_name='calmjs.testing', version=version))
+
+        cache_dir = mkdtemp(self)
+        for version in ('1.0', '1.0', '1.1'):
+            # the upgraded version invalidates every entry point from the
+            # distribution.
+            registry = RecordsModuleRegistry(
+                __name__, _working_set=make_working_set(version), workers=3,
+                index_cache=TrackedIndexCache(__name__, cache_dir),
+            )
+            self.assertEqual(len(registry.records), 3)
+        self.assertEqual(len(threads), 9)
+        self.assertEqual(set(threads), set([threading.current_thread()]))
+
+    def test_workers_error(self):
+        class BrokenModuleRegistry(base.BaseModuleRegistry):
+            def _map_entry_point_module(self, entry_point, module):
+                raise ValueError(module.__name__)
+
+        working_set = mocks.WorkingSet({__name__: [
+            'calmjs.testing.module1 = calmjs.testing.module1',
+            'calmjs.testing.module2 = calmjs.testing.module2',
+        ]})
+        with self.assertRaises(ValueError) as e:
+            BrokenModuleRegistry(
+                __name__, _working_set=working_set, workers=2)
+        self.assertEqual(str(e.exception), 'calmjs.testing.module1')
+
+    def test_lazy(self):
+        from calmjs.testing import module1
+        from calmjs.testing import module2
+        from calmjs.testing import module3
+        mapped = []
+
+        class TrackedModuleRegistry(DummyModuleRegistry):
+            def _map_entry_point_module(self, entry_point, module):
+                mapped.append(module.__name__)
+                return super(TrackedModuleRegistry, self)\
+                    ._map_entry_point_module(entry_point, module)
+
+        working_set = mocks.WorkingSet({__name__: [
+            'calmjs.testing.module1 = calmjs.testing.module1',
+            'calmjs.testing.module2 = calmjs.testing.module2',
+            'calmjs.testing.not_a_module = calmjs.testing.not_a_module',
+            'calmjs.testing.module3 = calmjs.testing.module3',
+        ]}, dist=Distribution(project_name='calmjs.testing'))
+        registry = TrackedModuleRegistry(
+            __name__, _working_set=working_set, lazy=True)
+        self.assertEqual(mapped, [])
+        self.assertEqual(registry.records, {})
+
+        self.assertEqual(registry.get_record('calmjs.testing.module2'), {
+            'calmjs.testing.module2': module2})
+        self.assertEqual(mapped, ['calmjs.testing.module2'])
+        # repeated access will not map again.
+        registry.get_record('calmjs.testing.module2')
+        self.assertEqual(mapped, ['calmjs.testing.module2'])
+
+        with pretty_logging(stream=mocks.StringIO()) as s:
+            self.assertEqual(list(registry.iter_records()), [
+                ('calmjs.testing.module1', {
+                    'calmjs.testing.module1': module1}),
+                ('calmjs.testing.module2', {
+                    'calmjs.testing.module2': module2}),
+                ('calmjs.testing.module3', {
+                    'calmjs.testing.module3': module3}),
+            ])
+        self.assertIn('calmjs.testing.not_a_module not found', s.getvalue())
+        self.assertEqual(mapped, [
+            'calmjs.testing.module2',
+            'calmjs.testing.module1',
+            'calmjs.testing.module3',
+        ])
+        self.assertEqual(registry._lazy_modules, {})
+        self.assertEqual(registry._lazy_packages, {})
+        self.assertEqual(len(list(registry.iter_records())), 3)
+
+    def test_lazy_package(self):
+        working_set = mocks.WorkingSet({__name__: [
+            'calmjs.testing.module1 = calmjs.testing.module1',
+            'calmjs.testing.module2 = calmjs.testing.module2',
+        ]}, dist=Distribution(project_name='calmjs.testing'))
+        registry = DummyModuleRegistry(
+            __name__, _working_set=working_set, lazy=True)
+        self.assertEqual(registry.get_records_for_package('other'), {})
+        self.assertEqual(registry.records, {})
+        self.assertEqual(
+            sorted(registry.get_records_for_package('calmjs.testing')),
+            ['calmjs.testing.module1', 'calmjs.testing.module2'],
+        )
+        self.assertEqual(registry._lazy_modules, {})
+
+    def test_lazy_manual_registration(self):
+        from calmjs.testing import module1
+        working_set = mocks.WorkingSet({__name__: [
+            'calmjs.testing.module2 = calmjs.testing.module2',
+        ]})
+        registry = DummyModuleRegistry(
+            __name__, _working_set=working_set, lazy=True)
+        with pretty_logging(stream=mocks.StringIO()):
+            registry.register_entry_point(EntryPoint.parse(
+                'calmjs.testing.module1 = calmjs.testing.module1'))
+        self.assertEqual(
+            [k for k, v in registry.iter_records()],
+            ['calmjs.testing.module2', 'calmjs.testing.module1'],
+        )
+        self.assertEqual(registry.get_record('calmjs.testing.module1'), {
+            'calmjs.testing.module1': module1})
+
+    def test_trie_queries(self):
+        working_set = mocks.WorkingSet({__name__: [
+            'calmjs.testing.module1 = calmjs.testing.module1',
+            'calmjs.testing.module2 = calmjs.testing.module2',
+        ]})
+        registry = DummyModuleRegistry(
+            __name__, _working_set=working_set, lazy=True)
+        self.assertEqual(
+            registry.find_owner_module('calmjs/testing/module2/x'),
+            'calmjs.testing.module2',
+        )
+        self.assertEqual(
+            list(registry.find_records_by_prefix('calmjs.testing')),
+            ['calmjs.testing.module1', 'calmjs.testing.module2'],
+        )
+
+        # records replaced wholesale
+        registry.records = {'some.module': {'some/module/index': 'index'}}
+        self.assertEqual(registry.find_records_by_prefix('some/module'), {
+            'some/module/index': 'index'})
+        self.assertEqual(
+            registry.find_owner_module('some/module/other'), 'some.module')
+        self.assertIsNone(
+            registry.find_owner_module('calmjs/testing/module2/x'))
+
+    def test_trie_shared_record_key(self):
+        class SharedModuleRegistry(base.BaseModuleRegistry):
+            def _load_entry_point_module(self, entry_point):
+                return None
+
+            def _map_entry_point_module(self, entry_point, module):
+                return {entry_point.name: {
+                    'shared/index': entry_point.name + '.js'}}
+
+        working_set = mocks.WorkingSet({__name__: ['a = a', 'b = b']})
+        registry = SharedModuleRegistry(
+            __name__, _working_set=working_set, index_cache=None)
+        self.assertEqual(registry.find_records_by_prefix('shared'), {
+            'shared/index': 'b.js'})
+        # removing the module that no longer provides the key.
+        registry._remove_entry_points([registry.raw_entry_points[0]])
+        self.assertEqual(registry.find_records_by_prefix('shared'), {
+            'shared/index': 'b.js'})
+        self.assertIsNone(registry.find_owner_module('a'))
+        registry._remove_entry_points([registry.raw_entry_points[0]])
+        self.assertEqual(registry.find_records_by_prefix('shared'), {})
+
+    def test_index_queries_cost(self):
+        def cost(registry):
+            path = join(paths_root, 'mod7', 'static', 'js', 'file0.js')
+            owner = registry.find_source_owner(path)
+            self.assertEqual(owner, ('mod7/file0', 'mod7', 'calmjs.testing'))
+            # once indexed, the records are no longer iterated for the
+            # queries.
+            registry.iter_records = None
+
+            def query():
+                registry.find_source_owner(path)
+                registry.find_owner_module('mod7/file0')
+                registry.find_records_by_prefix('mod7')
+
+            return min(timeit.repeat(query, number=50, repeat=5))
+
+        small = make_paths_registry(10, 1)
+        large = make_paths_registry(5000, 1)
+        # the cost of the queries do not grow with the registry, with a
+        # generous margin for timing noise.
+        self.assertLess(cost(large), cost(small) * 10)
+
+    def test_register_entry_point_module(self):
+        from calmjs.testing import module1
+        registry = DummyModuleRegistry(__name__)
+        with pretty_logging(stream=mocks.StringIO()):
+            registry._register_entry_point_module(EntryPoint.parse(
+                'calmjs.testing.module1 = calmjs.testing.module1'), module1)
+        self.assertEqual(registry.get_record('calmjs.testing.module1'), {
+            'calmjs.testing.module1': module1})
+
+    def test_artifact(self):
+        working_set = mocks.WorkingSet({__name__: [
+            'calmjs.testing.module1 = calmjs.testing.module1',
+            'calmjs.testing.module2 = calmjs.testing.module2',
+            'calmjs.testing.missing = calmjs.testing.missing',
+        ]})
+        with pretty_logging(stream=mocks.StringIO()):
+            registry = DummyModuleRegistry(
+                __name__, _working_set=working_set, lazy=True)
+        artifact = registry.dump_artifact()
+        self.assertEqual([entry[0] for entry in artifact['entry_points']], [
+            str(ep) for ep in registry.raw_entry_points])
+        self.assertIsNone(artifact['entry_points'][2][1])
+
+        class ArtifactModuleRegistry(DummyModuleRegistry):
+            def _map_entry_point_module(self, entry_point, module):
+                raise AssertionError('should not be mapped')
+
+        with pretty_logging(stream=mocks.StringIO()) as s:
+            loaded = ArtifactModuleRegistry(
+                __name__, _working_set=working_set, artifact=artifact)
+        # the missing module is tried again.
+        self.assertIn('calmjs.testing.missing not found', s.getvalue())
+        self.assertEqual(loaded.records, registry.records)
+        self.assertEqual(
+            loaded.package_module_map, registry.package_module_map)
+        self.assertEqual(loaded.find_owner_module(
+            'calmjs.testing.module2.x'), 'calmjs.testing.module2')
+        self.assertEqual(loaded.dump_artifact(), artifact)
+
+    def test_artifact_unusable(self):
         working_set = mocks.WorkingSet({__name__: [
             'calmjs.testing.module1 = calmjs.testing.module1',
         ]})
         registry = DummyModuleRegistry(__name__, _working_set=working_set)
+        artifact = registry.dump_artifact()
+
+        other_set = mocks.WorkingSet({__name__: [
+            'calmjs.testing.module2 = calmjs.testing.module2',
+        ]})
+        with pretty_logging(stream=mocks.StringIO()) as s:
+            loaded = DummyModuleRegistry(
+                __name__, _working_set=other_set, artifact=artifact)
+        self.assertIn('entry points differ', s.getvalue())
+        self.assertEqual(list(loaded.records), ['calmjs.testing.module2'])
+
+        stale = {'entry_points': [[
+            'calmjs.testing.module1 = calmjs.testing.module1', {},
+            {mkdtemp(self): 0},
+        ]]}
+        with pretty_logging(stream=mocks.StringIO()) as s:
+            loaded = DummyModuleRegistry(
+                __name__, _working_set=working_set, artifact=stale)
+        self.assertIn('indexed directories modified', s.getvalue())
+        self.assertEqual(list(loaded.records), ['calmjs.testing.module1'])
+
+        with pretty_logging(stream=mocks.StringIO()) as s:
+            loaded = DummyModuleRegistry(
+                __name__, _working_set=working_set, artifact={})
+        self.assertIn('not used', s.getvalue())
+        self.assertEqual(list(loaded.records), ['calmjs.testing.module1'])
+
+    def test_got_record_cloned(self):
+        # returned records should not be the registry records.
+        working_set = mocks.WorkingSet({__name__: [
+            'calmjs.testing.module1 = calmjs.testing.module1',
+        ]}, dist=Distribution(project_name='calmjs.testing'))
+        registry = DummyModuleRegistry(__name__, _working_set=working_set)
         record1 = registry.get_record('calmjs.testing.module1')
         record2 = registry.get_record('calmjs.testing.module1')
         self.assertIsNot(record1, record2)
+        self.assertEqual(record1, registry.records['calmjs.testing.module1'])
+        # the records are copied on modification, leaving the registry
+        # and the other records unmodified.
+        record1['extra'] = 'value'
+        self.assertEqual(record1['extra'], 'value')
+        self.assertNotIn(
+            'extra', registry.records['calmjs.testing.module1'])
+        self.assertNotIn('extra', record2)
+        del record2['calmjs.testing.module1']
+        self.assertEqual(len(record2), 0)
+        self.assertEqual(
+            len(registry.records['calmjs.testing.module1']), 1)
+        record1.clear()
+        self.assertEqual(record1, {})
+        missing = registry.get_record('calmjs.testing.missing')
+        missing['extra'] = 'value'
+        self.assertEqual(dict(missing), {'extra': 'value'})
+        self.assertEqual(registry.get_record('calmjs.testing.missing'), {})
+        package = registry.get_records_for_package('calmjs.testing')
+        self.assertTrue(isinstance(package, dict))
+        package.clear()
+        self.assertEqual(len(registry.get_record('calmjs.testing.module1')), 1)
+        packages = registry.get_records_for_packages(
+            ['calmjs.testing', 'calmjs.testing.missing'])
+        self.assertEqual(packages, registry.records['calmjs.testing.module1'])
 
 
 class BaseDriverClassTestCase(unittest.TestCase):
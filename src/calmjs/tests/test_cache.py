@@ -0,0 +1,444 @@
+# -*- coding: utf-8 -*-
+import unittest
+import hashlib
+import json
+import os
+import sys
+import time
+from functools import partial
+from os.path import exists
+from os.path import join
+
+from pkg_resources import Distribution
+from pkg_resources import EntryPoint
+from pkg_resources import PathMetadata
+
+from calmjs import cache
+from calmjs.indexer import mapper
+from calmjs.module import ModuleRegistry
+from calmjs.utils import pretty_logging
+
+from calmjs.testing import mocks
+from calmjs.testing.utils import make_zipped_module
+from calmjs.testing.utils import mkdtemp
+from calmjs.testing.utils import stub_os_environ
+
+
+def make_entry_point(text, dist):
+    entry_point = EntryPoint.parse(text)
+    entry_point.dist = dist
+    return entry_point
+
+
+class CacheFileTestCase(unittest.TestCase):
+
+    def test_get_cache_dir(self):
+        stub_os_environ(self)
+        os.environ.pop(cache.CALMJS_CACHE_DIR, None)
+        self.assertIsNone(cache.get_cache_dir())
+        self.assertIsNone(cache.get_registry_index_cache('calmjs.module'))
+        os.environ[cache.CALMJS_CACHE_DIR] = '/tmp/somewhere'
+        self.assertEqual(cache.get_cache_dir(), '/tmp/somewhere')
+        index_cache = cache.get_registry_index_cache('calmjs.module')
+        self.assertEqual(index_cache.path, join(
+            '/tmp/somewhere', 'index', 'calmjs.module.json'))
+
+    def test_read_write_cache_file(self):
+        tmpdir = mkdtemp(self)
+        target = join(tmpdir, 'nested', 'cache.json')
+        self.assertIsNone(cache.read_cache_file(target))
+        self.assertTrue(cache.write_cache_file(target, {'a': 1}))
+        self.assertEqual(cache.read_cache_file(target), {'a': 1})
+
+    def test_read_cache_file_malformed(self):
+        tmpdir = mkdtemp(self)
+        target = join(tmpdir, 'cache.json')
+        with open(target, 'w') as fd:
+            fd.write('{')
+        with pretty_logging(stream=mocks.StringIO()) as s:
+            self.assertIsNone(cache.read_cache_file(target))
+        self.assertIn('ignoring malformed cache file', s.getvalue())
+
+    def test_read_cache_file_failure(self):
+        tmpdir = mkdtemp(self)
+        with pretty_logging(stream=mocks.StringIO()) as s:
+            self.assertIsNone(cache.read_cache_file(tmpdir))
+        self.assertIn('failed to read cache file', s.getvalue())
+
+    def test_write_cache_file_failure(self):
+        tmpdir = mkdtemp(self)
+        # a directory at the target will prevent the rename.
+        target = join(tmpdir, 'cache.json')
+        os.mkdir(target)
+        with open(join(target, 'file'), 'w'):
+            pass
+        with pretty_logging(stream=mocks.StringIO()) as s:
+            self.assertFalse(cache.write_cache_file(target, {}))
+        self.assertIn('failed to write cache file', s.getvalue())
+
+    def test_fingerprint_working_set(self):
+        dist = Distribution(
+            project_name='calmjs.testing', version='1.0', location='/srv')
+        fingerprint = cache.fingerprint_working_set([dist])
+        self.assertEqual(list(fingerprint.dists), ['calmjs.testing'])
+        self.assertEqual(fingerprint, cache.fingerprint_working_set([
+            Distribution(
+                project_name='calmjs.testing', version='1.0',
+                location='/srv'),
+        ]))
+        upgraded = cache.fingerprint_working_set([
+            Distribution(
+                project_name='calmjs.testing', version='1.1',
+                location='/srv'),
+        ])
+        self.assertNotEqual(fingerprint, upgraded)
+        self.assertEqual(fingerprint.changed(upgraded), ['calmjs.testing'])
+        self.assertNotEqual(fingerprint, cache.fingerprint_working_set([]))
+        self.assertIsNone(cache.fingerprint_working_set(mocks.WorkingSet({})))
+        self.assertEqual(
+            cache.fingerprint_working_set(),
+            cache.fingerprint_working_set(cache.default_working_set),
+        )
+
+    def test_fingerprint_working_set_changed(self):
+        dist1 = Distribution(
+            project_name='calmjs.testing', version='1.0', location='/srv')
+        dist2 = Distribution(
+            project_name='calmjs.other', version='1.0', location='/srv')
+        dist3 = Distribution(
+            project_name='calmjs.third', version='1.0', location='/srv')
+        fingerprint = cache.fingerprint_working_set([dist1, dist2])
+        reordered = cache.fingerprint_working_set([dist2, dist1])
+        # the order affects the overall digest, but not the dists.
+        self.assertNotEqual(fingerprint, reordered)
+        self.assertEqual(fingerprint.changed(reordered), [])
+
+        replaced = cache.fingerprint_working_set([dist1, dist3])
+        self.assertEqual(
+            fingerprint.changed(replaced), ['calmjs.other', 'calmjs.third'])
+        # the persisted form of the dists may also be compared against.
+        self.assertEqual(
+            replaced.changed(json.loads(json.dumps(fingerprint.dists))),
+            ['calmjs.other', 'calmjs.third'],
+        )
+
+    def test_fingerprint_working_set_egg_info(self):
+        tmpdir = mkdtemp(self)
+        egg_info = join(tmpdir, 'calmjs.testing.egg-info')
+        os.mkdir(egg_info)
+        with open(join(egg_info, 'PKG-INFO'), 'w') as fd:
+            fd.write('Metadata-Version: 1.0\nVersion: 1.0\n')
+        dist = Distribution(
+            project_name='calmjs.testing', location=tmpdir,
+            metadata=PathMetadata(tmpdir, egg_info),
+        )
+        fingerprint = cache.fingerprint_working_set([dist])
+        self.assertEqual(fingerprint, cache.fingerprint_working_set([dist]))
+        st = os.stat(egg_info)
+        os.utime(egg_info, (st.st_atime, st.st_mtime + 10))
+        self.assertEqual(
+            fingerprint.changed(cache.fingerprint_working_set([dist])),
+            ['calmjs.testing'],
+        )
+
+        # files rewritten in place, with the directory left unchanged.
+        fingerprint = cache.fingerprint_working_set([dist])
+        st = os.stat(egg_info)
+        with open(join(egg_info, 'entry_points.txt'), 'w') as fd:
+            fd.write('[calmjs.module]\ncalmjs.testing = calmjs.testing\n')
+        os.utime(egg_info, (st.st_atime, st.st_mtime))
+        self.assertEqual(
+            fingerprint.changed(cache.fingerprint_working_set([dist])),
+            ['calmjs.testing'],
+        )
+        fingerprint = cache.fingerprint_working_set([dist])
+        pkg_info = join(egg_info, 'PKG-INFO')
+        st = os.stat(pkg_info)
+        with open(pkg_info, 'w') as fd:
+            fd.write('Metadata-Version: 1.0\nVersion: 1.0\nName: x\n')
+        # detected through the size even if the mtime is unchanged.
+        os.utime(pkg_info, (st.st_atime, st.st_mtime))
+        self.assertEqual(
+            fingerprint.changed(cache.fingerprint_working_set([dist])),
+            ['calmjs.testing'],
+        )
+
+    def test_stamps(self):
+        tmpdir = mkdtemp(self)
+        missing = join(tmpdir, 'missing')
+        stamps = cache.stamp_dirs([tmpdir, missing])
+        self.assertEqual(list(stamps.keys()), [tmpdir])
+        self.assertTrue(cache.check_stamps(stamps))
+        stamps[tmpdir] = stamps[tmpdir] - 10
+        self.assertFalse(cache.check_stamps(stamps))
+        self.assertFalse(cache.check_stamps({missing: 0}))
+
+    def test_json_file_cache(self):
+        tmpdir = mkdtemp(self)
+        target = join(tmpdir, 'cache.json')
+
+        class DummyCache(cache.JsonFileCache):
+            version = 1
+
+        first = DummyCache()
+        with first._lock:
+            first._load(target, 'key1')
+            first._entries['a'] = 1
+            first._save()
+            first.hits += 1
+        self.assertEqual(cache.read_cache_file(target), {
+            'version': 1, 'key': 'key1', 'entries': {'a': 1}})
+
+        second = DummyCache()
+        with second._lock:
+            second._load(target, 'key1')
+            self.assertEqual(second._entries, {'a': 1})
+            # entries are not loaded for a different key or version.
+            second._load(target, 'key2')
+            self.assertEqual(second._entries, {})
+        DummyCache.version = 2
+        with second._lock:
+            second._load(target, 'key1')
+            self.assertEqual(second._entries, {})
+            second._load(None, 'key1')
+            self.assertEqual(second._entries, {})
+            # nothing is written without a path.
+            second._entries['b'] = 2
+            second._save()
+        self.assertEqual(cache.read_cache_file(target)['entries'], {'a': 1})
+
+        first.clear()
+        self.assertEqual((first.hits, first.misses), (0, 0))
+        self.assertIsNone(first.path)
+        self.assertIsNone(first.key)
+        self.assertEqual(first._entries, {})
+
+
+class DigestIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = mkdtemp(self)
+        self.target = join(self.tmpdir, 'source.js')
+        with open(self.target, 'wb') as fd:
+            fd.write(b'var a = 1;\n')
+
+    def test_digest(self):
+        index = cache.DigestIndex()
+        result = index.digest(self.target)
+        self.assertEqual(result['size'], 11)
+        self.assertEqual(result['sha256'], hashlib.sha256(
+            b'var a = 1;\n').hexdigest())
+        self.assertEqual(result['mtime'], os.stat(self.target).st_mtime)
+
+        # modifying the result will not affect the index.
+        result['sha256'] = 'bad'
+        self.assertNotEqual(index.digest(self.target)['sha256'], 'bad')
+
+    def test_digest_memoized(self):
+        index = cache.DigestIndex()
+        original = index.digest(self.target)
+        # simulate an unchanged file with changed contents; the memoized
+        # digest should be used.
+        st = os.stat(self.target)
+        with open(self.target, 'wb') as fd:
+            fd.write(b'var b = 2;\n')
+        os.utime(self.target, (st.st_atime, st.st_mtime))
+        self.assertEqual(index.digest(self.target), original)
+
+        # a change in mtime will trigger the recomputation
+        os.utime(self.target, (st.st_atime, st.st_mtime + 10))
+        self.assertEqual(index.digest(self.target)['sha256'], hashlib.sha256(
+            b'var b = 2;\n').hexdigest())
+
+        index.clear()
+        self.assertEqual(index._digests, {})
+
+    def test_digest_missing(self):
+        index = cache.DigestIndex()
+        index.digest(self.target)
+        os.remove(self.target)
+        with pretty_logging(stream=mocks.StringIO()) as s:
+            self.assertIsNone(index.digest(self.target))
+        self.assertIn('cannot compute digest', s.getvalue())
+        self.assertEqual(index._digests, {})
+        self.assertIsNone(index.digest(None))
+
+    def test_digest_zipped(self):
+        module, archive = make_zipped_module(self)
+        index = cache.DigestIndex(algorithm='md5')
+        result = index.digest(join(archive, module.__name__, 'index.js'))
+        self.assertEqual(result['md5'], hashlib.md5(
+            b'exports.zipped = true;\n').hexdigest())
+        self.assertEqual(result['mtime'], os.stat(archive).st_mtime)
+        with pretty_logging(stream=mocks.StringIO()):
+            self.assertIsNone(index.digest(
+                join(archive, module.__name__, 'missing.js')))
+            self.assertIsNone(index.digest(join(self.tmpdir, 'nowhere.js')))
+
+
+class RegistryIndexCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = mkdtemp(self)
+        self.dist = Distribution(
+            project_name='calmjs.testing', version='1.0', location='/srv')
+        self.entry_point = make_entry_point(
+            'calmjs.testing.module1 = calmjs.testing.module1', self.dist)
+
+    def test_lookup_empty(self):
+        index_cache = cache.RegistryIndexCache('dummy', self.cache_dir)
+        self.assertIsNone(index_cache.lookup(self.entry_point))
+        self.assertIsNone(index_cache.lookup(EntryPoint.parse(
+            'calmjs.testing.module1 = calmjs.testing.module1')))
+
+    def test_store_lookup_save(self):
+        from calmjs.testing import module1
+        index_cache = cache.RegistryIndexCache('dummy', self.cache_dir)
+        registry = ModuleRegistry('dummy', index_cache=None)
+        records_map = registry._map_entry_point_module(
+            self.entry_point, module1)
+        index_cache.store(self.entry_point, module1, records_map)
+        self.assertTrue(index_cache.dirty)
+        index_cache.save()
+        self.assertFalse(index_cache.dirty)
+        self.assertTrue(exists(index_cache.path))
+
+        fresh_cache = cache.RegistryIndexCache('dummy', self.cache_dir)
+        self.assertEqual(fresh_cache.lookup(self.entry_point), records_map)
+        # nothing changed, so nothing should be written.
+        self.assertFalse(fresh_cache.dirty)
+
+    def test_store_unserializable(self):
+        from calmjs.testing import module1
+        index_cache = cache.RegistryIndexCache('dummy', self.cache_dir)
+        index_cache.store(self.entry_point, module1, {
+            'calmjs.testing.module1': {'calmjs.testing.module1': module1}})
+        self.assertFalse(index_cache.dirty)
+        self.assertIsNone(index_cache.lookup(self.entry_point))
+        index_cache.store(EntryPoint.parse(
+            'calmjs.testing.module1 = calmjs.testing.module1'), module1, {})
+        self.assertFalse(index_cache.dirty)
+
+    def test_invalidate_dist_version(self):
+        from calmjs.testing import module1
+        index_cache = cache.RegistryIndexCache('dummy', self.cache_dir)
+        index_cache.store(self.entry_point, module1, {'a': {'a': 'a'}})
+        self.assertEqual(index_cache.lookup(self.entry_point), {
+            'a': {'a': 'a'}})
+
+        upgraded = Distribution(
+            project_name='calmjs.testing', version='1.1', location='/srv')
+        entry_point = make_entry_point(
+            'calmjs.testing.module1 = calmjs.testing.module1', upgraded)
+        self.assertIsNone(index_cache.lookup(entry_point))
+        self.assertNotIn('calmjs.testing', index_cache.dists)
+
+    def test_invalidate_stamps(self):
+        from calmjs.testing import module1
+        index_cache = cache.RegistryIndexCache('dummy', self.cache_dir)
+        index_cache.store(self.entry_point, module1, {'a': {'a': 'a'}})
+        entry = index_cache.dists['calmjs.testing']['entry_points']
+        stamps = entry[str(self.entry_point)]['stamps']
+        for key in stamps:
+            stamps[key] -= 10
+        self.assertIsNone(index_cache.lookup(self.entry_point))
+        self.assertEqual(entry, {})
+
+    def test_bad_cache_file(self):
+        index_cache = cache.RegistryIndexCache('dummy', self.cache_dir)
+        cache.write_cache_file(index_cache.path, {'version': 0, 'dists': {}})
+        self.assertEqual(index_cache.dists, {})
+
+
+class ModuleRegistryIndexCacheTestCase(unittest.TestCase):
+    """
+    Test the integration of the index cache with the module registry.
+    """
+
+    def setUp(self):
+        self.cache_dir = mkdtemp(self)
+        self.tmpdir = mkdtemp(self)
+        self.working_set = mocks.WorkingSet({'calmjs.module': [
+            'calmjs.testing.module1 = calmjs.testing.module1',
+        ]}, dist=Distribution(
+            project_name='calmjs.testing', version='1.0',
+            location=self.tmpdir,
+        ))
+
+    def test_module_registry_warm_start(self):
+        registry = ModuleRegistry(
+            'calmjs.module', _working_set=self.working_set,
+            index_cache=cache.RegistryIndexCache(
+                'calmjs.module', self.cache_dir),
+        )
+        expected = registry.get_record('calmjs.testing.module1')
+        self.assertEqual(
+            list(expected.keys()), ['calmjs/testing/module1/hello'])
+
+        with open(registry.index_cache.path) as fd:
+            self.assertIn('calmjs.testing', json.load(fd)['dists'])
+
+        def fail(*a, **kw):
+            raise AssertionError('mapper should not be invoked')
+
+        class WarmModuleRegistry(ModuleRegistry):
+            def _init(self):
+                self.mapper = fail
+
+        warm = WarmModuleRegistry(
+            'calmjs.module', _working_set=self.working_set,
+            index_cache=cache.RegistryIndexCache(
+                'calmjs.module', self.cache_dir),
+        )
+        self.assertEqual(warm.get_record('calmjs.testing.module1'), expected)
+        self.assertEqual(
+            warm.get_records_for_package('calmjs.testing'), expected)
+
+    def test_module_registry_env_enabled(self):
+        stub_os_environ(self)
+        os.environ[cache.CALMJS_CACHE_DIR] = self.cache_dir
+        registry = ModuleRegistry(
+            'calmjs.module', _working_set=self.working_set)
+        self.assertTrue(exists(registry.index_cache.path))
+
+    def test_module_registry_recursive_new_subdir_file(self):
+        pkg_dir = join(self.tmpdir, 'calmjs_testing_pkgx')
+        os.makedirs(join(pkg_dir, 'sub'))
+        for name in ('__init__.py', 'a.js', join('sub', 'readme.txt')):
+            with open(join(pkg_dir, name), 'w'):
+                pass
+
+        def cleanup():
+            sys.path.remove(self.tmpdir)
+            sys.modules.pop('calmjs_testing_pkgx', None)
+
+        sys.path.insert(0, self.tmpdir)
+        self.addCleanup(cleanup)
+        working_set = mocks.WorkingSet({'calmjs.module': [
+            'calmjs_testing_pkgx = calmjs_testing_pkgx',
+        ]}, dist=Distribution(
+            project_name='calmjs.testing', version='1.0',
+            location=self.tmpdir,
+        ))
+
+        class RecursiveModuleRegistry(ModuleRegistry):
+            def _init(self):
+                self.mapper = partial(mapper, globber='recursive')
+
+        def make_registry():
+            return RecursiveModuleRegistry(
+                'calmjs.module', _working_set=working_set,
+                index_cache=cache.RegistryIndexCache(
+                    'calmjs.module', self.cache_dir),
+            )
+
+        self.assertEqual(sorted(make_registry().get_record(
+            'calmjs_testing_pkgx')), ['calmjs_testing_pkgx/a'])
+        # the subdirectory without any matching files was also stamped.
+        with open(join(pkg_dir, 'sub', 'new.js'), 'w'):
+            pass
+        mtime = time.time() + 10
+        os.utime(join(pkg_dir, 'sub'), (mtime, mtime))
+        self.assertEqual(sorted(make_registry().get_record(
+            'calmjs_testing_pkgx')), [
+            'calmjs_testing_pkgx/a', 'calmjs_testing_pkgx/sub/new'])
@@ -13,6 +13,7 @@ from os.path import pathsep
 import pkg_resources
 import warnings
 
+from calmjs import cache
 from calmjs import cli
 from calmjs import dist
 from calmjs.utils import pretty_logging
@@ -273,6 +274,55 @@ class CliDriverTestCase(unittest.TestCase):
         self.assertIn("failed to execute 'some_app'", err.getvalue())
         self.assertIsNone(results)
 
+    def test_get_bin_version_cached(self):
+        stub_os_environ(self)
+        os.environ[cache.CALMJS_CACHE_DIR] = mkdtemp(self)
+        self.addCleanup(cli.bin_version_cache.clear)
+        cli.bin_version_cache.clear()
+        tmpdir = mkdtemp(self)
+        some_app = join(tmpdir, 'some_app')
+        with open(some_app, 'w') as fd:
+            fd.write('v1.2.3')
+        stub_mod_check_output(self, cli)
+        stub_base_which(self, some_app)
+        self.check_output_answer = b'v1.2.3'
+        self.assertEqual(cli._get_bin_version('some_app'), (1, 2, 3))
+        self.assertEqual(cli.bin_version_cache.misses, 1)
+
+        # the binary is no longer invoked, even in a fresh cache that
+        # must read from the cache directory.
+        stub_mod_check_output(self, cli, fake_error(AssertionError))
+        self.assertEqual(cli._get_bin_version('some_app'), (1, 2, 3))
+        cli.bin_version_cache.clear()
+        self.assertEqual(cli._get_bin_version('some_app'), (1, 2, 3))
+        self.assertEqual(cli.bin_version_cache.hits, 1)
+        # the version flag is part of the key.
+        with pretty_logging(stream=mocks.StringIO()) as err:
+            self.assertIsNone(cli._get_bin_version(
+                'some_app', version_flag='--version'))
+        self.assertIn('AssertionError', err.getvalue())
+
+        # an upgraded binary will invalidate the entry.
+        stub_mod_check_output(self, cli)
+        self.check_output_answer = b'v1.10.0'
+        with open(some_app, 'w') as fd:
+            fd.write('v1.10.0')
+        self.assertEqual(cli._get_bin_version('some_app'), (1, 10, 0))
+        self.assertEqual(cli.bin_version_cache.misses, 2)
+
+    def test_get_bin_version_not_cached(self):
+        stub_os_environ(self)
+        os.environ.pop(cache.CALMJS_CACHE_DIR, None)
+        self.addCleanup(cli.bin_version_cache.clear)
+        cli.bin_version_cache.clear()
+        stub_mod_check_output(self, cli)
+        stub_base_which(self, sys.executable)
+        self.check_output_answer = b'v1.2.3'
+        self.assertEqual(cli._get_bin_version('some_app'), (1, 2, 3))
+        self.check_output_answer = b'v1.2.4'
+        self.assertEqual(cli._get_bin_version('some_app'), (1, 2, 4))
+        self.assertEqual(cli.bin_version_cache.misses, 0)
+
     def test_node_no_path(self):
         stub_os_environ(self)
         os.environ['PATH'] = ''
@@ -801,6 +851,45 @@ class CliDriverTestCase(unittest.TestCase):
             "name": "site",
         })
 
+    def test_pkg_manager_view_batch(self):
+        working_set = self.setup_requirements_json()
+        working_set.add(pkg_resources.Distribution(
+            metadata=MockProvider({
+                'requires.txt': 'calmpy.pip',
+            }),
+            project_name='site',
+            version='0.0.0',
+        ))
+        driver = cli.PackageManagerDriver(
+            pkg_manager_bin='mgr', pkgdef_filename='requirements.json',
+            dep_keys=('require',),
+        )
+        stream = StringIO()
+        with pretty_logging(stream=StringIO()) as log:
+            results = driver.mgr_view_batch(
+                ['site', 'calmpy.pip'], stream=stream)
+        self.assertEqual(results, [
+            driver.pkg_manager_view('site'),
+            driver.pkg_manager_view('calmpy.pip'),
+        ])
+        self.assertEqual(
+            [json.loads(line) for line in stream.getvalue().splitlines()],
+            results,
+        )
+        # the metadata for calmpy.pip was only read once.
+        self.assertEqual(log.getvalue().count(
+            "found 'requirements.json' for 'calmpy.pip"), 1)
+
+        results = driver.pkg_manager_view(
+            'site calmpy.pip', explicit=True, batch=True)
+        self.assertEqual(results, [
+            {"require": {}, "name": "site"},
+            {"require": {"setuptools": "25.1.6"}, "name": "calmpy.pip"},
+        ])
+
+        with self.assertRaises(ValueError):
+            driver.pkg_manager_view_batch('{foo} /r')
+
     def test_pkg_manager_view_extras_requires(self):
         working_set = self.setup_requirements_json()
         working_set.add(pkg_resources.Distribution(
@@ -1,8 +1,10 @@
 # -*- coding: utf-8 -*-
 import unittest
 import json
+import os
 import sys
 import textwrap
+from os.path import dirname
 from os.path import join
 from subprocess import Popen
 from subprocess import PIPE
@@ -13,11 +15,16 @@ import pkg_resources
 
 from calmjs.module import ModuleRegistry
 from calmjs import dist as calmjs_dist
+from calmjs import utils as calmjs_utils
 from calmjs.cli import locale
+from calmjs.utils import pretty_logging
+from calmjs.testing import mocks
 from calmjs.testing.mocks import Mock_egg_info
 from calmjs.testing.mocks import MockProvider
 from calmjs.testing.utils import make_dummy_dist
 from calmjs.testing.utils import mkdtemp
+from calmjs.testing.utils import stub_item_attr_value
+from calmjs.testing.utils import stub_os_environ
 from calmjs.testing.utils import stub_stdouts
 
 
@@ -161,6 +168,66 @@ class DistTestCase(unittest.TestCase):
         # that it's been called...
         self.assertEqual(ei.called[self.pkgname], None)
 
+    def test_write_module_files(self):
+        from calmjs.testing import module1
+        self.dist.package_dir = {
+            '': dirname(dirname(dirname(dirname(module1.__file__))))}
+        self.dist.entry_points = {
+            'calmjs.module': [
+                'calmjs.testing.module1 = calmjs.testing.module1',
+                'calmjs.testing.module9 = calmjs.testing.module9',
+            ],
+            'calmjs.extras_keys': ['node_modules = enabled'],
+            'calmjs.no_such_registry': ['module2 = calmjs.testing.module2'],
+        }
+        ei = Mock_egg_info(self.dist)
+        ei.initialize_options()
+        calmjs_dist.write_module_files(
+            ei, 'calmjs_module_files.json', 'calmjs_module_files.json')
+        self.assertEqual(json.loads(ei.called['calmjs_module_files.json']), {
+            'calmjs.testing.module1': ['hello.js'],
+        })
+
+        self.dist.entry_points = None
+        calmjs_dist.write_module_files(
+            ei, 'calmjs_module_files.json', 'calmjs_module_files.json')
+        self.assertIsNone(ei.called['calmjs_module_files.json'])
+
+    def test_read_dist_module_files(self):
+        listing = json.dumps({'calmjs.testing.module1': ['hello.js']})
+        installed = make_dummy_dist(self, (
+            ('installed-files.txt', ''),
+            (calmjs_dist.MODULE_FILES_JSON, listing),
+        ), 'installed', '1.0')
+        self.assertEqual(calmjs_dist.read_dist_module_files(
+            installed, 'calmjs.testing.module1'), ['hello.js'])
+        self.assertIsNone(calmjs_dist.read_dist_module_files(
+            installed, 'calmjs.testing.module2'))
+        self.assertIsNone(calmjs_dist.read_dist_module_files(
+            None, 'calmjs.testing.module1'))
+
+        develop = make_dummy_dist(self, (
+            (calmjs_dist.MODULE_FILES_JSON, listing),
+        ), 'develop', '1.0')
+        self.assertIsNone(calmjs_dist.read_dist_module_files(
+            develop, 'calmjs.testing.module1'))
+
+        editable = make_dummy_dist(self, (
+            ('RECORD', ''),
+            ('direct_url.json', json.dumps({
+                'url': 'file:///srv', 'dir_info': {'editable': True}})),
+            (calmjs_dist.MODULE_FILES_JSON, listing),
+        ), 'editable', '1.0')
+        self.assertIsNone(calmjs_dist.read_dist_module_files(
+            editable, 'calmjs.testing.module1'))
+
+        wheel = make_dummy_dist(self, (
+            ('RECORD', ''),
+            (calmjs_dist.MODULE_FILES_JSON, listing),
+        ), 'wheel', '1.0')
+        self.assertEqual(calmjs_dist.read_dist_module_files(
+            wheel, 'calmjs.testing.module1'), ['hello.js'])
+
     def test_find_pkg_dist(self):
         # Only really testing that this returns an actual distribution
         result = calmjs_dist.find_pkg_dist('setuptools')
@@ -259,6 +326,56 @@ class DistTestCase(unittest.TestCase):
         results = calmjs_dist.read_dist_egginfo_json(mock_dist)
         self.assertEqual(results['dependencies']['left-pad'], '~1.1.1')
 
+    def test_get_dist_package_fs_cached(self):
+        cache = calmjs_dist.egginfo_json_cache
+        self.addCleanup(cache.clear)
+        cache.clear()
+        package_json = {"dependencies": {"left-pad": "~1.1.1"}, "a": [{}]}
+        mock_dist = make_dummy_dist(
+            self, (
+                (self.pkgname, json.dumps(package_json)),
+            ), pkgname='dummydist'
+        )
+        results = calmjs_dist.read_dist_egginfo_json(mock_dist)
+        self.assertEqual(results, package_json)
+        self.assertEqual(cache.info(), (0, 1, 256, 1))
+
+        # modifications to results will not affect the cache
+        results['dependencies']['left-pad'] = '~0.0.0'
+        results['a'][0]['b'] = 1
+        with pretty_logging(stream=mocks.StringIO()) as s:
+            results = calmjs_dist.read_dist_egginfo_json(mock_dist)
+        self.assertIn('(cached)', s.getvalue())
+        self.assertEqual(results, package_json)
+        self.assertEqual(cache.info(), (1, 1, 256, 1))
+
+        # changes to the file will be picked up.
+        target = join(mock_dist.egg_info, self.pkgname)
+        with open(target, 'w') as fd:
+            json.dump({"dependencies": {"left-pad": "~1.1.2"}}, fd)
+        st = os.stat(target)
+        os.utime(target, (st.st_atime, st.st_mtime + 10))
+        results = calmjs_dist.read_dist_egginfo_json(mock_dist)
+        self.assertEqual(results['dependencies']['left-pad'], '~1.1.2')
+        self.assertEqual(cache.info(), (1, 2, 256, 2))
+
+        cache.clear()
+        self.assertEqual(cache.info(), (0, 0, 256, 0))
+
+    def test_egginfo_json_cache_lru(self):
+        cache = calmjs_dist.EggInfoJsonCache(maxsize=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3)
+        # b was the least recently used.
+        self.assertIs(cache.get('b'), calmjs_dist._marker)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        cache.put('a', 4)
+        self.assertEqual(cache.get('a'), 4)
+        self.assertEqual(cache.info(), (4, 1, 2, 2))
+
     def test_read_dist_egginfo_json_alternative_name_args(self):
         package_json = {"dependencies": {"left-pad": "~1.1.1"}}
 
@@ -396,6 +513,20 @@ class DistTestCase(unittest.TestCase):
             [framework, widget, forms, service, site], working_set=working_set)
         self.assertEqual(result, answer)
 
+        # The merge order is retained regardless of the concurrency,
+        # also for iterators.
+        for workers in (None, 1, 2, 16):
+            result = calmjs_dist.flatten_dist_egginfo_json(
+                iter([framework, widget, forms, service, site]),
+                working_set=working_set, workers=workers)
+            self.assertEqual(result, answer)
+
+        # No pool of threads is created unless workers are requested.
+        stub_item_attr_value(self, calmjs_utils, 'ThreadPool', None)
+        result = calmjs_dist.flatten_dist_egginfo_json(
+            [framework, widget, forms, service, site], working_set=working_set)
+        self.assertEqual(result, answer)
+
         # Also a raw requirement (package) string on the other function.
         result = calmjs_dist.flatten_egginfo_json(
             ['site'], working_set=working_set)
@@ -547,6 +678,55 @@ class DistTestCase(unittest.TestCase):
             ['app'], working_set=working_set)
         self.assertEqual(result, answer)
 
+    def test_layer_dist_egginfo_json(self):
+        def make_dist(name, package_json):
+            return pkg_resources.Distribution(
+                metadata=MockProvider({self.pkgname: json.dumps(
+                    package_json)}),
+                project_name=name, version='1.0',
+            )
+
+        lib = make_dist('lib', {'dependencies': {
+            'jquery': '~1.8.3', 'underscore': '~1.8.0'}})
+        widget = make_dist('widget', {'dependencies': {'jquery': '~2.0.0'}})
+        app = make_dist('app', {
+            'name': 'app',
+            'dependencies': {'underscore': None},
+            'devDependencies': {'sinon': '~1.17.0'},
+        })
+        layers = calmjs_dist.layer_dist_egginfo_json([lib, widget, app])
+
+        self.assertEqual(
+            layers.lookup('dependencies', 'jquery'), ('~2.0.0', widget))
+        self.assertEqual(
+            layers.lookup('dependencies', 'underscore'), (None, app))
+        self.assertIsNone(layers.lookup('devDependencies', 'jquery'))
+        self.assertEqual(layers.flatten(), {
+            'name': 'app',
+            'dependencies': {'jquery': '~2.0.0'},
+            'devDependencies': {'sinon': '~1.17.0'},
+        })
+        self.assertEqual(
+            layers.flatten(),
+            calmjs_dist.flatten_dist_egginfo_json([lib, widget, app]))
+
+        # only the changed keys are reported on update
+        self.assertEqual(layers.update(widget, {'dependencies': {
+            'jquery': '~2.0.0', 'backbone': '~1.3.0'}}), {
+            ('dependencies', 'backbone')})
+        self.assertEqual(layers.update(widget, {}), {
+            ('dependencies', 'backbone'), ('dependencies', 'jquery')})
+        self.assertEqual(
+            layers.lookup('dependencies', 'jquery'), ('~1.8.3', lib))
+        self.assertEqual(layers.flatten()['dependencies'], {
+            'jquery': '~1.8.3'})
+
+        # refreshing will read the metadata from the dist again.
+        self.assertEqual(layers.refresh(widget), {
+            ('dependencies', 'jquery')})
+        self.assertEqual(
+            layers.lookup('dependencies', 'jquery'), ('~2.0.0', widget))
+
     # While it really is for node/npm, the declaration is almost generic
     # enough that the particular method should be used here.
     def test_node_modules_registry_flattening(self):
@@ -609,6 +789,148 @@ class DistTestCase(unittest.TestCase):
         # child takes precedences as this was not specified to be merged
         self.assertEqual(results['something_else'], {'child': 'named'})
 
+    def test_find_packages_requirements_dists_cached(self):
+        stub_os_environ(self)
+        cache_dir = mkdtemp(self)
+        os.environ['CALMJS_CACHE_DIR'] = cache_dir
+        calmjs_dist.resolution_cache.clear()
+        self.addCleanup(calmjs_dist.resolution_cache.clear)
+
+        def find_dists(pkg_names, working_set):
+            return calmjs_dist.find_packages_requirements_dists(
+                pkg_names, working_set=working_set)
+
+        lib = make_dummy_dist(self, (
+            ('requires.txt', ''),
+        ), 'lib', '1.0.0')
+        app = make_dummy_dist(self, (
+            ('requires.txt', 'lib>=1.0.0'),
+        ), 'app', '2.0')
+
+        def make_working_set():
+            working_set = pkg_resources.WorkingSet()
+            working_set.add(lib, self._calmjs_testing_tmpdir)
+            working_set.add(app, self._calmjs_testing_tmpdir)
+            return working_set
+
+        working_set = make_working_set()
+        self.assertEqual([lib, app], find_dists(['app'], working_set))
+        self.assertEqual(calmjs_dist.resolution_cache.misses, 1)
+
+        def fail(*a, **kw):
+            raise AssertionError('resolve should not be invoked')
+
+        working_set.resolve = fail
+        self.assertEqual([lib, app], find_dists(['app'], working_set))
+        self.assertEqual(calmjs_dist.resolution_cache.hits, 1)
+
+        # a fresh process against an identical working set will reuse
+        # the persisted results.
+        calmjs_dist.resolution_cache.clear()
+        working_set = make_working_set()
+        working_set.resolve = fail
+        self.assertEqual([lib, app], find_dists(['app'], working_set))
+
+        # requirements modified in place will be resolved again.
+        requires = join(app.egg_info, 'requires.txt')
+        st = os.stat(requires)
+        os.utime(requires, (st.st_atime, st.st_mtime + 10))
+        with self.assertRaises(AssertionError):
+            find_dists(['app'], working_set)
+
+        # a changed working set will be resolved again.
+        working_set = pkg_resources.WorkingSet()
+        working_set.add(lib, self._calmjs_testing_tmpdir)
+        self.assertEqual([lib], find_dists(['lib'], working_set))
+        self.assertEqual(calmjs_dist.resolution_cache.misses, 2)
+
+    def test_find_packages_requirements_dists_fingerprint_memoized(self):
+        calmjs_dist.resolution_cache.clear()
+        self.addCleanup(calmjs_dist.resolution_cache.clear)
+        fingerprints = []
+
+        def fingerprint_working_set(working_set):
+            fingerprints.append(working_set)
+            return fingerprint(working_set)
+
+        fingerprint = calmjs_dist.fingerprint_working_set
+        calmjs_dist.fingerprint_working_set = fingerprint_working_set
+        self.addCleanup(
+            setattr, calmjs_dist, 'fingerprint_working_set', fingerprint)
+
+        lib = make_dummy_dist(self, (
+            ('requires.txt', ''),
+        ), 'lib', '1.0.0')
+        app = make_dummy_dist(self, (
+            ('requires.txt', 'lib>=1.0.0'),
+        ), 'app', '2.0')
+        working_set = pkg_resources.WorkingSet()
+        working_set.add(lib, self._calmjs_testing_tmpdir)
+        working_set.add(app, self._calmjs_testing_tmpdir)
+
+        for i in range(2):
+            self.assertEqual(
+                [lib, app], calmjs_dist.find_packages_requirements_dists(
+                    ['app'], working_set=working_set))
+        self.assertEqual(calmjs_dist.resolution_cache.hits, 1)
+        self.assertEqual(len(fingerprints), 1)
+
+        # adding a distribution will invalidate the memoized fingerprint.
+        extra = make_dummy_dist(self, (
+            ('requires.txt', 'app'),
+        ), 'extra', '1.0')
+        working_set.add(extra, self._calmjs_testing_tmpdir)
+        self.assertEqual(
+            [lib, app, extra], calmjs_dist.find_packages_requirements_dists(
+                ['extra'], working_set=working_set))
+        self.assertEqual(len(fingerprints), 2)
+        self.assertEqual(calmjs_dist.resolution_cache.misses, 2)
+
+    def test_map_packages_requirements_dists(self):
+        calmjs_dist.resolution_cache.clear()
+        self.addCleanup(calmjs_dist.resolution_cache.clear)
+        lib = make_dummy_dist(self, (
+            ('requires.txt', ''),
+        ), 'lib', '1.0.0')
+        util = make_dummy_dist(self, (
+            ('requires.txt', 'lib\n[extra]\nutil_extra'),
+        ), 'util', '1.0.0')
+        util_extra = make_dummy_dist(self, (
+            ('requires.txt', ''),
+        ), 'util_extra', '1.0.0')
+        app = make_dummy_dist(self, (
+            ('requires.txt', 'util\nlib>=1.0.0'),
+        ), 'app', '2.0')
+        site = make_dummy_dist(self, (
+            ('requires.txt', 'util[extra]\napp'),
+        ), 'site', '2.0')
+        working_set = pkg_resources.WorkingSet()
+        for dist in (lib, util, util_extra, app, site):
+            working_set.add(dist, self._calmjs_testing_tmpdir)
+
+        pkg_names = ['app', 'site', 'missing', 'lib']
+        expected = [
+            calmjs_dist.find_packages_requirements_dists(
+                [name], working_set=working_set)
+            for name in pkg_names
+        ]
+        self.assertEqual(expected[2], [])
+        self.assertIn(util_extra, expected[1])
+
+        calmjs_dist.resolution_cache.clear()
+        resolved = []
+        resolve = working_set.resolve
+
+        def tracked_resolve(requirements):
+            resolved.append(requirements)
+            return resolve(requirements)
+
+        working_set.resolve = tracked_resolve
+        self.assertEqual(calmjs_dist.map_packages_requirements_dists(
+            pkg_names, working_set=working_set), expected)
+        # resolved only once for all the packages.
+        self.assertEqual(len(resolved), 1)
+
     def test_module_registry_dependencies_failure_no_reg(self):
         self.assertEqual(calmjs_dist.flatten_module_registry_dependencies(
             ['calmjs'], registry_key='calmjs.no_reg',), {})
@@ -700,6 +1022,9 @@ class DistTestCase(unittest.TestCase):
             'service/lib': '/home/src/forms/lib.js',
             'forms/ui': '/home/src/forms/ui.js',
         })
+        # plain dicts, which can be serialized directly.
+        self.assertTrue(isinstance(site, dict))
+        self.assertEqual(json.loads(json.dumps(site)), site)
 
         service = calmjs_dist.flatten_module_registry_dependencies(
             ['service'], registry_key=dummy_regid, working_set=working_set)
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 import unittest
 
+import os
+import sys
 from os.path import abspath
 from os.path import join
 from os.path import pardir
@@ -13,6 +15,8 @@ from calmjs import indexer
 from calmjs.utils import pretty_logging
 
 from calmjs.testing.utils import make_multipath_module3
+from calmjs.testing.utils import make_zipped_module
+from calmjs.testing.utils import mkdtemp
 from calmjs.testing.mocks import StringIO
 
 
@@ -148,3 +152,310 @@ class IndexerTestCase(unittest.TestCase):
             'calmjs/testing/module3/math': join_mod3('math.js'),
             'calmjs/testing/module3/mod/index': join_mod3('mod', 'index.js'),
         })
+
+
+class ResolveModuleTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = mkdtemp(self)
+        self.pkg_dir = join(self.root, 'calmjs_testing_noexec')
+        os.makedirs(join(self.pkg_dir, 'sub'))
+        with open(join(self.pkg_dir, '__init__.py'), 'w') as fd:
+            fd.write('raise RuntimeError("must not be executed")\n')
+        with open(join(self.pkg_dir, 'single.py'), 'w') as fd:
+            fd.write('value = 1\n')
+        with open(join(self.pkg_dir, 'index.js'), 'w') as fd:
+            fd.write('exports.noexec = true;\n')
+
+        def cleanup():
+            sys.path.remove(self.root)
+            sys.path_importer_cache.pop(self.root, None)
+            for name in list(sys.modules):
+                if name.startswith('calmjs_testing_noexec'):
+                    sys.modules.pop(name)
+
+        sys.path.insert(0, self.root)
+        self.addCleanup(cleanup)
+
+    def test_imported(self):
+        self.assertIs(indexer.resolve_module('calmjs.indexer'), indexer)
+
+    def test_not_found(self):
+        with self.assertRaises(ImportError):
+            indexer.resolve_module('calmjs_testing_no_such_module')
+
+    @unittest.skipIf(indexer.find_spec is None, 'requires importlib.util')
+    def test_without_import(self):
+        module = indexer.resolve_module('calmjs_testing_noexec')
+        self.assertNotIn('calmjs_testing_noexec', sys.modules)
+        self.assertEqual(module.__name__, 'calmjs_testing_noexec')
+        self.assertEqual(module.__path__, [self.pkg_dir])
+        self.assertEqual(
+            indexer.modpath_pkg_resources(module), [self.pkg_dir])
+        self.assertEqual(indexer.modpath_zip(module), [self.pkg_dir])
+        self.assertEqual(indexer.mapper_es6(module), {
+            'calmjs_testing_noexec/index': join(self.pkg_dir, 'index.js'),
+        })
+        self.assertNotIn('calmjs_testing_noexec', sys.modules)
+
+    @unittest.skipIf(indexer.find_spec is None, 'requires importlib.util')
+    def test_namespace_stand_in(self):
+        module = ModuleType('calmjs_testing_namespace')
+        module.__spec__ = object()
+        module.__path__ = ['/path/a', '/path/b']
+        self.assertEqual(
+            indexer.modpath_pkg_resources(module), ['/path/b'])
+
+    def test_non_package_imported(self):
+        sys.modules['calmjs_testing_noexec'] = ModuleType(
+            'calmjs_testing_noexec')
+        sys.modules['calmjs_testing_noexec'].__path__ = [self.pkg_dir]
+        module = indexer.resolve_module('calmjs_testing_noexec.single')
+        self.assertIs(
+            module, sys.modules['calmjs_testing_noexec.single'])
+        self.assertEqual(module.value, 1)
+
+
+class MultiExtIndexerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = mkdtemp(self)
+        for path in (
+                ('index.js',),
+                ('index.css',),
+                ('data.json',),
+                ('vendor.min.js',),
+                ('readme.txt',),
+                ('lib', 'util.mjs'),):
+            target = join(self.root, *path)
+            if not os.path.isdir(os.path.dirname(target)):
+                os.makedirs(os.path.dirname(target))
+            with open(target, 'w'):
+                pass
+        self.module = ModuleType('dummy')
+        self.module.__path__ = [self.root]
+
+    def test_single_traversal(self):
+        calls = []
+
+        def globber_counted(root, patt):
+            calls.append(patt)
+            return indexer.globber_recursive(root, patt)
+
+        registry = {
+            'globber': {'counted': globber_counted},
+            'modpath': indexer._utils['modpath'],
+        }
+        results = sorted(
+            (tuple(frags), subpath.replace(sep, '/'), ext)
+            for frags, base, subpath, ext in indexer._modgen_ext(
+                self.module, 'all', 'counted',
+                ('.js', '.mjs', '.css', '.json', '.min.js'),
+                registry=registry,
+            )
+        )
+        self.assertEqual(calls, ['*'])
+        self.assertEqual(results, [
+            (('dummy', 'data'), 'data.json', '.json'),
+            (('dummy', 'index'), 'index.css', '.css'),
+            (('dummy', 'index'), 'index.js', '.js'),
+            (('dummy', 'lib', 'util'), 'lib/util.mjs', '.mjs'),
+            (('dummy', 'vendor'), 'vendor.min.js', '.min.js'),
+        ])
+
+    def test_modgen_single_ext_unchanged(self):
+        results = sorted(
+            subpath for frags, base, subpath in indexer._modgen(
+                self.module, 'all', 'recursive'))
+        self.assertEqual(results, ['index.js', 'vendor.min.js'])
+
+    def test_mapper_fext(self):
+        self.assertEqual(
+            indexer.mapper(self.module, 'all', fext='.css'),
+            {'dummy/index': join(self.root, 'index.css')},
+        )
+
+    def test_mapper_exts(self):
+        results = indexer.mapper_exts(
+            self.module, ('.js', '.css', '.json', '.mjs'),
+            modpath='all', globber='recursive', modname='python',
+        )
+        self.assertEqual(results, {
+            '.js': {
+                'dummy.index': join(self.root, 'index.js'),
+                'dummy.vendor.min': join(self.root, 'vendor.min.js'),
+            },
+            '.css': {'dummy.index': join(self.root, 'index.css')},
+            '.json': {'dummy.data': join(self.root, 'data.json')},
+            '.mjs': {'dummy.lib.util': join(self.root, 'lib', 'util.mjs')},
+        })
+
+
+class ZipIndexerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.module, self.archive = make_zipped_module(self)
+
+    def test_modpath_zip(self):
+        self.assertEqual(indexer.modpath_zip(self.module), [
+            join(self.archive, 'calmjs_testing_zipped')])
+
+    def test_modpath_zip_fallback(self):
+        from calmjs.testing import module1
+        self.assertEqual(
+            indexer.modpath_zip(module1),
+            indexer.modpath_pkg_resources(module1),
+        )
+
+    def test_globber_zip(self):
+        root = join(self.archive, 'calmjs_testing_zipped')
+        self.assertEqual(sorted(indexer.globber_zip(root, '*.js')), [
+            join(root, 'index.js'),
+            join(root, 'util.js'),
+        ])
+        self.assertEqual(
+            list(indexer.globber_zip(join(root, 'missing'), '*.js')), [])
+
+    def test_globber_zip_not_archive(self):
+        self.assertEqual(
+            list(indexer.globber_zip(join(mkdtemp(self), 'x'), '*.js')), [])
+
+    def test_globber_zip_fallback(self):
+        from calmjs.testing import module1
+        root = indexer.modpath_pkg_resources(module1)[0]
+        self.assertEqual(
+            list(indexer.globber_zip(root, '*.js')),
+            list(indexer.globber_root(root, '*.js')),
+        )
+
+    def test_mapper_es6_zipped(self):
+        root = join(self.archive, 'calmjs_testing_zipped')
+        self.assertEqual(indexer.mapper_es6(self.module), {
+            'calmjs_testing_zipped/index': join(root, 'index.js'),
+            'calmjs_testing_zipped/util': join(root, 'util.js'),
+        })
+        self.assertEqual(indexer.mapper_python(self.module), {
+            'calmjs_testing_zipped.index': join(root, 'index.js'),
+            'calmjs_testing_zipped.util': join(root, 'util.js'),
+        })
+
+
+class GlobberScandirTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = mkdtemp(self)
+        for path in (
+                ('index.js',),
+                ('readme.txt',),
+                ('lib', 'util.js'),
+                ('lib', 'nested', 'deep.js'),
+                ('node_modules', 'dep', 'index.js'),
+                ('__pycache__', 'junk.js'),
+                ('tests', 'fixtures', 'fixture.js'),
+                ('tests', 'test_lib.js'),):
+            target = join(self.root, *path)
+            if not os.path.isdir(os.path.dirname(target)):
+                os.makedirs(os.path.dirname(target))
+            with open(target, 'w'):
+                pass
+
+    def glob(self, *a, **kw):
+        return sorted(
+            relpath(p, self.root).replace(sep, '/')
+            for p in indexer.globber_scandir(self.root, '*.js', *a, **kw)
+        )
+
+    def test_registered(self):
+        self.assertIs(
+            indexer._utils['globber']['scandir'], indexer.globber_scandir)
+
+    def test_default_prune(self):
+        self.assertEqual(self.glob(), [
+            'index.js',
+            'lib/nested/deep.js',
+            'lib/util.js',
+            'tests/fixtures/fixture.js',
+            'tests/test_lib.js',
+        ])
+
+    def test_custom_prune(self):
+        self.assertEqual(self.glob(prune=('lib', 'tests')), [
+            '__pycache__/junk.js',
+            'index.js',
+            'node_modules/dep/index.js',
+        ])
+
+    def test_ignore_file(self):
+        with open(join(self.root, indexer.IGNORE_FILE), 'w') as fd:
+            fd.write('# fixtures are not modules\n')
+            fd.write('\n')
+            fd.write('tests/fixtures/\n')
+            fd.write('deep.js\n')
+        self.assertEqual(self.glob(), [
+            'index.js',
+            'lib/util.js',
+            'tests/test_lib.js',
+        ])
+        # ignore file can be disabled.
+        self.assertEqual(len(self.glob(ignore_file=None)), 5)
+
+    def test_record_walked_dirs(self):
+        with indexer.record_walked_dirs() as walked:
+            self.glob()
+            with indexer.record_walked_dirs() as nested:
+                list(indexer.globber_recursive(
+                    join(self.root, 'node_modules'), '*.js'))
+        # directories without matching files are also recorded, but not
+        # the pruned ones.
+        self.assertEqual(sorted(
+            relpath(p, self.root).replace(sep, '/') for p in walked), [
+            '.',
+            indexer.IGNORE_FILE,
+            'lib',
+            'lib/nested',
+            'node_modules',
+            'node_modules/dep',
+            'tests',
+            'tests/fixtures',
+        ])
+        self.assertEqual(len(nested), 2)
+        # nothing is recorded outside of the context.
+        self.assertEqual(len(self.glob()), 5)
+        self.assertEqual(len(walked), 8)
+
+    def test_missing_root(self):
+        self.assertEqual(list(indexer.globber_scandir(
+            join(self.root, 'missing'), '*.js')), [])
+
+    def test_mapper(self):
+        from calmjs.testing import module2
+        calmjs_base_dir = abspath(join(
+            indexer.modpath_pkg_resources(indexer)[0], pardir))
+        results = {
+            k: relpath(v, calmjs_base_dir)
+            for k, v in indexer.mapper(module2, globber='scandir').items()
+        }
+        self.assertEqual(results, {
+            'calmjs/testing/module2/index':
+                to_os_sep_path('calmjs/testing/module2/index.js'),
+            'calmjs/testing/module2/helper':
+                to_os_sep_path('calmjs/testing/module2/helper.js'),
+            'calmjs/testing/module2/mod/helper':
+                to_os_sep_path('calmjs/testing/module2/mod/helper.js'),
+        })
+
+    def test_mapper_globber_kw(self):
+        from calmjs.testing import module2
+        results = indexer.mapper(module2, globber='scandir', globber_kw={
+            'prune': indexer.PRUNE_DIRS + ('mod',)})
+        self.assertEqual(sorted(results), [
+            'calmjs/testing/module2/helper',
+            'calmjs/testing/module2/index',
+        ])
+        results = indexer.mapper_exts(
+            module2, ['.js'], globber='scandir', globber_kw={
+                'prune': ('mod',)})
+        self.assertEqual(sorted(results['.js']), [
+            'calmjs/testing/module2/helper',
+            'calmjs/testing/module2/index',
+        ])
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import unittest
+import json
+import math
+import os
+from collections import OrderedDict
+
+from calmjs import jsonio
+
+from calmjs.testing.mocks import StringIO
+from calmjs.testing.utils import stub_os_environ
+
+package_json = {
+    'name': 'app',
+    'description': 'caf\xe9 \U0001f600 \x7f\x1f "quoted" \\ / \n\t',
+    'dependencies': {
+        'jquery': '~3.1.0',
+        'underscore': '~1.8.3',
+    },
+    'devDependencies': {},
+    'files': [],
+    'private': True,
+    'version': None,
+    'nested': [1, -2, [{'a': [{}]}]],
+}
+
+
+class RecordingBackend(object):
+
+    def __init__(self):
+        self.calls = []
+
+    def loads(self, s):
+        self.calls.append('loads')
+        return json.loads(s)
+
+    def dumps(self, obj, indent=None, sort_keys=False):
+        self.calls.append('dumps')
+        return json.dumps(
+            obj, indent=indent, sort_keys=sort_keys,
+            separators=(',', ': ') if indent else (',', ':'))
+
+
+class JsonioTestCase(unittest.TestCase):
+
+    def setUp(self):
+        stub_os_environ(self)
+        os.environ.pop(jsonio.CALMJS_JSON_BACKEND, None)
+
+    def test_dumps_identical(self):
+        for kw in (
+                {'indent': 4, 'sort_keys': True, 'separators': (',', ': ')},
+                {'indent': 2, 'separators': (',', ': ')},
+                {'indent': 1, 'sort_keys': True, 'separators': (',', ': ')},
+                {'sort_keys': True, 'separators': (',', ':')},
+                {'sort_keys': True},
+                {'indent': 4, 'separators': (', ', ': ')},
+                {'indent': 0, 'separators': (',', ': ')},
+                ):
+            self.assertEqual(
+                jsonio.dumps(package_json, **kw),
+                json.dumps(package_json, **kw),
+            )
+
+    def test_dumps_not_plain(self):
+        # these are passed to the json module.
+        kw = {'indent': 4, 'sort_keys': True, 'separators': (',', ': ')}
+        for obj in (
+                {'version': 1.0, 'big': 1e16, 'small': 1e-07},
+                {2: 'a', 1: 'b'},
+                OrderedDict([('b', 1), ('a', 2)]),
+                {'big': 2 ** 80},
+                ('a', 'b'),
+                ):
+            self.assertEqual(jsonio.dumps(obj, **kw), json.dumps(obj, **kw))
+
+        with self.assertRaises(TypeError):
+            jsonio.dumps({'a': NotImplemented}, separators=(',', ':'))
+
+    def test_dump(self):
+        stream = StringIO()
+        jsonio.dump(package_json, stream, indent=4, sort_keys=True,
+                    separators=(',', ': '))
+        self.assertEqual(stream.getvalue(), json.dumps(
+            package_json, indent=4, sort_keys=True, separators=(',', ': ')))
+
+    def test_loads(self):
+        text = json.dumps(package_json)
+        self.assertEqual(jsonio.loads(text), package_json)
+        self.assertEqual(jsonio.loads(text.encode('utf8')), package_json)
+        self.assertEqual(jsonio.load(StringIO(text)), package_json)
+        # passed to the json module.
+        self.assertTrue(math.isnan(jsonio.loads('{"a": NaN}')['a']))
+        self.assertEqual(jsonio.loads('[%d]' % 2 ** 80), [2 ** 80])
+
+        with self.assertRaises(ValueError) as e:
+            jsonio.loads('{')
+        with self.assertRaises(ValueError) as expected:
+            json.loads('{')
+        self.assertEqual(str(e.exception), str(expected.exception))
+
+        with self.assertRaises(TypeError):
+            jsonio.loads({})
+
+    def test_backend_selection(self):
+        backend = RecordingBackend()
+        original = list(jsonio._default_backend)
+        self.addCleanup(jsonio._default_backend.__setitem__, slice(None),
+                        original)
+        self.addCleanup(jsonio._backends.pop, 'recording')
+        jsonio.register_backend('recording', backend)
+        self.assertIs(jsonio.get_backend(), backend)
+
+        self.assertEqual(jsonio.loads('{}'), {})
+        self.assertEqual(jsonio.dumps({}, separators=(',', ':')), '{}')
+        self.assertEqual(backend.calls, ['loads', 'dumps'])
+
+        os.environ[jsonio.CALMJS_JSON_BACKEND] = 'json'
+        self.assertIsNone(jsonio.get_backend())
+        self.assertEqual(jsonio.loads('{}'), {})
+        self.assertEqual(backend.calls, ['loads', 'dumps'])
+
+        os.environ[jsonio.CALMJS_JSON_BACKEND] = 'recording'
+        self.assertIs(jsonio.get_backend(), backend)
+
+    @unittest.skipIf(jsonio.orjson is None, 'orjson not available')
+    def test_orjson_backend(self):
+        backend = jsonio._backends['orjson']
+        self.assertEqual(
+            backend.dumps(package_json, indent=4, sort_keys=True),
+            json.dumps(package_json, indent=4, sort_keys=True,
+                       separators=(',', ': ')),
+        )
+        self.assertEqual(
+            backend.dumps(package_json, sort_keys=True),
+            json.dumps(package_json, sort_keys=True, separators=(',', ':')),
+        )
+        self.assertEqual(backend.loads('{"a": [1]}'), {'a': [1]})
+        with self.assertRaises(ValueError):
+            backend.loads('{"n": 9999999999999999999999}')
+        with self.assertRaises(ValueError):
+            backend.loads(b'[-9999999999999999999]')
+
+    def test_loads_big_int(self):
+        for text in (
+                '{"n": 9999999999999999999999}',
+                '[-9999999999999999999, 18446744073709551616]',
+                '[%d]' % 2 ** 80):
+            result = jsonio.loads(text)
+            self.assertEqual(result, json.loads(text))
+            self.assertEqual(jsonio.loads(text.encode('utf8')), result)
+            self.assertEqual(
+                jsonio.dumps(result, separators=(',', ':')),
+                json.dumps(result, separators=(',', ':')))
@@ -1,9 +1,17 @@
 # -*- coding: utf-8 -*-
 import unittest
+import json
+import os
+import sys
+import time
+from functools import partial
+from os.path import dirname
+from os.path import join
 from pkg_resources import Distribution
 from pkg_resources import EntryPoint
 
 import calmjs.base
+from calmjs.indexer import mapper
 from calmjs.registry import Registry
 from calmjs.registry import get
 from calmjs.module import ModuleRegistry
@@ -40,6 +48,14 @@ class ModuleRegistryTestCase(unittest.TestCase):
         key = 'calmjs/testing/module1/hello'
         self.assertEqual(sorted(module1.keys()), [key])
 
+    def test_module_registry_load_entry_point_module(self):
+        from calmjs.testing import module1
+        self.assertIs(self.registry._load_entry_point_module(
+            EntryPoint.parse('module1 = calmjs.testing.module1')), module1)
+        with self.assertRaises(ImportError):
+            self.registry._load_entry_point_module(
+                EntryPoint.parse('nothing = calmjs.testing.no_such_module'))
+
     def test_module_registry_pythonic(self):
         registry = PythonicModuleRegistry(__name__)
         with pretty_logging(stream=mocks.StringIO()):
@@ -55,6 +71,294 @@ class ModuleRegistryTestCase(unittest.TestCase):
         key = 'calmjs.testing.module1.hello'
         self.assertEqual(sorted(module1.keys()), [key])
 
+    def test_module_registry_module_files(self):
+        from calmjs.testing import module1
+        dist = utils.make_dummy_dist(self, (
+            ('installed-files.txt', ''),
+            ('calmjs_module_files.json', json.dumps({
+                'calmjs.testing.module1': ['hello.js', 'listed.js', 'x.txt'],
+            })),
+        ), 'calmjs.testing', '1.0')
+        entry_point = EntryPoint.parse(
+            'calmjs.testing.module1 = calmjs.testing.module1', dist=dist)
+        base = dirname(module1.__file__)
+
+        # the listing is used in place of scanning the directory.
+        for registry, sep in (
+                (ModuleRegistry(__name__), '/'),
+                (PythonicModuleRegistry(__name__), '.')):
+            self.assertEqual(registry._map_entry_point_module(
+                entry_point, module1), {'calmjs.testing.module1': {
+                    sep.join(['calmjs', 'testing', 'module1', 'hello']):
+                        join(base, 'hello.js'),
+                    sep.join(['calmjs', 'testing', 'module1', 'listed']):
+                        join(base, 'listed.js'),
+                }})
+
+        # development installs are always scanned.
+        os.remove(join(dist.egg_info, 'installed-files.txt'))
+        self.assertEqual(self.registry._map_entry_point_module(
+            entry_point, module1), {'calmjs.testing.module1': {
+                'calmjs/testing/module1/hello': join(base, 'hello.js'),
+            }})
+
+
+class ModuleRegistryWatchTestCase(unittest.TestCase):
+    """
+    Test the polling of changes for the module registry.
+    """
+
+    def setUp(self):
+        root = utils.mkdtemp(self)
+        self.pkg_dir = join(root, 'calmjs_testing_watched')
+        os.mkdir(self.pkg_dir)
+        for name in ('__init__.py', 'a.js', 'b.js'):
+            with open(join(self.pkg_dir, name), 'w'):
+                pass
+
+        def cleanup():
+            sys.path.remove(root)
+            sys.path_importer_cache.pop(root, None)
+            sys.modules.pop('calmjs_testing_watched', None)
+
+        sys.path.insert(0, root)
+        self.addCleanup(cleanup)
+        working_set = mocks.WorkingSet({'calmjs.module': [
+            'calmjs_testing_watched = calmjs_testing_watched',
+        ]}, dist=Distribution(project_name='calmjs.testing.watched'))
+        self.registry = ModuleRegistry(
+            'calmjs.module', _working_set=working_set, index_cache=None)
+        self.records = self.registry.records['calmjs_testing_watched']
+
+    def touch_dir(self):
+        # ensure the directory mtime is distinct from the baseline.
+        mtime = time.time() + 10
+        os.utime(self.pkg_dir, (mtime, mtime))
+
+    def test_poll(self):
+        events = []
+        self.registry.add_listener(events.append)
+        # the initial poll establish the baseline
+        self.assertEqual(self.registry.poll(), [])
+        self.assertEqual(self.registry.poll(), [])
+
+        with open(join(self.pkg_dir, 'c.js'), 'w'):
+            pass
+        os.remove(join(self.pkg_dir, 'a.js'))
+        self.touch_dir()
+
+        changes = self.registry.poll()
+        self.assertEqual(changes, [(
+            'calmjs_testing_watched',
+            ['calmjs_testing_watched/c'],
+            ['calmjs_testing_watched/a'],
+            [],
+        )])
+        self.assertEqual(events, changes)
+        # replaced, with the previous records left intact.
+        records = self.registry.records['calmjs_testing_watched']
+        self.assertIsNot(self.records, records)
+        self.assertEqual(sorted(self.records), [
+            'calmjs_testing_watched/a',
+            'calmjs_testing_watched/b',
+        ])
+        self.assertEqual(sorted(records), [
+            'calmjs_testing_watched/b',
+            'calmjs_testing_watched/c',
+        ])
+        self.assertEqual(
+            self.registry.find_records_by_prefix('calmjs_testing_watched'),
+            records,
+        )
+        self.assertEqual(
+            self.registry.find_source_owner(join(self.pkg_dir, 'c.js')),
+            ('calmjs_testing_watched/c', 'calmjs_testing_watched',
+             'calmjs.testing.watched'),
+        )
+        self.assertIsNone(
+            self.registry.find_source_owner(join(self.pkg_dir, 'a.js')))
+        self.assertEqual(self.registry.poll(), [])
+
+        self.registry.remove_listener(events.append)
+        for name in ('b.js', 'c.js'):
+            os.remove(join(self.pkg_dir, name))
+        self.touch_dir()
+        changes = self.registry.poll()
+        self.assertEqual(len(events), 1)
+        self.assertEqual(changes[0].removed, [
+            'calmjs_testing_watched/b',
+            'calmjs_testing_watched/c',
+        ])
+        self.assertNotIn('calmjs_testing_watched', self.registry.records)
+        self.assertIsNone(self.registry.find_owner_module(
+            'calmjs_testing_watched/b'))
+        self.assertIsNone(
+            self.registry.find_source_owner(join(self.pkg_dir, 'b.js')))
+        self.assertEqual(self.registry.package_module_map, {
+            'calmjs.testing.watched': ['calmjs_testing_watched']})
+
+    def test_find_source_owner(self):
+        path = join(self.pkg_dir, 'a.js')
+        owner = self.registry.find_source_owner(path)
+        self.assertEqual(owner.module_name, 'calmjs_testing_watched/a')
+        self.assertEqual(owner.python_module_name, 'calmjs_testing_watched')
+        self.assertEqual(owner.project_name, 'calmjs.testing.watched')
+        # relative paths are resolved.
+        utils.remember_cwd(self)
+        os.chdir(self.pkg_dir)
+        self.assertEqual(self.registry.find_source_owner('a.js'), owner)
+        self.assertIsNone(self.registry.find_source_owner('d.js'))
+
+        # rebuilt if the records are replaced.
+        self.registry.records = {'calmjs_testing_watched': {
+            'calmjs_testing_watched/b': join(self.pkg_dir, 'b.js')}}
+        self.assertIsNone(self.registry.find_source_owner(path))
+        self.assertEqual(self.registry.find_source_owner('b.js'), (
+            'calmjs_testing_watched/b', 'calmjs_testing_watched',
+            'calmjs.testing.watched'))
+
+    def test_poll_compact(self):
+        working_set = mocks.WorkingSet({'calmjs.module': [
+            'calmjs_testing_watched = calmjs_testing_watched',
+        ]}, dist=Distribution(project_name='calmjs.testing.watched'))
+        registry = ModuleRegistry(
+            'calmjs.module', _working_set=working_set, index_cache=None,
+            compact=True,
+        )
+        records = registry.records['calmjs_testing_watched']
+        self.assertTrue(isinstance(records, calmjs.base.CompactRecords))
+        self.assertEqual(records, self.records)
+        self.assertEqual(registry.path_table.dirs, [self.pkg_dir + os.sep])
+        self.assertEqual(
+            registry.dump_artifact(), self.registry.dump_artifact())
+
+        registry.poll()
+        with open(join(self.pkg_dir, 'c.js'), 'w'):
+            pass
+        os.remove(join(self.pkg_dir, 'a.js'))
+        self.touch_dir()
+        changes = registry.poll()
+        self.assertEqual(changes[0].added, ['calmjs_testing_watched/c'])
+        self.assertEqual(len(records), 2)
+        records = registry.records['calmjs_testing_watched']
+        self.assertTrue(isinstance(records, calmjs.base.CompactRecords))
+        self.assertEqual(sorted(records.items()), [
+            ('calmjs_testing_watched/b', join(self.pkg_dir, 'b.js')),
+            ('calmjs_testing_watched/c', join(self.pkg_dir, 'c.js')),
+        ])
+        self.assertEqual(registry.get_record('calmjs_testing_watched'), {
+            'calmjs_testing_watched/b': join(self.pkg_dir, 'b.js'),
+            'calmjs_testing_watched/c': join(self.pkg_dir, 'c.js'),
+        })
+
+    def test_poll_import_error(self):
+        self.registry.poll()
+        self.registry._watched[0][0] = EntryPoint.parse(
+            'calmjs_testing_watched = calmjs_testing_watched.missing')
+        self.touch_dir()
+        with pretty_logging(stream=mocks.StringIO()) as s:
+            changes = self.registry.poll()
+        self.assertIn('can no longer be found', s.getvalue())
+        self.assertEqual(changes[0].module_name, 'calmjs_testing_watched')
+        self.assertNotIn('calmjs_testing_watched', self.registry.records)
+
+    def test_poll_shared_module(self):
+        with pretty_logging(stream=mocks.StringIO()):
+            self.registry.register_entry_point(EntryPoint.parse(
+                'calmjs_testing_watched = calmjs_testing_watched'))
+        self.registry.poll()
+        with open(join(self.pkg_dir, 'c.js'), 'w'):
+            pass
+        self.touch_dir()
+        changes = self.registry.poll()
+        # both entry points were stamped with the same directory.
+        self.assertEqual(len(changes), 1)
+        self.assertEqual(changes[0].added, ['calmjs_testing_watched/c'])
+        self.assertEqual(
+            len(self.registry.records['calmjs_testing_watched']), 3)
+
+    def test_poll_recursive_new_subdir_file(self):
+        sub_dir = join(self.pkg_dir, 'sub')
+        os.mkdir(sub_dir)
+        with open(join(sub_dir, 'readme.txt'), 'w'):
+            pass
+
+        class RecursiveModuleRegistry(ModuleRegistry):
+            def _init(self):
+                self.mapper = partial(mapper, globber='recursive')
+
+        registry = RecursiveModuleRegistry(
+            'calmjs.module', _working_set=mocks.WorkingSet({
+                'calmjs.module': [
+                    'calmjs_testing_watched = calmjs_testing_watched',
+                ]}, dist=Distribution(project_name='calmjs.testing.watched')),
+            index_cache=None,
+        )
+        registry.poll()
+        with open(join(sub_dir, 'new.js'), 'w'):
+            pass
+        # only the mtime of the subdirectory that previously contained
+        # no matched files is changed.
+        mtime = time.time() + 10
+        os.utime(sub_dir, (mtime, mtime))
+        changes = registry.poll()
+        self.assertEqual(len(changes), 1)
+        self.assertEqual(
+            changes[0].added, ['calmjs_testing_watched/sub/new'])
+
+    def test_poll_during_iteration(self):
+        self.registry.poll()
+        with open(join(self.pkg_dir, 'c.js'), 'w'):
+            pass
+        self.touch_dir()
+        # the records being iterated are not modified by the poll, as
+        # would happen when it's done by the thread started by watch.
+        keys = []
+        for key in self.registry.get_record('calmjs_testing_watched'):
+            keys.append(key)
+            self.registry.poll()
+        self.assertEqual(keys, [
+            'calmjs_testing_watched/a', 'calmjs_testing_watched/b'])
+        for name, records in self.registry.iter_records():
+            self.registry.records['calmjs_testing_other'] = {}
+        self.assertEqual(sorted(self.registry.get_record(
+            'calmjs_testing_watched')), [
+            'calmjs_testing_watched/a',
+            'calmjs_testing_watched/b',
+            'calmjs_testing_watched/c',
+        ])
+
+    def test_watch(self):
+        events = []
+        self.registry.add_listener(events.append)
+        stop = self.registry.watch(interval=0.01)
+        with open(join(self.pkg_dir, 'c.js'), 'w'):
+            pass
+        self.touch_dir()
+        for i in range(500):
+            if events:
+                break
+            time.sleep(0.01)
+        stop()
+        self.assertEqual(events[0].added, ['calmjs_testing_watched/c'])
+
+    def test_watch_error(self):
+        def broken(change):
+            raise ValueError('broken')
+
+        self.registry.add_listener(broken)
+        with pretty_logging(stream=mocks.StringIO()) as s:
+            stop = self.registry.watch(interval=0.01)
+            with open(join(self.pkg_dir, 'c.js'), 'w'):
+                pass
+            self.touch_dir()
+            for i in range(500):
+                if 'unexpected error' in s.getvalue():
+                    break
+                time.sleep(0.01)
+            stop()
+        self.assertIn('ValueError: broken', s.getvalue())
+
 
 class IntegratedModuleRegistryTestCase(unittest.TestCase):
     """
@@ -107,6 +411,26 @@ class IntegratedModuleRegistryTestCase(unittest.TestCase):
         module1 = registry.get_record('calmjs.testing.module1')
         self.assertIn('calmjs/testing/module1/hello', module1)
 
+        self.assertEqual(
+            sorted(registry.find_records_by_prefix('calmjs/testing/module2')),
+            ['calmjs/testing/module2/helper', 'calmjs/testing/module2/index'],
+        )
+        self.assertEqual(
+            registry.find_records_by_prefix('calmjs/testing/module1'),
+            module1,
+        )
+        self.assertEqual(
+            registry.find_owner_module('calmjs/testing/module3/math'),
+            'calmjs.testing.module3',
+        )
+        self.assertIsNone(registry.find_owner_module('calmjs/testing'))
+
+        digests = registry.get_record_digests('calmjs.testing.module1')
+        self.assertEqual(list(digests), ['calmjs/testing/module1/hello'])
+        self.assertEqual(sorted(digests['calmjs/testing/module1/hello']), [
+            'mtime', 'sha256', 'size'])
+        self.assertEqual(registry.get_record_digests('no.such.module'), {})
+
 
 class ExtraJsonKeysRegistryTestCase(unittest.TestCase):
 
@@ -1,11 +1,22 @@
 # -*- coding: utf-8 -*-
 import unittest
+import json
+import os
+from os.path import exists
+
+from pkg_resources import Distribution
+from pkg_resources import EntryPoint
+from pkg_resources import WorkingSet
 
 import calmjs.registry
 from calmjs.base import BaseRegistry
+from calmjs.cache import CALMJS_CACHE_DIR
 from calmjs.utils import pretty_logging
 
 from calmjs.testing import mocks
+from calmjs.testing.utils import mkdtemp
+from calmjs.testing.utils import stub_os_environ
+from calmjs.testing.utils import stub_stdouts
 
 
 class RegistryIntegrationTestCase(unittest.TestCase):
@@ -65,3 +76,138 @@ class RegistryIntegrationTestCase(unittest.TestCase):
         from calmjs.testing.module3.module import CustomModuleRegistry
         self.assertTrue(isinstance(
             registry.get_record('custom'), CustomModuleRegistry))
+
+
+class RegistryWorkingSetTestCase(unittest.TestCase):
+    """
+    Test that the registry of registries follow the working set.
+    """
+
+    def make_dist(self, version, entry_points):
+        return Distribution(
+            project_name='registries', version=version,
+            metadata=mocks.MockProvider({
+                'entry_points.txt': '[calmjs.registry]\n%s\n' % (
+                    '\n'.join(entry_points)),
+            }),
+        )
+
+    def test_working_set_updates(self):
+        working_set = WorkingSet([])
+        registry = calmjs.registry.Registry(
+            'calmjs.registry', _working_set=working_set)
+        registry.records['calmjs.registry'] = registry
+        self.assertIsNone(registry.get_record('custom'))
+
+        working_set.add(self.make_dist('1.0', [
+            'custom = calmjs.testing.module3.module:CustomModuleRegistry',
+            'calmjs.registry = calmjs.registry:Registry',
+        ]), 'registries')
+        custom = registry.get_record('custom')
+        self.assertIsNotNone(custom)
+        # the new version provides new entry points, so the registry
+        # will be constructed again, except for the self-hosted one.
+        working_set.add(self.make_dist('1.1', [
+            'custom = calmjs.testing.module3.module:CustomModuleRegistry',
+        ]), 'registries', replace=True)
+        self.assertIsNot(custom, registry.get_record('custom'))
+        self.assertIs(registry, registry.get_record('calmjs.registry'))
+
+        working_set.add(self.make_dist('1.2', []), 'registries', replace=True)
+        self.assertNotIn('custom', registry.records)
+        self.assertIsNone(registry.get_record('custom'))
+
+
+class RegistryArtifactTestCase(unittest.TestCase):
+    """
+    Test the production and usage of prebuilt registry artifacts.
+    """
+
+    def setUp(self):
+        stub_os_environ(self)
+        os.environ[CALMJS_CACHE_DIR] = mkdtemp(self)
+
+    def test_dump_load_artifact(self):
+        registry = calmjs.registry.Registry('calmjs.registry')
+        path = registry.write_artifact('calmjs.module.pythonic')
+        self.assertTrue(exists(path))
+        original = registry.get_record('calmjs.module.pythonic')
+
+        fresh = calmjs.registry.Registry('calmjs.registry')
+        with pretty_logging(stream=mocks.StringIO()) as s:
+            loaded = fresh.get_record('calmjs.module.pythonic')
+        self.assertIn('using artifact', s.getvalue())
+        self.assertEqual(loaded.records, original.records)
+        self.assertEqual(
+            loaded.package_module_map, original.package_module_map)
+
+        # a different working set will render the artifact stale.
+        with open(path) as fd:
+            artifact = json.load(fd)
+        artifact['working_set'] = 'other'
+        with open(path, 'w') as fd:
+            json.dump(artifact, fd)
+        fresh = calmjs.registry.Registry('calmjs.registry')
+        with pretty_logging(stream=mocks.StringIO()) as s:
+            loaded = fresh.get_record('calmjs.module.pythonic')
+        self.assertIn('is stale', s.getvalue())
+        self.assertEqual(loaded.records, original.records)
+
+        # malformed artifacts are ignored.
+        with open(path, 'w') as fd:
+            json.dump([], fd)
+        fresh = calmjs.registry.Registry('calmjs.registry')
+        with pretty_logging(stream=mocks.StringIO()) as s:
+            loaded = fresh.get_record('calmjs.module.pythonic')
+        self.assertNotIn('artifact', s.getvalue())
+
+        self.assertEqual(registry.remove_artifact(
+            'calmjs.module.pythonic'), path)
+        self.assertFalse(exists(path))
+        self.assertIsNone(registry.remove_artifact('calmjs.module.pythonic'))
+
+    def test_dump_artifact_failures(self):
+        working_set = mocks.WorkingSet({'calmjs.registry': [
+            'calmjs.registry = calmjs.registry:Registry',
+            'dummy = calmjs.testing.module3.module:CustomModuleRegistry',
+        ]})
+        registry = calmjs.registry.Registry(
+            'calmjs.registry', _working_set=working_set)
+        with self.assertRaises(ValueError) as e:
+            registry.write_artifact('calmjs.registry')
+        self.assertIn('does not support artifacts', str(e.exception))
+        with self.assertRaises(ValueError) as e:
+            registry.write_artifact('no_such_registry')
+        self.assertIn('not found', str(e.exception))
+
+        dummy = registry.get_record('dummy')
+        entry_point = EntryPoint.parse('bad = bad')
+        dummy.raw_entry_points.append(entry_point)
+        dummy._watched.append([entry_point, ['bad'], [], {}])
+        dummy.records['bad'] = {'bad': object()}
+        with self.assertRaises(ValueError) as e:
+            registry.write_artifact('dummy')
+        self.assertIn('cannot be serialized', str(e.exception))
+
+        os.environ.pop(CALMJS_CACHE_DIR)
+        with self.assertRaises(ValueError) as e:
+            registry.write_artifact('dummy')
+        self.assertIn('caching must be enabled', str(e.exception))
+        self.assertIsNone(registry.remove_artifact('dummy'))
+        self.assertIsNone(registry._read_artifact('dummy', None))
+
+    def test_registry_runtime(self):
+        stub_stdouts(self)
+        rt = calmjs.registry.runtime
+        with pretty_logging(stream=mocks.StringIO()) as s:
+            self.assertTrue(rt(['-v', 'calmjs.module.pythonic']))
+        self.assertIn('wrote artifact', s.getvalue())
+        with pretty_logging(stream=mocks.StringIO()) as s:
+            self.assertTrue(rt([
+                '-v', '--remove', 'calmjs.module.pythonic',
+                'calmjs.module.pythonic',
+            ]))
+        self.assertEqual(1, s.getvalue().count('removed artifact'))
+        with pretty_logging(stream=mocks.StringIO()) as s:
+            self.assertFalse(rt(['--dump', 'calmjs.extras_keys']))
+        self.assertIn('does not support artifacts', s.getvalue())
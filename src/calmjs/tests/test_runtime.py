@@ -4,6 +4,7 @@ import json
 import os
 import sys
 from argparse import ArgumentParser
+from os.path import exists
 from os.path import join
 from logging import DEBUG
 
@@ -447,6 +448,45 @@ class RuntimeIntegrationTestCase(unittest.TestCase):
         self.assertEqual(result['dependencies']['jquery'], '~3.1.0')
         self.assertEqual(result['dependencies']['underscore'], '~1.8.3')
 
+    def test_npm_view_batch(self):
+        stub_stdouts(self)
+        rt = self.setup_runtime()
+        rt(['foo', '--view', '--batch', 'example.package1',
+            'example.package3'])
+        results = [
+            json.loads(line) for line in sys.stdout.getvalue().splitlines()]
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0]['dependencies'], {
+            'jquery': '~3.1.0',
+        })
+        self.assertEqual(results[1]['dependencies'], {
+            'jquery': '~3.1.0',
+            'underscore': '~1.8.3',
+            'backbone': '~1.3.2',
+        })
+
+    def test_npm_batch_view_only(self):
+        remember_cwd(self)
+        tmpdir = mkdtemp(self)
+        os.chdir(tmpdir)
+        stub_stdouts(self)
+        rt = self.setup_runtime()
+        self.assertFalse(
+            rt(['foo', '--init', '--batch', 'example.package1']))
+        self.assertIn(
+            'ValueError: --batch may only be used with --view',
+            sys.stderr.getvalue())
+        self.assertFalse(exists(join(tmpdir, 'package.json')))
+
+        # the default action is view.
+        rt(['foo', '-B', 'example.package1', 'example.package3'])
+        self.assertEqual(len(sys.stdout.getvalue().splitlines()), 2)
+
+        # not offered through the setuptools command.
+        from calmjs.npm import npm
+        self.assertNotIn(
+            'batch', [option[0] for option in npm.user_options])
+
     def test_npm_view_dependencies(self):
         stub_stdouts(self)
         rt = self.setup_runtime()
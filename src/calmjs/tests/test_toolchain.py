@@ -16,6 +16,7 @@ from calmjs.toolchain import Toolchain
 from calmjs.toolchain import NullToolchain
 
 from calmjs.testing.mocks import StringIO
+from calmjs.testing.utils import make_zipped_module
 from calmjs.testing.utils import mkdtemp
 from calmjs.testing.utils import fake_error
 
@@ -249,6 +250,19 @@ class NullToolchainTestCase(unittest.TestCase):
 
         self.assertEqual(js_code, result)
 
+    def test_null_transpiler_zipped_source(self):
+        module, archive = make_zipped_module(self)
+        source = join(archive, 'calmjs_testing_zipped', 'index.js')
+        target = join(mkdtemp(self), 'target.js')
+
+        spec = Spec()
+        self.toolchain.compile(spec, source, target)
+
+        with open(target) as fd:
+            result = fd.read()
+
+        self.assertEqual('exports.zipped = true;\n', result)
+
     def test_null_toolchain_transpile_sources(self):
         source_dir = mkdtemp(self)
         build_dir = mkdtemp(self)
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from calmjs.trie import NameTrie
+from calmjs.trie import split_name
+
+
+class SplitNameTestCase(unittest.TestCase):
+
+    def test_split_name(self):
+        self.assertEqual(split_name('calmjs/testing/module1'), [
+            'calmjs', 'testing', 'module1'])
+        self.assertEqual(split_name('calmjs.testing.module1'), [
+            'calmjs', 'testing', 'module1'])
+        self.assertEqual(split_name('/calmjs//testing/'), [
+            'calmjs', 'testing'])
+        self.assertEqual(split_name(''), [])
+
+
+class NameTrieTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.trie = NameTrie()
+        self.trie.add('calmjs/testing/module1/hello', 1)
+        self.trie.add('calmjs/testing/module2/index', 2)
+        self.trie.add('calmjs/testing/module2/mod/helper', 3)
+        self.trie.add('calmjs.testing.module2', 'py')
+        self.trie.add('calmjs/testingx', 4)
+
+    def test_get(self):
+        self.assertEqual(self.trie.get('calmjs/testing/module2/index'), 2)
+        self.assertEqual(self.trie.get('calmjs.testing.module2'), 'py')
+        self.assertIsNone(self.trie.get('calmjs/testing/module2'))
+        self.assertIsNone(self.trie.get('calmjs/missing'))
+        self.assertEqual(len(self.trie), 5)
+
+    def test_iter_prefix(self):
+        self.assertEqual(list(self.trie.iter_prefix('calmjs/testing')), [
+            ('calmjs/testing/module1/hello', 1),
+            ('calmjs.testing.module2', 'py'),
+            ('calmjs/testing/module2/index', 2),
+            ('calmjs/testing/module2/mod/helper', 3),
+        ])
+        self.assertEqual(list(self.trie.iter_prefix('calmjs.testing.mod')), [])
+        self.assertEqual(list(self.trie.iter_prefix('nothing')), [])
+
+    def test_longest_match(self):
+        self.assertEqual(
+            self.trie.longest_match('calmjs/testing/module2/mod/other'),
+            ('calmjs.testing.module2', 'py'),
+        )
+        self.assertEqual(
+            self.trie.longest_match('calmjs/testing/module2/mod/helper/x'),
+            ('calmjs/testing/module2/mod/helper', 3),
+        )
+        self.assertIsNone(self.trie.longest_match('calmjs/testing/other'))
+        self.assertIsNone(self.trie.longest_match('other'))
+
+    def test_remove(self):
+        self.assertFalse(self.trie.remove('calmjs/testing/module3'))
+        self.assertFalse(self.trie.remove('calmjs/testing'))
+        self.assertTrue(self.trie.remove('calmjs/testing/module2/mod/helper'))
+        self.assertNotIn('mod', self.trie._find(
+            split_name('calmjs/testing/module2')).children)
+        self.assertTrue(self.trie.remove('calmjs/testing/module1/hello'))
+        self.assertNotIn('module1', self.trie._find(
+            split_name('calmjs/testing')).children)
+        # the node for module2 is still in use.
+        self.assertTrue(self.trie.remove('calmjs.testing.module2'))
+        self.assertEqual(self.trie.get('calmjs/testing/module2/index'), 2)
+        self.assertEqual(len(self.trie), 2)
@@ -7,14 +7,19 @@ import os
 from os.path import join
 from os.path import pathsep
 import sys
+import threading
 
 from calmjs.utils import which
+from calmjs.utils import concurrent_map
 from calmjs.utils import enable_pretty_logging
 from calmjs.utils import finalize_env
 from calmjs.utils import fork_exec
 from calmjs.utils import pretty_logging
+from calmjs.utils import open_zip_member
 from calmjs.utils import raise_os_error
+from calmjs.utils import split_zip_path
 
+from calmjs.testing.utils import make_zipped_module
 from calmjs.testing.utils import mkdtemp
 from calmjs.testing.utils import stub_os_environ
 
@@ -125,6 +130,71 @@ class WhichTestCase(unittest.TestCase):
             raise_os_error(errno.ENOTDIR)
 
 
+class ZipPathTestCase(unittest.TestCase):
+
+    def test_split_zip_path(self):
+        module, archive = make_zipped_module(self)
+        self.assertEqual(
+            split_zip_path(join(archive, 'calmjs_testing_zipped', 'x.js')),
+            (archive, 'calmjs_testing_zipped/x.js'),
+        )
+        self.assertIsNone(split_zip_path(archive))
+        self.assertIsNone(split_zip_path(os.path.dirname(archive)))
+
+    def test_split_zip_path_not_archive(self):
+        tmpdir = mkdtemp(self)
+        target = join(tmpdir, 'file')
+        with open(target, 'w'):
+            pass
+        self.assertIsNone(split_zip_path(join(target, 'inner')))
+        self.assertIsNone(split_zip_path(join(tmpdir, 'missing')))
+
+    def test_open_zip_member(self):
+        module, archive = make_zipped_module(self)
+        with open_zip_member(
+                join(archive, 'calmjs_testing_zipped', 'index.js')) as fd:
+            self.assertEqual(fd.read(), 'exports.zipped = true;\n')
+
+        with self.assertRaises(OSError):
+            open_zip_member(join(archive, 'calmjs_testing_zipped', 'no.js'))
+        with self.assertRaises(OSError):
+            open_zip_member(join(mkdtemp(self), 'no.js'))
+
+
+class ConcurrentMapTestCase(unittest.TestCase):
+
+    def test_serial(self):
+        threads = set()
+
+        def f(i):
+            threads.add(threading.current_thread())
+            return i * 2
+
+        self.assertEqual(concurrent_map(f, iter([1, 2, 3])), [2, 4, 6])
+        self.assertEqual(concurrent_map(f, [1, 2, 3], workers=1), [2, 4, 6])
+        self.assertEqual(concurrent_map(f, [4], workers=4), [8])
+        self.assertEqual(threads, {threading.current_thread()})
+
+    def test_concurrent_ordered(self):
+        threads = set()
+
+        def f(i):
+            threads.add(threading.current_thread())
+            return i * 2
+
+        items = list(range(20))
+        self.assertEqual(
+            concurrent_map(f, items, workers=4), [i * 2 for i in items])
+        self.assertNotIn(threading.current_thread(), threads)
+
+    def test_concurrent_error(self):
+        def f(i):
+            raise ValueError(i)
+
+        with self.assertRaises(ValueError):
+            concurrent_map(f, [1, 2], workers=2)
+
+
 class LoggingTestCase(unittest.TestCase):
     """
     Pretty logging can be pretty.
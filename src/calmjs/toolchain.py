@@ -46,12 +46,16 @@ from os.path import realpath
 from tempfile import mkdtemp
 
 from calmjs.base import BaseDriver
+from calmjs.utils import open_zip_member
 from calmjs.utils import raise_os_error
 
 logger = logging.getLogger(__name__)
 
 
 def _opener(*a):
+    if a[1:2] == ('r',) and not exists(a[0]):
+        # may be a virtual path into a zip archive.
+        return open_zip_member(a[0], encoding='utf-8')
     return codecs.open(*a, encoding='utf-8')
 
 
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+A simple trie for module names.
+
+Module names within the calmjs framework may be expressed in either the
+ES6 style (``calmjs/testing/module1``) or the Pythonic style
+(``calmjs.testing.module1``); the trie here treats both ``/`` and ``.``
+as separators between the name fragments, such that lookups by prefix
+or by the longest matching name can be done without scanning through
+every name.
+"""
+
+from __future__ import absolute_import
+
+import re
+
+_separators = re.compile('[/.]')
+
+
+def split_name(name):
+    """
+    Split the name into its fragments.
+    """
+
+    return [frag for frag in _separators.split(name) if frag]
+
+
+class _Node(object):
+
+    __slots__ = ('children', 'values')
+
+    def __init__(self):
+        self.children = {}
+        # mapping of the full names ending at this node to their values
+        self.values = {}
+
+
+class NameTrie(object):
+    """
+    Map names to values, indexed by the fragments of the names.
+    """
+
+    def __init__(self):
+        self.root = _Node()
+
+    def __len__(self):
+        return sum(1 for item in self.iter_prefix(''))
+
+    def _find(self, frags):
+        node = self.root
+        for frag in frags:
+            node = node.children.get(frag)
+            if node is None:
+                return None
+        return node
+
+    def add(self, name, value):
+        node = self.root
+        for frag in split_name(name):
+            node = node.children.setdefault(frag, _Node())
+        node.values[name] = value
+
+    def remove(self, name):
+        """
+        Remove the name.  Returns True if it was found.
+        """
+
+        frags = split_name(name)
+        path = [self.root]
+        for frag in frags:
+            node = path[-1].children.get(frag)
+            if node is None:
+                return False
+            path.append(node)
+
+        if path[-1].values.pop(name, _Node) is _Node:
+            return False
+
+        # prune the nodes that are no longer needed.
+        for frag, parent, node in reversed(list(zip(frags, path, path[1:]))):
+            if node.values or node.children:
+                break
+            del parent.children[frag]
+        return True
+
+    def get(self, name, default=None):
+        node = self._find(split_name(name))
+        if node is None:
+            return default
+        return node.values.get(name, default)
+
+    def iter_prefix(self, prefix):
+        """
+        Yield the 2-tuples of name and value for every name that have
+        the fragments of prefix as its leading fragments.
+        """
+
+        node = self._find(split_name(prefix))
+        if node is None:
+            return
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            for item in sorted(node.values.items()):
+                yield item
+            stack.extend(
+                node.children[frag]
+                for frag in sorted(node.children, reverse=True)
+            )
+
+    def longest_match(self, name):
+        """
+        Return the 2-tuple of name and value for the name with the most
+        fragments that are the leading fragments of the provided name,
+        or None if nothing matches.
+        """
+
+        node = self.root
+        result = None
+        for frag in split_name(name):
+            node = node.children.get(frag)
+            if node is None:
+                break
+            if node.values:
+                result = node
+        if result is None:
+            return None
+        return sorted(result.values.items())[0]
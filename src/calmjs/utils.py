@@ -6,16 +6,24 @@ Assortment of utility functions.
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+import errno
+import io
 import logging
 import os
 import sys
+import zipfile
 from contextlib import contextmanager
 from locale import getpreferredencoding
+from multiprocessing.pool import ThreadPool
 from os import strerror
 from os.path import curdir
 from os.path import defpath
+from os.path import dirname
+from os.path import isfile
 from os.path import normcase
 from os.path import pathsep
+from os.path import relpath
+from os.path import sep
 from pdb import post_mortem
 from subprocess import Popen
 from subprocess import PIPE
@@ -97,6 +105,68 @@ def fork_exec(args, stdin='', **kwargs):
     return (stdout.decode(locale), stderr.decode(locale))
 
 
+def concurrent_map(f, items, workers=None):
+    """
+    Return the list of results from applying f to every item in items,
+    in the same order.  If workers is greater than one, f will be
+    applied using a pool of at most that many threads.
+    """
+
+    items = list(items)
+    if not workers or workers < 2 or len(items) < 2:
+        return [f(item) for item in items]
+
+    pool = ThreadPool(min(workers, len(items)))
+    try:
+        return pool.map(f, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def split_zip_path(path):
+    """
+    For a virtual path that points into a zip archive, such as the ones
+    produced for modules imported from a zipped egg, return a 2-tuple
+    of the path to the archive and the name of the member within it.
+    Returns None if the path does not lead into a zip archive.
+    """
+
+    archive = path
+    while True:
+        if isfile(archive):
+            break
+        parent = dirname(archive)
+        if parent == archive:
+            return None
+        archive = parent
+
+    if archive == path or not zipfile.is_zipfile(archive):
+        return None
+    return archive, relpath(path, archive).replace(sep, '/')
+
+
+def open_zip_member(path, encoding='utf-8'):
+    """
+    Open the member of the zip archive at the virtual path for reading
+    as text, without extracting the archive.
+    """
+
+    split = split_zip_path(path)
+    if split is None:
+        raise_os_error(errno.ENOENT)
+    archive, member = split
+    zf = zipfile.ZipFile(archive)
+    try:
+        stream = zf.open(member)
+    except KeyError:
+        raise_os_error(errno.ENOENT)
+    finally:
+        # the opened member remains readable.
+        zf.close()
+    return io.TextIOWrapper(stream, encoding=encoding)
+
+
 def raise_os_error(_errno):
     """
     Helper for raising the correct exception under Python 3 while still